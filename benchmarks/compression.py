@@ -0,0 +1,94 @@
+"""CPU cost of compressing responses at each compression level.
+
+This compresses a JSON body with
+:func:`morepath.compress.compress_response`, as the compression tween
+does, at each level from 1 to 9. The body is compressed once in
+memory, and once streamed in chunks of 8 KB, which are flushed one by
+one. It reports the CPU time per MB of uncompressed body and the
+compression ratio.
+
+Usage::
+
+  $ python benchmarks/compression.py [megabytes]
+
+The body is 8 MB by default.
+"""
+
+from __future__ import print_function
+
+import json
+import sys
+import time
+
+import dectate
+import morepath
+from morepath.compress import compress_response
+from webob import BaseRequest, Response
+
+
+CHUNK_SIZE = 8 * 1024
+
+# time.clock is the CPU time of the process on Python 2
+process_time = getattr(time, 'process_time', getattr(time, 'clock', None))
+
+
+def json_body(megabytes):
+    rows = []
+    size = 0
+    i = 0
+    while size < megabytes * 1024 * 1024:
+        row = json.dumps({'id': i, 'name': 'Record %d' % i,
+                          'email': 'user%d@example.com' % i,
+                          'active': i % 3 != 0, 'score': i * 0.25})
+        rows.append(row)
+        size += len(row) + 1
+        i += 1
+    return ('[' + ','.join(rows) + ']').encode('ascii')
+
+
+def compression_settings(level):
+    class App(morepath.App):
+        pass
+
+    @App.setting_section(section='compression')
+    def get_compression_settings():
+        return {'enabled': True, 'level': level, 'min_size': 0}
+
+    dectate.commit(App)
+    return App().settings.compression
+
+
+def compress(body, settings, streamed):
+    request = BaseRequest.blank('/', headers={'Accept-Encoding': 'gzip'})
+    if streamed:
+        app_iter = (body[i:i + CHUNK_SIZE]
+                    for i in range(0, len(body), CHUNK_SIZE))
+    else:
+        app_iter = [body]
+    response = Response(content_type='application/json', app_iter=app_iter)
+    start = process_time()
+    compress_response(request, response, settings)
+    size = sum(len(chunk) for chunk in response.app_iter)
+    return process_time() - start, size
+
+
+def main():
+    megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 8
+    body = json_body(megabytes)
+    mb = len(body) / (1024.0 * 1024.0)
+    print('%.1f MB of JSON' % mb)
+    print('%-5s %14s %7s %14s %7s' % (
+        'level', 'in memory', 'ratio', 'streamed', 'ratio'))
+    for level in range(1, 10):
+        settings = compression_settings(level)
+        columns = []
+        for streamed in [False, True]:
+            cpu, size = min(compress(body, settings, streamed)
+                            for i in range(3))
+            columns.append('%8.1f ms/MB %6.1f%%' % (
+                cpu * 1000 / mb, 100.0 * size / len(body)))
+        print('%-5d %s %s' % (level, columns[0], columns[1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Compare the JSON backends on representative payloads.
+
+For each backend that is installed, this times ``dumps`` and
+``loads`` of the backend itself, and serving the payload with a JSON
+view through the app, both as a whole and streamed from an iterator
+of items. See :mod:`morepath.jsonbackend`.
+
+Usage::
+
+  $ python benchmarks/json_backends.py [repeat]
+"""
+
+from __future__ import print_function
+
+import sys
+import timeit
+
+import dectate
+import morepath
+from morepath.error import ConfigError
+from morepath.jsonbackend import backend_factories, get_json_backend
+from webob import BaseRequest
+
+
+def records(amount):
+    """Rows as a database would give them."""
+    return [{
+        'id': i,
+        'name': u'Record %d' % i,
+        'email': u'user%d@example.com' % i,
+        'active': i % 3 != 0,
+        'score': i * 0.25,
+        'tags': [u'alpha', u'beta', u'gamma'][:i % 4],
+        'parent': None if i % 10 == 0 else i // 10,
+    } for i in range(amount)]
+
+
+def document():
+    """A nested document with mostly text, not all of it ASCII."""
+    return {
+        'title': u'Caf\u00e9 r\u00e9sum\u00e9',
+        'sections': [{
+            'heading': u'Section %d' % i,
+            'paragraphs': [u'\u00dcber %d ' % j * 40 for j in range(10)],
+            'meta': {'words': 400, 'draft': False},
+        } for i in range(100)],
+    }
+
+
+def numbers(amount):
+    return [i * 1.5 for i in range(amount)]
+
+
+PAYLOADS = [
+    ('records', records(10000)),
+    ('document', document()),
+    ('numbers', numbers(100000)),
+]
+
+
+def create_app(backend, payload):
+    class App(morepath.App):
+        pass
+
+    @App.path(path='')
+    class Root(object):
+        pass
+
+    @App.json(model=Root)
+    def root_default(self, request):
+        return payload
+
+    @App.json(model=Root, name='stream')
+    def root_stream(self, request):
+        return iter(payload)
+
+    @App.setting_section(section='json')
+    def get_json_settings():
+        return {'backend': backend}
+
+    dectate.commit(App)
+    return App()
+
+
+def get(app, path):
+    response = app.publish(app.request(BaseRequest.blank(path).environ))
+    return b''.join(response.app_iter)
+
+
+def best(func, repeat):
+    """Best time of a call to func in milliseconds."""
+    return min(timeit.repeat(func, number=1, repeat=repeat)) * 1000
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    backends = []
+    for name in sorted(backend_factories):
+        try:
+            backends.append((name, get_json_backend(name)))
+        except ConfigError:
+            print('%s is not installed' % name)
+    print('%-9s %-8s %9s %9s %9s %9s %10s' % (
+        'payload', 'backend', 'size', 'dumps', 'loads', 'view',
+        'streamed'))
+    for payload_name, payload in PAYLOADS:
+        for name, backend in backends:
+            data = backend.dumps(payload)
+            app = create_app(name, payload)
+            timings = [
+                best(lambda: backend.dumps(payload), repeat),
+                best(lambda: backend.loads(data), repeat),
+                best(lambda: get(app, '/'), repeat),
+            ]
+            if isinstance(payload, list):
+                timings.append(best(lambda: get(app, '/stream'), repeat))
+                streamed = '%7.1f ms' % timings[3]
+            else:
+                streamed = '%10s' % '-'
+            print('%-9s %-8s %6.0f KB %6.1f ms %6.1f ms %6.1f ms %s' % (
+                payload_name, name, len(data) / 1024.0, timings[0],
+                timings[1], timings[2], streamed))
+
+
+if __name__ == '__main__':
+    main()
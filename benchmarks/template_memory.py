@@ -0,0 +1,119 @@
+"""Peak memory of serving a large page rendered with a template.
+
+A template engine renders a table of rows chunk by chunk. The page is
+served once with the chunks passed to ``original_render``, so that
+the response is streamed, and once joined into a single string first,
+as with an engine that cannot stream. Each way runs in a process of
+its own, as the peak resident set size of a process only grows.
+
+Usage::
+
+  $ python benchmarks/template_memory.py [megabytes]
+
+The page is 50 MB by default.
+"""
+
+from __future__ import print_function
+
+import resource
+import subprocess
+import sys
+import time
+
+import dectate
+import morepath
+from webob import BaseRequest
+
+
+ROW = u'<tr><td>%08d</td><td>\u20ac %s</td></tr>\n'
+ROW_SIZE = len((ROW % (0, u'x' * 40)).encode('utf-8'))
+
+
+class RowsTemplate(object):
+    def generate(self, rows):
+        yield u'<table>\n'
+        for i in range(rows):
+            yield ROW % (i, u'x' * 40)
+        yield u'</table>\n'
+
+    def render(self, rows):
+        return u''.join(self.generate(rows))
+
+
+def create_app(stream):
+    class App(morepath.App):
+        pass
+
+    @App.path(path='')
+    class Report(object):
+        pass
+
+    @App.template_loader(extension='.rows')
+    def get_template_loader(template_directories, settings):
+        return {'report.rows': RowsTemplate()}
+
+    @App.template_render(extension='.rows')
+    def get_rows_render(loader, name, original_render):
+        template = loader[name]
+
+        def render(content, request):
+            if stream:
+                return original_render(template.generate(**content),
+                                       request)
+            return original_render(template.render(**content), request)
+        return render
+
+    @App.html(model=Report, template='report.rows')
+    def report_default(self, request):
+        return {'rows': int(request.GET['rows'])}
+
+    dectate.commit(App)
+    return App()
+
+
+def max_rss():
+    """Peak resident set size of this process in MB."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / (1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0)
+
+
+def serve(mode, megabytes):
+    app = create_app(mode == 'stream')
+    rows = int(megabytes * 1024 * 1024 / ROW_SIZE)
+    environ = BaseRequest.blank('/?rows=%d' % rows).environ
+    before = max_rss()
+    start = time.time()
+    first_byte = None
+    size = 0
+    app_iter = app(environ, lambda status, headers, exc_info=None: None)
+    try:
+        for chunk in app_iter:
+            if first_byte is None and chunk:
+                first_byte = time.time() - start
+            size += len(chunk)
+    finally:
+        close = getattr(app_iter, 'close', None)
+        if close is not None:
+            close()
+    total = time.time() - start
+    print('%-6s %8.1f MB %10.1f MB %10.1f MB %8.3f s %8.3f s' % (
+        mode, size / (1024.0 * 1024.0), max_rss(), max_rss() - before,
+        first_byte, total))
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == '--serve':
+        serve(sys.argv[2], float(sys.argv[3]))
+        return
+    megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 50
+    print('%-6s %11s %13s %13s %10s %10s' % (
+        'mode', 'body', 'peak RSS', 'growth', 'first byte', 'total'))
+    sys.stdout.flush()
+    for mode in ['stream', 'join']:
+        subprocess.check_call([sys.executable, __file__, '--serve', mode,
+                               str(megabytes)])
+
+
+if __name__ == '__main__':
+    main()
@@ -21,8 +21,9 @@ from .core import (excview_tween_factory as EXCVIEW,
 from .core import body_model_predicate as LAST_VIEW_PREDICATE
 from . import directive  # register directive methods
 from .generic import remember_identity, forget_identity, settings
-from .view import render_json, render_html
+from .view import render_json, render_html, render_binary
 from .request import Request, Response
+from .static import FileResponse, AssetApp
 from .view import redirect
 from .autosetup import scan, autoscan, autosetup
 from .security import Identity, IdentityPolicy, NO_IDENTITY
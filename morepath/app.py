@@ -20,6 +20,8 @@ import dectate
 from reg import CachingKeyLookup, Registry
 
 from .request import Request
+from .cache import ResponseCache, SharedResponseCache, SingleFlight
+from .jsonbackend import get_json_backend
 from . import compat
 from .implicit import set_implicit
 from .reify import reify
@@ -109,7 +111,11 @@ class App(dectate.App):
         return self.config.reg_registry.lookup
 
     def set_implicit(self):
-        set_implicit(self.lookup)
+        """Set the implicit lookup to the lookup of this app.
+
+        :return: a token for :func:`morepath.implicit.reset_implicit`.
+        """
+        return set_implicit(self.lookup)
 
     def request(self, environ):
         """Create a :class:`Request` given WSGI environment for this app.
@@ -137,6 +143,24 @@ class App(dectate.App):
         response = self.publish(request)
         return response(environ, start_response)
 
+    @reify
+    def asgi(self):
+        """This app as an ASGI_ 3 application.
+
+        Use this to run the app with an ASGI server such as uvicorn or
+        hypercorn, instead of a WSGI server. Views and model factories
+        that are ``async def`` functions are awaited on the event loop
+        of the server; blocking work runs in a thread pool, whose size
+        is the ``threads`` setting of the ``asgi`` section. Needs
+        Python 3.5 or later.
+
+        See :class:`morepath.asgi.ASGIHandler`.
+
+        .. _ASGI: https://asgi.readthedocs.io/
+        """
+        from .asgi import ASGIHandler
+        return ASGIHandler(self)
+
     @reify
     def publish(self):
         """Publish functionality wrapped in tweens.
@@ -231,3 +255,66 @@ class App(dectate.App):
         global lookup.
         """
         return self.config.setting_registry
+
+    @property
+    def identity_cache(self):
+        """The verified identity cache of this app.
+
+        This is a :class:`morepath.cache.LRUCache` instance shared by
+        all instances of the app class. Its ``hits``, ``misses`` and
+        ``hit_rate`` attributes can be used for monitoring.
+
+        :return: the cache, or ``None`` if the identity cache is not
+          enabled in the ``identity_cache`` settings.
+        """
+        return self.config.identity_policy_registry.identity_cache
+
+    @reify
+    def json_backend(self):
+        """The JSON backend of this app.
+
+        A :class:`morepath.jsonbackend.JsonBackend` selected by the
+        ``backend`` setting of the ``json`` setting section. It is used
+        to render JSON views and to decode JSON request bodies.
+        """
+        return get_json_backend(self.settings.json.backend)
+
+    @reify
+    def response_cache(self):
+        """The response cache of this app.
+
+        This is a :class:`morepath.cache.ResponseCache` used by the
+        response cache tween when this app is published. Its ``hits``,
+        ``misses``, ``hit_rate`` and ``size`` attributes can be used for
+        monitoring. If the ``shared_path`` setting is set, it is a
+        :class:`morepath.cache.SharedResponseCache` in that file instead,
+        so that all worker processes share the cache.
+
+        :return: the cache, or ``None`` if the response cache is not
+          enabled in the ``response_cache`` settings.
+        """
+        settings = self.settings.response_cache
+        if not settings.enabled:
+            return None
+        if settings.shared_path is not None:
+            return SharedResponseCache(settings.shared_path,
+                                       settings.shared_slots,
+                                       settings.shared_slot_size)
+        return ResponseCache(settings.max_bytes)
+
+    @reify
+    def single_flight(self):
+        """Coalescing of concurrent identical requests for this app.
+
+        This is a :class:`morepath.cache.SingleFlight` used by the
+        single-flight tween when this app is published. Its
+        ``flights``, ``coalesced``, ``timeouts`` and ``waiting``
+        attributes can be used for monitoring.
+
+        :return: the :class:`morepath.cache.SingleFlight`, or ``None``
+          if it is not enabled in the ``single_flight`` settings.
+        """
+        settings = self.settings.single_flight
+        if not settings.enabled:
+            return None
+        return SingleFlight(settings.timeout)
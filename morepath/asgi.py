@@ -0,0 +1,517 @@
+"""Serving a Morepath app with ASGI.
+
+See :attr:`morepath.App.asgi`. This module needs Python 3.5 or later,
+and is only imported when it is used.
+"""
+
+import asyncio
+import io
+import sys
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+
+from reg import mapply
+from webob.exc import (
+    HTTPBadRequest, HTTPNotFound, HTTPRequestEntityTooLarge)
+
+from . import core, generic
+from .app import App
+from .compress import compress_response
+from .core import exception_view
+from .implicit import reset_implicit, set_implicit
+from .publish import enter_app, get_view_name, match_path, resolve_response
+from .reify import reify
+from .view import View, is_not_modified, not_modified_response
+
+
+DONE = object()
+
+
+class ASGIHandler(object):
+    """Serve a Morepath app as an ASGI_ 3 application.
+
+    The request body is received asynchronously, and spooled to a
+    temporary file if it is large. Then the request is published by
+    :meth:`ASGIHandler.publish`: views and model factories that are
+    ``async def`` functions are awaited on the event loop of the
+    server, so that a request that waits for I/O does not hold on to a
+    thread. Everything else, such as ordinary views and model
+    factories, permission checks and rendering, is run in a thread
+    pool, as it may block. The response body is sent as it is
+    produced; if it is streamed, each chunk is produced in the thread
+    pool as well.
+
+    .. _ASGI: https://asgi.readthedocs.io/
+
+    :param app: the :class:`morepath.App` instance to serve.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    @reify
+    def executor(self):
+        """Thread pool that runs blocking parts of requests.
+
+        Its size is the ``threads`` setting of the ``asgi`` section; if
+        that is ``None``, it is the default of
+        :class:`concurrent.futures.ThreadPoolExecutor`.
+        """
+        return ThreadPoolExecutor(self.app.settings.asgi.threads)
+
+    @reify
+    def publish(self):
+        """Publish functionality wrapped in tweens, as a coroutine function.
+
+        This is the counterpart of :attr:`morepath.App.publish`. The
+        built-in tweens have a version that runs on the event loop, see
+        :data:`async_tween_factories`. Other tweens are each run in a
+        thread of their own, see :meth:`ASGIHandler.threaded_tween`.
+
+        :return: a coroutine function that takes a
+          :class:`morepath.Request` instance and returns a
+          :class:`morepath.Response` instance.
+        """
+        return self.app.config.tween_registry.wrap(
+            self.app, self.wrap_factories)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        else:
+            raise ValueError("Unsupported ASGI scope type: %s" %
+                             scope['type'])
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        try:
+            body = await self.receive_body(scope, receive)
+        except (HTTPBadRequest, HTTPRequestEntityTooLarge) as response:
+            await self.send_response(
+                response, build_environ(scope, io.BytesIO()), send)
+            return
+        if body is None:
+            # the client went away
+            return
+        environ = build_environ(scope, body)
+        # coroutines of code in the thread pool run on this loop
+        environ['morepath.event_loop'] = asyncio.get_event_loop()
+        response = await self.publish(self.app.request(environ))
+        await self.send_response(response, environ, send)
+
+    async def receive_body(self, scope, receive):
+        """Receive the request body.
+
+        :return: a file with the body, or ``None`` if the client
+          disconnected.
+        :raises webob.exc.HTTPBadRequest: if the ``Content-Length``
+          header is not a number.
+        :raises webob.exc.HTTPRequestEntityTooLarge: if the body is
+          larger than the ``max_size`` setting of the ``request_body``
+          section.
+        """
+        settings = self.app.settings.request_body
+        max_size = settings.max_size
+        for name, value in scope['headers']:
+            if name.lower() != b'content-length':
+                continue
+            if not value.strip().isdigit():
+                raise HTTPBadRequest("Invalid Content-Length header")
+            if max_size is not None and int(value) > max_size:
+                raise HTTPRequestEntityTooLarge()
+        body = tempfile.SpooledTemporaryFile(max_size=settings.spool_size)
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return None
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if max_size is not None and size > max_size:
+                body.close()
+                raise HTTPRequestEntityTooLarge()
+            body.write(chunk)
+            if not message.get('more_body', False):
+                break
+        body.seek(0)
+        return body
+
+    def wrap_factories(self, app, tween_factories):
+        """Wrap :meth:`ASGIHandler.publish_request` in tweens.
+
+        :param app: the :class:`morepath.App` instance being published.
+        :param tween_factories: tween factories, sorted from outer to
+          inner.
+        :return: the outermost tween, a coroutine function.
+        """
+        result = self.publish_request
+        for tween_factory in reversed(tween_factories):
+            async_tween_factory = async_tween_factories.get(tween_factory)
+            if async_tween_factory is not None:
+                result = async_tween_factory(app, result, self)
+            else:
+                result = self.threaded_tween(app, tween_factory, result)
+        return result
+
+    def threaded_tween(self, app, tween_factory, handler):
+        """Run a tween in a thread of its own.
+
+        The tween blocks its thread while the rest of the tween chain
+        is awaited on the event loop, and that needs the thread pool
+        for blocking work. So the tween does not run in the thread
+        pool: if it did, the tweens of enough concurrent requests
+        would take all its threads, and then wait forever.
+
+        :param app: the :class:`morepath.App` instance being published.
+        :param tween_factory: the tween factory.
+        :param handler: the coroutine function that the tween wraps.
+        :return: a coroutine function.
+        """
+        def call_handler(request):
+            loop = request.environ['morepath.event_loop']
+            return asyncio.run_coroutine_threadsafe(
+                handler(request), loop).result()
+
+        tween = tween_factory(app, call_handler)
+        if tween is call_handler:
+            # the tween factory does not wrap for this app
+            return handler
+
+        async def threaded(request):
+            return await run_in_thread(call_in_request, request, tween,
+                                       request)
+        return threaded
+
+    async def publish_request(self, request):
+        """Handle request and return response.
+
+        This is the counterpart of :func:`morepath.publish.publish`.
+
+        :param request: :class:`morepath.Request` instance.
+        :return: :class:`morepath.Response` instance.
+        """
+        obj = await self.resolve_model(request)
+        view_name = request.view_name = get_view_name(request.unconsumed)
+        if view_name is None:
+            raise HTTPNotFound()
+        view = generic.view.component(obj, request, lookup=request.lookup)
+        if view is None:
+            # let the fallbacks of the view function handle it
+            return await self.run_in_request(
+                request, resolve_response, obj, request)
+        return await self.call_view(view, obj, request)
+
+    async def resolve_model(self, request):
+        """Resolve request to a model object.
+
+        This is the counterpart of :func:`morepath.publish.resolve_model`.
+
+        :param: :class:`morepath.Request` instance.
+        :return: model object or ``None`` if not found.
+        """
+        app = request.app
+        app.set_implicit()
+        while request.unconsumed:
+            next = await self.consume(app, request)
+            if next is None:
+                break
+            if not isinstance(next, App):
+                return next
+            enter_app(request, next)
+            app = next
+        if not request.unconsumed:
+            return await self.consume(app, request)
+        return None
+
+    async def consume(self, app, request):
+        """Consume path segments from request to find model obj.
+
+        This is the counterpart of :func:`morepath.publish.consume`. A
+        factory that is an ``async def`` function is awaited on the
+        event loop, other factories are called in the thread pool.
+
+        :param app: the :class:`morepath.App` instance that contains the
+          path registry to use.
+        :param request: :class:`morepath.Request` instance.
+        :return: The new model object, or a mounted :class:`morepath.App`
+          instance, or ``None`` if no new instance could be found.
+        """
+        match = match_path(app, request)
+        if match is None:
+            return None
+        get_obj, variables, stack = match
+        if asyncio.iscoroutinefunction(get_obj):
+            next_obj = await mapply(get_obj, **variables)
+        else:
+            next_obj = await self.run_in_request(
+                request, partial(mapply, get_obj, **variables))
+            if asyncio.iscoroutine(next_obj):
+                next_obj = await next_obj
+        if next_obj is None:
+            return None
+        request.unconsumed = stack
+        return next_obj
+
+    async def call_view(self, view, obj, request):
+        """Call view for a model object.
+
+        If the view function is an ``async def`` function, it is awaited
+        on the event loop, and the permission check and rendering are
+        done in the thread pool. Otherwise the whole view is called in
+        the thread pool.
+
+        :param view: the view, as registered for :func:`morepath.generic.view`.
+        :param obj: model object.
+        :param request: :class:`morepath.Request` instance.
+        :return: :class:`morepath.Response` instance.
+        """
+        if not (isinstance(view, View) and
+                asyncio.iscoroutinefunction(view.func)):
+            return await self.run_in_request(request, view, obj, request)
+        etag, last_modified = await self.run_in_request(
+            request, view.check, obj, request)
+        if is_not_modified(request, etag, last_modified):
+            response = not_modified_response()
+        else:
+            content = await view.func(obj, request)
+            response = await self.run_in_request(
+                request, view.render_content, content, request)
+        return await self.run_in_request(
+            request, view.finish, response, request, etag, last_modified)
+
+    async def send_response(self, response, environ, send):
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started.append((status, headers))
+
+        app_iter = await self.run(response, environ, start_response)
+        status, headers = started[0]
+        await send({
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin-1'),
+                         value.encode('latin-1'))
+                        for name, value in headers],
+        })
+        try:
+            if isinstance(app_iter, (list, tuple)):
+                for chunk in app_iter:
+                    await send({'type': 'http.response.body',
+                                'body': chunk, 'more_body': True})
+            else:
+                iterator = iter(app_iter)
+                while True:
+                    chunk = await self.run(next, iterator, DONE)
+                    if chunk is DONE:
+                        break
+                    await send({'type': 'http.response.body',
+                                'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b'',
+                        'more_body': False})
+        finally:
+            close = getattr(app_iter, 'close', None)
+            if close is not None:
+                await self.run(close)
+
+    def run(self, func, *args):
+        """Run function in the thread pool.
+
+        :return: a future with the result.
+        """
+        return asyncio.get_event_loop().run_in_executor(
+            self.executor, func, *args)
+
+    def run_in_request(self, request, func, *args):
+        """Run function in the thread pool for request.
+
+        The implicit lookup is set to that of the request while the
+        function runs.
+
+        :return: a future with the result.
+        """
+        return self.run(call_in_request, request, func, *args)
+
+
+def run_in_thread(func, *args):
+    """Run function in a new thread.
+
+    :return: a future with the result.
+    """
+    future = Future()
+
+    def target():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(func(*args))
+        except BaseException as exc:
+            future.set_exception(exc)
+
+    threading.Thread(target=target, daemon=True).start()
+    return asyncio.wrap_future(future)
+
+
+def call_in_request(request, func, *args):
+    token = set_implicit(request.lookup)
+    try:
+        return func(*args)
+    finally:
+        reset_implicit(token)
+
+
+def excview_tween_factory(app, handler, asgi):
+    async def excview_tween(request):
+        try:
+            response = await handler(request)
+        except Exception as exc:
+            view = exception_view(request, exc)
+            if view is None:
+                raise
+            return await asgi.call_view(view, exc, request)
+        return response
+    return excview_tween
+
+
+def response_cache_tween_factory(app, handler, asgi):
+    response_cache = app.response_cache
+    if response_cache is None:
+        return handler
+
+    async def response_cache_tween(request):
+        method = request.method
+        if method not in ('GET', 'HEAD'):
+            response = await handler(request)
+            # a successful unsafe request may have changed the resource
+            if 200 <= response.status_code <= 399:
+                response_cache.invalidate(request.path)
+            return response
+        response = response_cache.get(request)
+        if response is not None:
+            return response
+        response = await handler(request)
+        response_cache.store(request, response)
+        return response
+    return response_cache_tween
+
+
+def single_flight_tween_factory(app, handler, asgi):
+    single_flight = app.single_flight
+    if single_flight is None:
+        return handler
+
+    async def single_flight_tween(request):
+        if request.method not in ('GET', 'HEAD'):
+            return await handler(request)
+        key, flight = single_flight.join(request, asyncio.Event)
+        if flight.request is request:
+            try:
+                response = await handler(request)
+                flight.share(response)
+            finally:
+                single_flight.land(key, flight)
+            return response
+        try:
+            await asyncio.wait_for(flight.done.wait(), single_flight.timeout)
+        except asyncio.TimeoutError:
+            finished = False
+        else:
+            finished = True
+        response = single_flight.response_after_wait(
+            flight, request, finished)
+        if response is None:
+            return await handler(request)
+        return response
+    return single_flight_tween
+
+
+def compression_tween_factory(app, handler, asgi):
+    settings = app.settings.compression
+    if not settings.enabled:
+        return handler
+
+    async def compression_tween(request):
+        response = await handler(request)
+        await asgi.run(compress_response, request, response, settings)
+        return response
+    return compression_tween
+
+
+async_tween_factories = {
+    core.excview_tween_factory: excview_tween_factory,
+    core.response_cache_tween_factory: response_cache_tween_factory,
+    core.single_flight_tween_factory: single_flight_tween_factory,
+    core.compression_tween_factory: compression_tween_factory,
+}
+"""Versions of the built-in tween factories that run on the event loop.
+
+Maps each tween factory to a function that takes the app, the
+coroutine function to wrap and the :class:`ASGIHandler`, and returns a
+coroutine function.
+"""
+
+
+def build_environ(scope, body):
+    """Create WSGI environment for ASGI HTTP scope.
+
+    :param scope: the ASGI scope.
+    :param body: file with the request body.
+    :return: the WSGI environment. It has the ASGI scope as
+      ``asgi.scope``.
+    """
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    body.seek(0, 2)
+    content_length = body.tell()
+    body.seek(0)
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        # WSGI wants the UTF-8 bytes of the path as a native string
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'CONTENT_LENGTH': str(content_length),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        'asgi.scope': scope,
+    }
+    client = scope.get('client')
+    if client:
+        environ['REMOTE_ADDR'] = client[0]
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        if name != 'CONTENT_TYPE':
+            name = 'HTTP_' + name
+        if name in environ:
+            separator = '; ' if name == 'HTTP_COOKIE' else ','
+            environ[name] += separator + value
+        else:
+            environ[name] = value
+    return environ
@@ -0,0 +1,249 @@
+"""Streaming parsers for request bodies.
+
+Used by :meth:`morepath.Request.json_items` and
+:meth:`morepath.Request.multipart`. They parse an iterable of chunks of
+bytes as they arrive, so that a large body never has to be in memory
+as a whole.
+"""
+
+import codecs
+import json
+import re
+import tempfile
+
+
+SPOOL_SIZE = 1024 * 1024
+
+MAX_HEADER_SIZE = 64 * 1024
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+HEADER_PARAM = re.compile(
+    r';\s*([^\s=;]+)\s*=\s*("(?:[^"\\]|\\.)*"|[^;]*)')
+
+
+class TextReader(object):
+    """Decode chunks of UTF-8 text, as far as they are needed.
+
+    :param chunks: iterable of bytes.
+    """
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decode = codecs.getincrementaldecoder('utf-8')().decode
+        self.text = u''
+        self.eof = False
+
+    def read(self, position):
+        """Read more text.
+
+        :param position: the position in :attr:`text` up to which the
+          text has been parsed. It is discarded.
+        :return: the new position, which is ``0``.
+        """
+        self.text = self.text[position:]
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.eof = True
+            self.text += self.decode(b'', True)
+        else:
+            self.text += self.decode(chunk)
+        return 0
+
+
+def iter_json_array(chunks):
+    """Parse a JSON array, and yield its items one by one.
+
+    An item is yielded as soon as it has been received completely.
+
+    :param chunks: iterable of bytes with a UTF-8 encoded JSON array.
+    :return: generator of the decoded items.
+    :raises ValueError: if the body is not a valid JSON array.
+    """
+    reader = TextReader(chunks)
+    raw_decode = json.JSONDecoder().raw_decode
+    position = 0
+    # what we expect next: the opening bracket, the first item or the
+    # closing bracket, an item, a comma or the closing bracket, or
+    # nothing more
+    state = 'start'
+    while True:
+        position = WHITESPACE.match(reader.text, position).end()
+        if position == len(reader.text):
+            if reader.eof:
+                if state == 'done':
+                    return
+                raise ValueError("JSON array is incomplete")
+            position = reader.read(position)
+            continue
+        char = reader.text[position]
+        if state == 'start':
+            if char != u'[':
+                raise ValueError("Expected a JSON array")
+            position += 1
+            state = 'first'
+        elif state == 'done':
+            raise ValueError("Extra data after JSON array")
+        elif state == 'after':
+            if char == u',':
+                state = 'item'
+            elif char == u']':
+                state = 'done'
+            else:
+                raise ValueError("Expected ',' or ']' in JSON array")
+            position += 1
+        elif state == 'first' and char == u']':
+            position += 1
+            state = 'done'
+        else:
+            try:
+                item, end = raw_decode(reader.text, position)
+            except ValueError:
+                if reader.eof:
+                    raise
+                end = None
+            if end is not None and not reader.eof:
+                # a number may be cut off at the end of the text, as in
+                # 1.5e, so we only accept an item if we see what follows
+                after = WHITESPACE.match(reader.text, end).end()
+                if reader.text[after:after + 1] not in (u',', u']'):
+                    end = None
+            if end is None:
+                # the item may continue in the next chunk
+                position = reader.read(position)
+                continue
+            yield item
+            position = end
+            state = 'after'
+
+
+class Part(object):
+    """A part of a ``multipart/form-data`` body.
+
+    :param headers: dict with the headers of the part, with lowercase
+      names.
+    :param file: file object with the body of the part, positioned at
+      the start.
+    """
+    def __init__(self, headers, file):
+        self.headers = headers
+        self.file = file
+        disposition, params = parse_header(
+            headers.get('content-disposition', ''))
+        self.name = params.get('name')
+        """The name of the form field."""
+        self.filename = params.get('filename')
+        """The name of the uploaded file, or ``None``."""
+        self.content_type = headers.get('content-type', 'text/plain')
+        """The content type of the part."""
+
+    def __repr__(self):
+        return '<Part %r>' % self.name
+
+
+def iter_multipart(chunks, boundary, spool_size=SPOOL_SIZE):
+    """Parse a ``multipart/form-data`` body, and yield its parts.
+
+    The body of each part is written to a temporary file as it
+    arrives; it is kept in memory if it is smaller than ``spool_size``.
+    A part is yielded when it has been received completely.
+
+    :param chunks: iterable of bytes with the body.
+    :param boundary: the boundary from the content type, as bytes.
+    :param spool_size: the size above which the body of a part is
+      written to disk.
+    :return: generator of :class:`Part` instances.
+    :raises ValueError: if the body is not valid.
+    """
+    chunks = iter(chunks)
+    delimiter = b'\r\n--' + boundary
+    keep = len(delimiter) - 1
+    # a CRLF so that the first boundary looks like the others
+    buffer = b'\r\n'
+    part = None
+    state = 'preamble'
+    while True:
+        if state == 'preamble' or state == 'body':
+            index = buffer.find(delimiter)
+            if index == -1:
+                if len(buffer) > keep:
+                    if part is not None:
+                        part.file.write(buffer[:-keep])
+                    buffer = buffer[-keep:]
+                buffer += next_chunk(chunks)
+                continue
+            if part is not None:
+                part.file.write(buffer[:index])
+                part.file.seek(0)
+                yield part
+                part = None
+            buffer = buffer[index + len(delimiter):]
+            state = 'boundary'
+        elif state == 'boundary':
+            if len(buffer) < 2:
+                buffer += next_chunk(chunks)
+                continue
+            if buffer.startswith(b'--'):
+                # the closing boundary; we ignore the epilogue
+                return
+            index = buffer.find(b'\r\n')
+            if index == -1:
+                if len(buffer) > MAX_HEADER_SIZE:
+                    raise ValueError("Invalid multipart boundary")
+                buffer += next_chunk(chunks)
+                continue
+            if buffer[:index].strip(b' \t'):
+                raise ValueError("Invalid multipart boundary")
+            buffer = buffer[index + 2:]
+            state = 'headers'
+        else:
+            if buffer.startswith(b'\r\n'):
+                header_block = b''
+                buffer = buffer[2:]
+            else:
+                index = buffer.find(b'\r\n\r\n')
+                if index == -1:
+                    if len(buffer) > MAX_HEADER_SIZE:
+                        raise ValueError("Multipart headers are too large")
+                    buffer += next_chunk(chunks)
+                    continue
+                header_block = buffer[:index]
+                buffer = buffer[index + 4:]
+            part = Part(parse_part_headers(header_block),
+                        tempfile.SpooledTemporaryFile(max_size=spool_size))
+            state = 'body'
+
+
+def next_chunk(chunks):
+    chunk = next(chunks, None)
+    if chunk is None:
+        raise ValueError("Multipart body is incomplete")
+    return chunk
+
+
+def parse_part_headers(header_block):
+    result = {}
+    if not header_block:
+        return result
+    for line in header_block.decode('utf-8', 'replace').split(u'\r\n'):
+        name, colon, value = line.partition(u':')
+        if not colon:
+            raise ValueError("Invalid multipart header: %r" % line)
+        result[name.strip().lower()] = value.strip()
+    return result
+
+
+def parse_header(value):
+    """Parse a header value with parameters.
+
+    :param value: a header value such as ``form-data; name="file"``.
+    :return: a tuple with the value without parameters, and a dict with
+      the parameters, with lowercase names.
+    """
+    main, semicolon, rest = value.partition(u';')
+    params = {}
+    for name, param in HEADER_PARAM.findall(semicolon + rest):
+        param = param.strip()
+        if len(param) >= 2 and param[0] == param[-1] == u'"':
+            param = re.sub(r'\\(.)', r'\1', param[1:-1])
+        params[name.lower()] = param
+    return main.strip().lower(), params
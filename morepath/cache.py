@@ -0,0 +1,827 @@
+"""Caching infrastructure.
+
+:class:`LRUCache` is a thread-safe least-recently-used cache where
+entries can expire after a time to live. Morepath uses it to cache
+verified identities and rendered fragments.
+
+:class:`ResponseCache` and :class:`SharedResponseCache` cache complete
+responses for the response cache tween in :mod:`morepath.core`: one
+in process memory, and one in a memory-mapped file that is shared by
+all processes on a host that use it. The single-flight tween uses
+:class:`SingleFlight` to let concurrent identical requests share one
+response.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from webob import Response
+
+from .error import ConfigError
+
+try:
+    from urllib.parse import unquote
+except ImportError:  # pragma: no cover
+    # Python 2
+    from urllib import unquote
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # Windows
+    fcntl = None
+
+
+class LRUCache(object):
+    """A thread-safe LRU cache with optional expiry.
+
+    When the cache is full, the least recently used entry is removed
+    to make room for a new one.
+
+    :param max_size: the maximum amount of entries in the cache.
+    :param ttl: time to live of an entry in seconds. If ``None``,
+      entries do not expire.
+    :param clock: function that returns the current time in seconds.
+    """
+    def __init__(self, max_size, ttl=None, clock=time.time):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        """Amount of lookups that found a value."""
+        self.misses = 0
+        """Amount of lookups that did not find a value."""
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Get value from cache.
+
+        :param key: the key to look up.
+        :param default: returned if there is no value or it has expired.
+        :return: the cached value, or ``default``.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or (entry[1] is not None and
+                                 entry[1] <= self.clock()):
+                self.misses += 1
+                return default
+            # re-insert to mark as most recently used
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, expires=None):
+        """Store value in cache.
+
+        :param key: the key to store the value under.
+        :param value: the value to store.
+        :param expires: if given, the time in seconds at which the value
+          expires at the latest, even if its time to live is longer.
+        """
+        if self.ttl is not None:
+            ttl_expires = self.clock() + self.ttl
+            if expires is None or ttl_expires < expires:
+                expires = ttl_expires
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, expires)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """Remove value from cache.
+
+        :param key: the key of the value to remove. If there is no
+          such value, nothing happens.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove all values from cache and reset the statistics.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self):
+        """Fraction of lookups that found a value.
+
+        ``0.0`` if there were no lookups yet.
+        """
+        total = self.hits + self.misses
+        if not total:
+            return 0.0
+        return float(self.hits) / total
+
+
+class ResponseCache(object):
+    """A thread-safe cache of complete responses.
+
+    Responses are cached for GET requests. The cache key consists of
+    the scheme and host, the request path, the query string and the
+    values of the request headers named in the ``Vary`` header of the
+    response, see :func:`request_key`. A response
+    is only cached if its ``Cache-Control`` header allows a shared
+    cache to store it, and for as long as its ``s-maxage`` or
+    ``max-age`` says.
+
+    The cache is bounded by the total size of the cached responses.
+    When it is full, the least recently used responses are removed.
+
+    :param max_bytes: maximum total size of the cached responses,
+      body and headers, in bytes.
+    :param clock: function that returns the current time in seconds.
+    """
+    def __init__(self, max_bytes, clock=time.time):
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.size = 0
+        """Total size of the cached responses in bytes."""
+        self.hits = 0
+        """Amount of requests answered from the cache."""
+        self.misses = 0
+        """Amount of requests not answered from the cache."""
+        # key -> (response, expires, size)
+        self._entries = OrderedDict()
+        # (path, host URL, query string) -> names of vary headers
+        self._vary = {}
+        # path -> keys of entries for path
+        self._paths = {}
+        self._lock = threading.Lock()
+
+    def get(self, request):
+        """Get cached response for request.
+
+        :param request: :class:`morepath.Request` instance.
+        :return: a copy of the cached :class:`morepath.Response`,
+          or ``None``.
+        """
+        base = request_key(request)
+        with self._lock:
+            vary = self._vary.get(base)
+            if vary is None:
+                self.misses += 1
+                return None
+            key = base + (vary_values(request, vary),)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            response, expires, size = entry
+            if expires <= self.clock():
+                self._remove(key)
+                self.misses += 1
+                return None
+            # re-insert to mark as most recently used
+            del self._entries[key]
+            self._entries[key] = entry
+            self.hits += 1
+        return response.copy()
+
+    def store(self, request, response):
+        """Store response for request if its headers allow it.
+
+        :param request: :class:`morepath.Request` instance.
+        :param response: :class:`morepath.Response` instance.
+        :return: ``True`` if the response was stored.
+        """
+        max_age = cacheable_max_age(request, response)
+        if max_age is None:
+            return False
+        vary = tuple(name.lower() for name in (response.vary or ()))
+        if '*' in vary:
+            return False
+        size = len(response.body) + sum(
+            len(name) + len(value) for name, value in response.headerlist)
+        if size > self.max_bytes:
+            return False
+        base = request_key(request)
+        path = base[0]
+        key = base + (vary_values(request, vary),)
+        expires = self.clock() + max_age
+        with self._lock:
+            if self._vary.get(base, vary) != vary:
+                # the variant headers changed, old variants are invalid
+                self._remove_base(base)
+            self._remove(key)
+            self._vary[base] = vary
+            self._entries[key] = (response.copy(), expires, size)
+            self._paths.setdefault(path, set()).add(key)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+        return True
+
+    def invalidate(self, path):
+        """Remove all cached responses for path.
+
+        This includes responses for any host, any query string and any
+        variant.
+
+        :param path: the URL path, as in :attr:`morepath.Request.path`.
+          It may be quoted.
+        """
+        path = normalize_path(path)
+        with self._lock:
+            for key in list(self._paths.get(path, ())):
+                self._remove(key)
+
+    def clear(self):
+        """Remove all responses from cache and reset the statistics.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._vary.clear()
+            self._paths.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self):
+        """Fraction of requests answered from the cache.
+
+        ``0.0`` if there were no requests yet.
+        """
+        total = self.hits + self.misses
+        if not total:
+            return 0.0
+        return float(self.hits) / total
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= entry[2]
+        path = key[0]
+        keys = self._paths[path]
+        keys.discard(key)
+        if not keys:
+            del self._paths[path]
+        base = key[:3]
+        if not any(k[:3] == base for k in keys):
+            self._vary.pop(base, None)
+
+    def _remove_base(self, base):
+        for key in list(self._paths.get(base[0], ())):
+            if key[:3] == base:
+                self._remove(key)
+
+
+class SharedResponseCache(object):
+    """A response cache in a memory-mapped file.
+
+    All processes that open the same file share the cache, so with a
+    preforking server such as gunicorn a response that one worker
+    stored can be used by all other workers. Which responses are
+    cached follows the same rules as for :class:`ResponseCache`.
+
+    The file contains a hash table with a fixed amount of slots of a
+    fixed size. A key can be stored in one of a few consecutive slots;
+    when these are all in use, storing a response overwrites the entry
+    among them that expires first. Responses that don't fit in a slot
+    are not cached. Reading takes no lock: each slot has a
+    sequence number that is odd while the slot is being written, and
+    a reader discards what it read if the sequence number changed
+    meanwhile. A writer takes a non-blocking lock on just its slot and
+    gives up storing if another process is writing it.
+
+    Each layout of the table has its own file, so that processes with
+    different settings, as during a rolling deploy, don't disturb each
+    other. A file that is no longer used is not removed.
+
+    :param path: path of the cache file, to which the amount of slots
+      and the slot size are appended, see :attr:`filename`. It is
+      created if needed.
+    :param slots: amount of slots in the table.
+    :param slot_size: size of a slot in bytes, including a small
+      header. This limits the size of a cached response.
+    :param clock: function that returns the current time in seconds.
+    :raises morepath.error.ConfigError: if the file exists but is not
+      a cache file.
+    """
+    def __init__(self, path, slots=1024, slot_size=64 * 1024,
+                 clock=time.time):
+        self.path = path
+        self.filename = '%s.%d.%d' % (path, slots, slot_size)
+        """The name of the cache file."""
+        self.slots = slots
+        self.slot_size = slot_size
+        self.clock = clock
+        self.hits = 0
+        """Amount of requests answered from the cache in this process."""
+        self.misses = 0
+        """Amount of requests not answered from the cache in this
+        process."""
+        self._lock = threading.Lock()
+        self._data_size = slot_size - SLOT.size
+        size = FILE_HEADER.size + slots * slot_size
+        file_header = FILE_HEADER.pack(MAGIC, slots, slot_size)
+        self._fd = os.open(self.filename, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            self._lock_range(0, FILE_HEADER.size, blocking=True)
+            try:
+                header = os.read(self._fd, FILE_HEADER.size)
+                if header != file_header:
+                    if header.strip(b'\0'):
+                        raise ConfigError(
+                            "Not a response cache file: %s" % self.filename)
+                    # the file is new; nobody maps it before it has a
+                    # header, so we can still change its size
+                    os.ftruncate(self._fd, size)
+                    os.lseek(self._fd, 0, os.SEEK_SET)
+                    os.write(self._fd, file_header)
+            finally:
+                self._unlock_range(0, FILE_HEADER.size)
+            self._mmap = mmap.mmap(self._fd, size)
+        except Exception:
+            os.close(self._fd)
+            raise
+
+    def get(self, request):
+        """Get cached response for request.
+
+        :param request: :class:`morepath.Request` instance.
+        :return: a new :class:`morepath.Response`, or ``None``.
+        """
+        base = request_key(request)
+        vary = self._read(digest(b'vary', base))
+        if vary is not None:
+            vary = tuple(name for name in vary.decode('latin-1').split(',')
+                         if name)
+            data = self._read(digest(b'response', base,
+                                     vary_values(request, vary)))
+            if data is not None:
+                self.hits += 1
+                return deserialize_response(data)
+        self.misses += 1
+        return None
+
+    def store(self, request, response):
+        """Store response for request if its headers allow it.
+
+        :param request: :class:`morepath.Request` instance.
+        :param response: :class:`morepath.Response` instance.
+        :return: ``True`` if the response was stored.
+        """
+        max_age = cacheable_max_age(request, response)
+        if max_age is None:
+            return False
+        vary = tuple(name.lower() for name in (response.vary or ()))
+        if '*' in vary:
+            return False
+        data = serialize_response(response)
+        if len(data) > self._data_size:
+            return False
+        base = request_key(request)
+        path_digest = digest(b'path', base[0])[:8]
+        expires = self.clock() + max_age
+        with self._lock:
+            return (
+                self._write(digest(b'vary', base), path_digest, expires,
+                            ','.join(vary).encode('latin-1')) and
+                self._write(digest(b'response', base,
+                                   vary_values(request, vary)),
+                            path_digest, expires, data))
+
+    def invalidate(self, path):
+        """Remove all cached responses for path.
+
+        :param path: the URL path, as in :attr:`morepath.Request.path`.
+          It may be quoted.
+        """
+        path_digest = digest(b'path', normalize_path(path))[:8]
+        with self._lock:
+            for offset in self._offsets():
+                if self._slot_path(offset) == path_digest:
+                    self._clear_slot(offset, path_digest)
+
+    def clear(self):
+        """Remove all responses from cache and reset the statistics.
+        """
+        with self._lock:
+            for offset in self._offsets():
+                self._clear_slot(offset)
+            self.hits = 0
+            self.misses = 0
+
+    def close(self):
+        """Close the cache file.
+        """
+        self._mmap.close()
+        os.close(self._fd)
+
+    def __len__(self):
+        now = self.clock()
+        return sum(1 for offset in self._offsets()
+                   if SLOT.unpack_from(self._mmap, offset)[3] > now)
+
+    @property
+    def hit_rate(self):
+        """Fraction of requests answered from the cache in this process.
+
+        ``0.0`` if there were no requests yet.
+        """
+        total = self.hits + self.misses
+        if not total:
+            return 0.0
+        return float(self.hits) / total
+
+    def _offsets(self):
+        return range(FILE_HEADER.size,
+                     FILE_HEADER.size + self.slots * self.slot_size,
+                     self.slot_size)
+
+    def _candidates(self, key):
+        index = struct.unpack('<Q', key[:8])[0]
+        return [FILE_HEADER.size +
+                ((index + i) % self.slots) * self.slot_size
+                for i in range(min(PROBES, self.slots))]
+
+    def _read(self, key):
+        mm = self._mmap
+        now = self.clock()
+        for offset in self._candidates(key):
+            seq, slot_key, path_digest, expires, length = SLOT.unpack_from(
+                mm, offset)
+            if slot_key != key:
+                continue
+            if seq & 1 or expires <= now:
+                return None
+            start = offset + SLOT.size
+            data = mm[start:start + length]
+            # if a writer touched the slot meanwhile, data may be garbled
+            if SEQ.unpack_from(mm, offset)[0] != seq:
+                return None
+            return data
+        return None
+
+    def _write(self, key, path_digest, expires, data):
+        mm = self._mmap
+        now = self.clock()
+
+        def preference(offset):
+            slot = SLOT.unpack_from(mm, offset)
+            # the slot that has the key already, then the slot that
+            # expires first; empty slots have expired long ago
+            return slot[1] != key, slot[3]
+        offsets = sorted(self._candidates(key), key=preference)
+        # first look for a slot that is ours or free, then evict
+        for evict in (False, True):
+            for offset in offsets:
+                if not self._lock_range(offset, self.slot_size):
+                    # another process is writing this slot; don't wait
+                    continue
+                try:
+                    # check again, another process may have taken it
+                    slot = SLOT.unpack_from(mm, offset)
+                    if evict or slot[1] == key or slot[3] <= now:
+                        self._write_slot(offset, key, path_digest, expires,
+                                         data)
+                        return True
+                finally:
+                    self._unlock_range(offset, self.slot_size)
+        return False
+
+    def _slot_path(self, offset):
+        return self._mmap[offset + PATH_OFFSET:offset + PATH_OFFSET + 8]
+
+    def _clear_slot(self, offset, path_digest=None):
+        # wait for a writer in another process to finish the slot
+        self._lock_range(offset, self.slot_size, blocking=True)
+        try:
+            # the slot may have been given to another path meanwhile
+            if path_digest is None or self._slot_path(offset) == path_digest:
+                self._write_slot(offset, EMPTY_KEY, EMPTY_PATH, 0, b'')
+        finally:
+            self._unlock_range(offset, self.slot_size)
+
+    def _write_slot(self, offset, key, path_digest, expires, data):
+        mm = self._mmap
+        seq = SEQ.unpack_from(mm, offset)[0]
+        # odd sequence number marks the slot as being written
+        SEQ.pack_into(mm, offset, seq + 1)
+        start = offset + SLOT.size
+        mm[start:start + len(data)] = data
+        SLOT.pack_into(mm, offset, seq + 1, key, path_digest, expires,
+                       len(data))
+        SEQ.pack_into(mm, offset, seq + 2)
+
+    def _lock_range(self, offset, length, blocking=False):
+        if fcntl is None:  # pragma: no cover
+            return True
+        flags = fcntl.LOCK_EX
+        if not blocking:
+            flags |= fcntl.LOCK_NB
+        try:
+            fcntl.lockf(self._fd, flags, length, offset)
+        except (IOError, OSError):
+            return False
+        return True
+
+    def _unlock_range(self, offset, length):
+        if fcntl is not None:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, length, offset)
+
+
+MAGIC = b'MPRC0001'
+FILE_HEADER = struct.Struct('<8sQQ')
+SEQ = struct.Struct('<Q')
+# amount of consecutive slots where a key can be stored
+PROBES = 4
+# sequence number, key, path digest, expires, data length
+SLOT = struct.Struct('<Q16s8sdI')
+PATH_OFFSET = 8 + 16
+EMPTY_KEY = b'\0' * 16
+EMPTY_PATH = b'\0' * 8
+
+
+def digest(kind, *parts):
+    """Digest to identify an entry in :class:`SharedResponseCache`.
+
+    :param kind: bytes that say what kind of entry this is.
+    :param parts: text strings, ``None`` or tuples of those.
+    :return: 16 bytes.
+    """
+    h = hashlib.sha1(kind)
+    for part in parts:
+        if not isinstance(part, tuple):
+            part = (part,)
+        for value in part:
+            h.update(b'\0')
+            if value is not None:
+                h.update(b'=' + value.encode('utf-8'))
+    return h.digest()[:16]
+
+
+RESPONSE_HEADER = struct.Struct('<III')
+
+
+def serialize_response(response):
+    """Serialize response to bytes.
+
+    :param response: :class:`morepath.Response` instance.
+    :return: bytes with status, headers and body.
+    """
+    status = response.status.encode('latin-1')
+    headers = u'\r\n'.join(
+        u'%s: %s' % (name, value)
+        for name, value in response.headerlist).encode('latin-1')
+    body = response.body
+    return b''.join([RESPONSE_HEADER.pack(len(status), len(headers),
+                                          len(body)),
+                     status, headers, body])
+
+
+def deserialize_response(data):
+    """Create response from bytes made by :func:`serialize_response`.
+
+    :param data: bytes.
+    :return: :class:`morepath.Response` instance.
+    """
+    status_length, headers_length, body_length = \
+        RESPONSE_HEADER.unpack_from(data)
+    start = RESPONSE_HEADER.size
+    status = data[start:start + status_length].decode('latin-1')
+    start += status_length
+    headers = data[start:start + headers_length].decode('latin-1')
+    start += headers_length
+    headerlist = [tuple(line.split(': ', 1))
+                  for line in headers.split('\r\n') if line]
+    return Response(status=status, headerlist=headerlist,
+                    app_iter=[data[start:start + body_length]])
+
+
+class SingleFlight(object):
+    """Let concurrent identical requests share one response.
+
+    The first request for a key is handled as usual. Requests with
+    the same key that arrive while it is in flight wait for it to
+    finish and get a copy of its response, instead of computing the
+    same response again.
+
+    The key consists of the request method, scheme and host, path and
+    query string, and the ``Authorization`` and ``Cookie`` headers, so
+    that requests are only coalesced with requests of the same user. A
+    waiting request only uses the response if it has the same values
+    for the request headers named in the ``Vary`` header of the
+    response. It handles
+    the request itself if the response cannot be shared, because it
+    sets a cookie or has a streamed body, if the first request raised
+    an exception, or if waiting takes longer than ``timeout``.
+
+    :param timeout: maximum time to wait for the first request, in
+      seconds.
+    """
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.flights = 0
+        """Amount of requests that were handled while others could wait."""
+        self.coalesced = 0
+        """Amount of requests answered with the response of another."""
+        self.timeouts = 0
+        """Amount of requests that stopped waiting because of timeout."""
+        self.waiting = 0
+        """Amount of requests waiting right now."""
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def handle(self, request, handler):
+        """Handle request, or wait for an identical request in flight.
+
+        :param request: :class:`morepath.Request` instance.
+        :param handler: function that takes the request and returns
+          a response.
+        :return: a :class:`morepath.Response`.
+        """
+        key, flight = self.join(request)
+        if flight.request is request:
+            try:
+                response = handler(request)
+                flight.share(response)
+            finally:
+                self.land(key, flight)
+            return response
+        finished = flight.done.wait(self.timeout)
+        response = self.response_after_wait(flight, request, finished)
+        if response is None:
+            return handler(request)
+        return response
+
+    def join(self, request, event=threading.Event):
+        """Join the flight of an identical request, or start a new one.
+
+        :param request: :class:`morepath.Request` instance.
+        :param event: factory for the event that is set when a new
+          flight lands.
+        :return: the key of the request and its :class:`Flight`. If
+          ``request`` is the request of the flight, it must be handled
+          and the flight passed to :meth:`SingleFlight.land`. Otherwise
+          the request can wait for the event in ``flight.done``.
+        """
+        headers = request.headers
+        key = (request.method,) + request_key(request) + (
+            headers.get('Authorization'), headers.get('Cookie'))
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = Flight(request, event())
+                self.flights += 1
+            else:
+                self.waiting += 1
+        return key, flight
+
+    def land(self, key, flight):
+        """Finish a flight started by :meth:`SingleFlight.join`.
+
+        :param key: the key returned by :meth:`SingleFlight.join`.
+        :param flight: the flight.
+        """
+        with self._lock:
+            del self._flights[key]
+        flight.done.set()
+
+    def response_after_wait(self, flight, request, finished):
+        """Get the response of a flight for a request that waited for it.
+
+        :param flight: the flight the request waited for.
+        :param request: the waiting request.
+        :param finished: ``False`` if waiting timed out.
+        :return: a :class:`morepath.Response`, or ``None`` if the
+          request has to be handled by itself.
+        """
+        with self._lock:
+            self.waiting -= 1
+            if not finished:
+                self.timeouts += 1
+        response = flight.response_for(request) if finished else None
+        if response is not None:
+            with self._lock:
+                self.coalesced += 1
+        return response
+
+
+class Flight(object):
+    """A request in flight in :class:`SingleFlight`.
+
+    :param request: the request being handled.
+    :param done: event that is set when the request was handled.
+    """
+    def __init__(self, request, done):
+        self.request = request
+        self.done = done
+        self.response = None
+        self.vary = None
+        self.vary_values = None
+
+    def share(self, response):
+        """Make response available to waiting requests if possible.
+
+        :param response: the response to the request.
+        """
+        if not isinstance(response.app_iter, (list, tuple)):
+            return
+        if 'Set-Cookie' in response.headers:
+            return
+        vary = tuple(name.lower() for name in (response.vary or ()))
+        if '*' in vary:
+            return
+        self.vary = vary
+        self.vary_values = vary_values(self.request, vary)
+        self.response = response.copy()
+
+    def response_for(self, request):
+        """Get a copy of the shared response for a waiting request.
+
+        :param request: the waiting request.
+        :return: a :class:`morepath.Response`, or ``None`` if the
+          response cannot be used for this request.
+        """
+        if self.response is None:
+            return None
+        if vary_values(request, self.vary) != self.vary_values:
+            return None
+        return self.response.copy()
+
+
+def request_key(request):
+    """Get the key of the resource a request asks for.
+
+    The scheme and host are part of the key, as links in a response
+    are made from them.
+
+    :param request: :class:`morepath.Request` instance.
+    :return: tuple of the normalized path, see :func:`normalize_path`,
+      the scheme and host as in :attr:`webob.Request.host_url`, and the
+      query string.
+    """
+    return (normalize_path(request.path), request.host_url,
+            request.query_string)
+
+
+def normalize_path(path):
+    """Normalize URL path so that differently quoted paths are equal.
+
+    WebOb and :meth:`morepath.Request.link` don't quote the same
+    characters, so for instance ``/a:b`` and ``/a%3Ab`` are the same
+    path.
+
+    :param path: URL path.
+    :return: the unquoted path.
+    """
+    return unquote(path)
+
+
+def vary_values(request, vary):
+    """Get the values of the headers a response varies on.
+
+    :param request: :class:`morepath.Request` instance.
+    :param vary: tuple of header names.
+    :return: tuple of header values, ``None`` for missing headers.
+    """
+    headers = request.headers
+    return tuple(headers.get(name) for name in vary)
+
+
+def cacheable_max_age(request, response):
+    """Determine how long a shared cache may store a response.
+
+    :param request: :class:`morepath.Request` instance.
+    :param response: :class:`morepath.Response` instance.
+    :return: the time to live in seconds, or ``None`` if the response
+      must not be cached.
+    """
+    if request.method != 'GET' or response.status_code != 200:
+        return None
+    # streamed bodies are not buffered for caching
+    if not isinstance(response.app_iter, (list, tuple)):
+        return None
+    if 'Set-Cookie' in response.headers:
+        return None
+    cache_control = response.cache_control
+    if (cache_control.private or cache_control.no_store or
+            cache_control.no_cache):
+        return None
+    if request.authorization is not None and not cache_control.public:
+        return None
+    max_age = cache_control.s_maxage
+    if max_age is None:
+        max_age = cache_control.max_age
+    if not max_age or max_age <= 0:
+        return None
+    return max_age
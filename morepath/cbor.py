@@ -0,0 +1,243 @@
+"""A small CBOR encoder and decoder.
+
+`CBOR`_ is a compact binary format for the same kind of data as JSON.
+Morepath uses this module to render ``json`` views as CBOR if the
+client asks for it, see :func:`morepath.view.render_json`.
+
+Only the data model of JSON is supported, plus byte strings: ``None``,
+booleans, integers that fit in 64 bits, floats, text, bytes, lists,
+tuples and dicts. Floats are always encoded in 64 bits. The decoder
+also understands 16 and 32 bit floats and strings, arrays and maps of
+indefinite length. Tags are skipped: the tagged item is decoded as if
+it had no tag.
+
+.. _CBOR: https://tools.ietf.org/html/rfc7049
+"""
+
+import struct
+
+from . import compat
+
+
+UNSIGNED = 0
+NEGATIVE = 1
+BYTES = 2
+TEXT = 3
+ARRAY = 4
+MAP = 5
+TAG = 6
+SIMPLE = 7
+
+FALSE = 0xf4
+TRUE = 0xf5
+NULL = 0xf6
+FLOAT64 = 0xfb
+BREAK = 0xff
+
+INDEFINITE = 31
+
+
+def dumps(obj):
+    """Encode object as CBOR.
+
+    :param obj: the object to encode.
+    :return: bytes.
+    :raises TypeError: if the object or an object in it cannot be
+      encoded.
+    :raises ValueError: if an integer does not fit in 64 bits.
+    """
+    result = bytearray()
+    encode(obj, result)
+    return bytes(result)
+
+
+def loads(data):
+    """Decode CBOR.
+
+    :param data: bytes.
+    :return: the decoded object.
+    :raises ValueError: if the data is not valid CBOR.
+    """
+    data = bytearray(data)
+    try:
+        obj, offset = decode(data, 0)
+    except (IndexError, struct.error):
+        raise ValueError("CBOR data is truncated")
+    except TypeError:
+        # an array or map as a map key, or a string of mixed chunks
+        raise ValueError("CBOR data is invalid")
+    except RuntimeError:
+        # the recursion limit was hit
+        raise ValueError("CBOR data is nested too deeply")
+    if offset != len(data):
+        raise ValueError("Extra data after CBOR item")
+    return obj
+
+
+def encode(obj, result):
+    """Encode object and append it to result.
+
+    :param obj: the object to encode.
+    :param result: a bytearray.
+    """
+    if obj is None:
+        result.append(NULL)
+    elif obj is True:
+        result.append(TRUE)
+    elif obj is False:
+        result.append(FALSE)
+    elif isinstance(obj, compat.integer_types):
+        if obj >= 0:
+            encode_head(UNSIGNED, obj, result)
+        else:
+            encode_head(NEGATIVE, -1 - obj, result)
+    elif isinstance(obj, float):
+        result.append(FLOAT64)
+        result += struct.pack('>d', obj)
+    elif isinstance(obj, compat.string_types):
+        if not isinstance(obj, compat.text_type):
+            # Python 2 str
+            obj = obj.decode('utf-8')
+        data = obj.encode('utf-8')
+        encode_head(TEXT, len(data), result)
+        result += data
+    elif isinstance(obj, (bytes, bytearray)):
+        encode_head(BYTES, len(obj), result)
+        result += obj
+    elif isinstance(obj, (list, tuple)):
+        encode_head(ARRAY, len(obj), result)
+        for item in obj:
+            encode(item, result)
+    elif isinstance(obj, dict):
+        encode_head(MAP, len(obj), result)
+        for key, value in obj.items():
+            encode(key, result)
+            encode(value, result)
+    else:
+        raise TypeError("%r is not CBOR serializable" % (obj,))
+
+
+def encode_head(major, value, result):
+    if value < 24:
+        result.append(major << 5 | value)
+    elif value < 0x100:
+        result.append(major << 5 | 24)
+        result.append(value)
+    elif value < 0x10000:
+        result.append(major << 5 | 25)
+        result += struct.pack('>H', value)
+    elif value < 0x100000000:
+        result.append(major << 5 | 26)
+        result += struct.pack('>I', value)
+    elif value < 0x10000000000000000:
+        result.append(major << 5 | 27)
+        result += struct.pack('>Q', value)
+    else:
+        raise ValueError("Integer does not fit in 64 bits: %s" % value)
+
+
+def decode(data, offset):
+    """Decode item.
+
+    :param data: bytearray.
+    :param offset: offset of the item in data.
+    :return: tuple of the decoded item and the offset after it.
+    """
+    initial = data[offset]
+    offset += 1
+    major = initial >> 5
+    info = initial & 0x1f
+    if major == SIMPLE:
+        return decode_simple(data, offset, info)
+    if info == INDEFINITE:
+        return decode_indefinite(data, offset, major)
+    value, offset = decode_argument(data, offset, info)
+    if major == UNSIGNED:
+        return value, offset
+    if major == NEGATIVE:
+        return -1 - value, offset
+    if major == BYTES or major == TEXT:
+        end = offset + value
+        if end > len(data):
+            raise ValueError("CBOR data is truncated")
+        chunk = bytes(data[offset:end])
+        if major == TEXT:
+            chunk = chunk.decode('utf-8')
+        return chunk, end
+    if major == ARRAY:
+        result = []
+        for i in range(value):
+            item, offset = decode(data, offset)
+            result.append(item)
+        return result, offset
+    if major == MAP:
+        result = {}
+        for i in range(value):
+            key, offset = decode(data, offset)
+            result[key], offset = decode(data, offset)
+        return result, offset
+    # a tag; we don't interpret it
+    return decode(data, offset)
+
+
+def decode_argument(data, offset, info):
+    if info < 24:
+        return info, offset
+    if info == 24:
+        return data[offset], offset + 1
+    if info == 25:
+        return struct.unpack_from('>H', data, offset)[0], offset + 2
+    if info == 26:
+        return struct.unpack_from('>I', data, offset)[0], offset + 4
+    if info == 27:
+        return struct.unpack_from('>Q', data, offset)[0], offset + 8
+    raise ValueError("Invalid CBOR additional information: %s" % info)
+
+
+def decode_simple(data, offset, info):
+    if info == 20:
+        return False, offset
+    if info == 21:
+        return True, offset
+    if info == 22 or info == 23:
+        # null and undefined
+        return None, offset
+    if info == 25:
+        return decode_half(struct.unpack_from('>H', data, offset)[0]), \
+            offset + 2
+    if info == 26:
+        return struct.unpack_from('>f', data, offset)[0], offset + 4
+    if info == 27:
+        return struct.unpack_from('>d', data, offset)[0], offset + 8
+    raise ValueError("Unsupported CBOR simple value: %s" % info)
+
+
+def decode_half(half):
+    exponent = (half >> 10) & 0x1f
+    mantissa = half & 0x3ff
+    if exponent == 0:
+        value = mantissa * 2.0 ** -24
+    elif exponent == 0x1f:
+        value = float('inf') if mantissa == 0 else float('nan')
+    else:
+        value = (mantissa + 1024) * 2.0 ** (exponent - 25)
+    if half & 0x8000:
+        return -value
+    return value
+
+
+def decode_indefinite(data, offset, major):
+    items = []
+    while data[offset] != BREAK:
+        item, offset = decode(data, offset)
+        items.append(item)
+    offset += 1
+    if major == BYTES:
+        return b''.join(items), offset
+    if major == TEXT:
+        return u''.join(items), offset
+    if major == ARRAY:
+        return items, offset
+    if major == MAP:
+        return dict(zip(items[::2], items[1::2])), offset
+    raise ValueError("Invalid indefinite length CBOR item")
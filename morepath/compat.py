@@ -27,6 +27,60 @@ else:
     string_types = (basestring,)
 
 
+# integer_types can be used in isinstance to determine
+# whether an object is an integer
+if PY3:
+    integer_types = (int,)  # pragma: nocoverage
+else:
+    integer_types = (int, long)
+
+
+# iscoroutine determines whether an object is the coroutine returned
+# by an async def function; there are none before Python 3.5
+try:
+    from inspect import iscoroutine  # pragma: nocoverage
+except ImportError:
+    def iscoroutine(obj):
+        return False
+
+
+# ContextVar holds state per thread and per asyncio task; before
+# Python 3.7 we fall back on a thread-local with the same API
+try:
+    from contextvars import ContextVar  # pragma: nocoverage
+except ImportError:
+    import threading
+
+    _MISSING = object()
+
+    class ContextVar(object):
+        def __init__(self, name, default=_MISSING):
+            self.name = name
+            self.default = default
+            self.local = threading.local()
+
+        def get(self, default=_MISSING):
+            value = getattr(self.local, 'value', _MISSING)
+            if value is _MISSING:
+                value = self.default if default is _MISSING else default
+            if value is _MISSING:
+                raise LookupError(self.name)
+            return value
+
+        def set(self, value):
+            token = Token(self, getattr(self.local, 'value', _MISSING))
+            self.local.value = value
+            return token
+
+        def reset(self, token):
+            self.local.value = token.old_value
+
+    class Token(object):
+        def __init__(self, var, old_value):
+            self.var = var
+            self.old_value = old_value
+
+
 # XXX we don't want to use this in too many places, as the isinstance
 # checks may slow us down like in werkzeug
 def bytes_(s, encoding='latin-1', errors='strict'):
@@ -0,0 +1,111 @@
+"""Compression of responses.
+
+Used by the compression tween, see
+:func:`morepath.core.compression_tween_factory`.
+"""
+
+import zlib
+
+from .static import negotiate_encoding
+
+
+# window bits for zlib.compressobj
+WBITS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+
+
+def compress_response(request, response, settings):
+    """Compress response if it is compressible and the client accepts it.
+
+    A response is compressible if it has a body of at least
+    ``min_size`` bytes, or a streamed body, and a content type that
+    starts with ``text/``, ends with ``+json`` or ``+xml``, or is in
+    ``content_types``. Responses with a ``Content-Encoding`` are
+    already compressed, and responses with ``Cache-Control:
+    no-transform`` are left alone.
+
+    The ``Vary`` header of a compressible response gets
+    ``Accept-Encoding``, whether it is compressed or not. A strong ETag
+    of a compressed response becomes weak, as the compressed body
+    differs from the original.
+
+    :param request: :class:`morepath.Request` instance.
+    :param response: :class:`morepath.Response` instance, which is
+      changed in place.
+    :param settings: the ``compression`` settings section.
+    """
+    if not is_compressible(response, settings):
+        return
+    response.vary = tuple(response.vary or ()) + ('Accept-Encoding',)
+    if request.method == 'HEAD':
+        return
+    encoding = negotiate_encoding(request, ['gzip', 'deflate'])
+    if encoding is None:
+        return
+    compressor = zlib.compressobj(settings.level, zlib.DEFLATED,
+                                  WBITS[encoding])
+    app_iter = response.app_iter
+    if isinstance(app_iter, (list, tuple)):
+        # the body is in memory already, so we can give its length
+        body = b''.join(compressed_chunks(app_iter, compressor, False))
+        response.app_iter = [body]
+        response.content_length = len(body)
+    else:
+        response.app_iter = compressed_chunks(app_iter, compressor, True)
+        response.content_length = None
+    response.content_encoding = encoding
+    etag = response.headers.get('ETag')
+    if etag is not None and not etag.startswith('W/'):
+        response.headers['ETag'] = 'W/' + etag
+
+
+def is_compressible(response, settings):
+    """Check whether response should be compressed.
+
+    :param response: :class:`morepath.Response` instance.
+    :param settings: the ``compression`` settings section.
+    :return: ``True`` if the response should be compressed.
+    """
+    if (response.status_code < 200 or response.status_code in (204, 206) or
+            response.content_encoding is not None or
+            response.cache_control.no_transform):
+        return False
+    content_type = response.content_type
+    if content_type is None or not (
+            content_type.startswith('text/') or
+            content_type.endswith(('+json', '+xml')) or
+            content_type in settings.content_types):
+        return False
+    if isinstance(response.app_iter, (list, tuple)):
+        size = sum(len(chunk) for chunk in response.app_iter)
+    else:
+        size = response.content_length
+    return size is None or size >= settings.min_size
+
+
+def compressed_chunks(app_iter, compressor, flush):
+    """Compress chunks of bytes.
+
+    :param app_iter: iterable of bytes. It is closed when done, if it
+      has a ``close`` method.
+    :param compressor: a zlib compression object.
+    :param flush: flush the compressor after each chunk, so that
+      a streamed response reaches the client as it is produced.
+    :return: generator of compressed bytes.
+    """
+    try:
+        for chunk in app_iter:
+            if not chunk:
+                continue
+            data = compressor.compress(chunk)
+            if flush:
+                data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        close = getattr(app_iter, 'close', None)
+        if close is not None:
+            close()
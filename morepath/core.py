@@ -12,9 +12,20 @@ It uses Morepath directives to configure:
 * a tween that catches exceptions raised by application code
   and looks up an exception view for it.
 
+* a tween that answers requests from the response cache, if enabled.
+
+* a tween that lets concurrent identical requests share one response,
+  if enabled.
+
+* a tween that compresses responses, if enabled.
+
 * a default exception view for HTTP exceptions defined by
   :mod:`webob.exc`, i.e. subclasses of :class:`webob.exc.HTTPException`.
 
+* the path and view of the files served by :class:`morepath.AssetApp`.
+
+* default settings for Morepath itself.
+
 """
 
 import dectate
@@ -35,6 +46,8 @@ from .app import App
 from .view import View
 from .request import Request, Response
 from .converter import Converter, IDENTITY_CONVERTER
+from .static import AssetApp, AssetFile, asset_response
+from .compress import compress_response
 
 
 @App.predicate(generic.view, name='model', default=None, index=ClassIndex)
@@ -124,31 +137,199 @@ def datetime_converter():
     return Converter(datetime_decode, datetime_encode)
 
 
+@App.setting_section(section='identity_cache')
+def identity_cache_settings():
+    return {
+        'enabled': False,
+        'ttl': 300,
+        'max_size': 10000,
+    }
+
+
+@App.setting_section(section='response_cache')
+def response_cache_settings():
+    return {
+        'enabled': False,
+        'max_bytes': 64 * 1024 * 1024,
+        'shared_path': None,
+        'shared_slots': 1024,
+        'shared_slot_size': 64 * 1024,
+    }
+
+
+@App.setting_section(section='json')
+def json_settings():
+    return {
+        'backend': 'json',
+        'dump_nested': False,
+        'sparse_fields': False,
+        'negotiate': False,
+    }
+
+
+@App.setting_section(section='template_cache')
+def template_cache_settings():
+    return {
+        'auto_reload': False,
+        'precompile': True,
+        'threads': 0,
+    }
+
+
+@App.setting_section(section='fragment_cache')
+def fragment_cache_settings():
+    return {
+        'max_size': 1000,
+        'ttl': 300,
+        'version_attribute': 'version',
+    }
+
+
+@App.setting_section(section='assets')
+def assets_settings():
+    return {
+        'max_age': 0,
+        'immutable_max_age': 365 * 24 * 60 * 60,
+    }
+
+
+@App.setting_section(section='request_body')
+def request_body_settings():
+    return {
+        'max_size': None,
+        'spool_size': 1024 * 1024,
+        'chunk_size': 64 * 1024,
+    }
+
+
+@App.setting_section(section='asgi')
+def asgi_settings():
+    return {
+        'threads': None,
+    }
+
+
+@App.setting_section(section='compression')
+def compression_settings():
+    return {
+        'enabled': False,
+        'level': 6,
+        'min_size': 1024,
+        'content_types': [
+            'application/json',
+            'application/javascript',
+            'application/xml',
+            'image/svg+xml',
+        ],
+    }
+
+
+@App.setting_section(section='single_flight')
+def single_flight_settings():
+    return {
+        'enabled': False,
+        'timeout': 30,
+    }
+
+
 @App.tween_factory()
 def excview_tween_factory(app, handler):
     def excview_tween(request):
         try:
             response = handler(request)
         except Exception as exc:
-            # we must use component_key_dict here because we
-            # do not want the request to feature in the lookup;
-            # we don't want its request method or name to influence
-            # exception lookup
-            view = generic.view.component_key_dict(model=exc.__class__,
-                                                   lookup=request.lookup)
+            view = exception_view(request, exc)
             if view is None:
                 raise
-
-            # we don't want to run any after already set in the exception view
-            if not isinstance(exc, (HTTPOk, HTTPRedirection)):
-                request.clear_after()
-
             return view(exc, request)
         return response
     return excview_tween
 
 
+def exception_view(request, exc):
+    """Look up the view for an exception raised for request.
+
+    :param request: :class:`morepath.Request` instance.
+    :param exc: the exception.
+    :return: the view, or ``None`` if there is no view for the exception.
+    """
+    # we must use component_key_dict here because we
+    # do not want the request to feature in the lookup;
+    # we don't want its request method or name to influence
+    # exception lookup
+    view = generic.view.component_key_dict(model=exc.__class__,
+                                           lookup=request.lookup)
+    if view is None:
+        return None
+
+    # we don't want to run any after already set in the exception view
+    if not isinstance(exc, (HTTPOk, HTTPRedirection)):
+        request.clear_after()
+    return view
+
+
+@App.tween_factory(over=excview_tween_factory)
+def response_cache_tween_factory(app, handler):
+    response_cache = app.response_cache
+    if response_cache is None:
+        return handler
+
+    def response_cache_tween(request):
+        method = request.method
+        if method not in ('GET', 'HEAD'):
+            response = handler(request)
+            # a successful unsafe request may have changed the resource
+            if 200 <= response.status_code <= 399:
+                response_cache.invalidate(request.path)
+            return response
+        response = response_cache.get(request)
+        if response is not None:
+            return response
+        response = handler(request)
+        response_cache.store(request, response)
+        return response
+    return response_cache_tween
+
+
+@App.tween_factory(over=excview_tween_factory,
+                   under=response_cache_tween_factory)
+def single_flight_tween_factory(app, handler):
+    single_flight = app.single_flight
+    if single_flight is None:
+        return handler
+
+    def single_flight_tween(request):
+        if request.method not in ('GET', 'HEAD'):
+            return handler(request)
+        return single_flight.handle(request, handler)
+    return single_flight_tween
+
+
+@App.tween_factory(over=response_cache_tween_factory)
+def compression_tween_factory(app, handler):
+    settings = app.settings.compression
+    if not settings.enabled:
+        return handler
+
+    def compression_tween(request):
+        response = handler(request)
+        compress_response(request, response, settings)
+        return response
+    return compression_tween
+
+
 @App.view(model=HTTPException)
 def standard_exception_view(self, model):
     # webob HTTPException is a response already
     return self
+
+
+@AssetApp.path(model=AssetFile, path='', absorb=True,
+               variables=lambda asset_file: {'absorb': asset_file.path})
+def get_asset_file(app, absorb):
+    return app.config.asset_registry.get(absorb)
+
+
+@AssetApp.view(model=AssetFile)
+def asset_file_default(self, request):
+    return asset_response(self, request)
@@ -37,11 +37,13 @@ import dectate
 
 from .app import App, RegRegistry
 from .security import Identity, NoIdentity, IdentityPolicyRegistry
-from .view import render_view, render_json, render_html, ViewRegistry
+from .view import (render_view, render_json, render_html, ViewRegistry,
+                   compile_json_fields, sparse_json)
 from .traject import Path
 from .converter import ConverterRegistry
 from .tween import TweenRegistry
 from .template import TemplateEngineRegistry
+from .static import AssetRegistry
 from .predicate import PredicateRegistry
 from .path import PathRegistry
 from . import generic
@@ -595,13 +597,93 @@ class TemplateLoaderAction(dectate.Action):
             self.extension, obj)
 
 
+@App.directive('template_compiler')
+class TemplateCompilerAction(dectate.Action):
+    config = {
+        'template_engine_registry': TemplateEngineRegistry
+    }
+
+    depends = [SettingAction, TemplateDirectoryAction]
+
+    def __init__(self, extension):
+        '''Register a template compiler.
+
+        This is an alternative to :meth:`App.template_loader` that
+        lets Morepath load and cache the templates with this
+        extension. The decorated function gets a ``path`` argument,
+        which is the absolute path of a template file, and a
+        ``settings`` argument. It should return the compiled template.
+
+        The ``loader`` passed to the function decorated by
+        :meth:`App.template_render` is then a
+        :class:`morepath.template.TemplateCache`; call its ``get``
+        method with the template name to get the compiled template.
+        Call it each time the template is rendered to pick up changed
+        templates when the ``auto_reload`` setting of the
+        ``template_cache`` section is enabled.
+
+        Unless the ``precompile`` setting is disabled, all templates
+        are compiled when the configuration is committed.
+
+        :param extension: the template file extension (``.pt``, etc)
+          this compiler handles.
+        '''
+        self.extension = extension
+
+    def identifier(self, template_engine_registry):
+        return self.extension
+
+    def perform(self, obj, template_engine_registry):
+        template_engine_registry.register_template_compiler(
+            self.extension, obj)
+
+    @staticmethod
+    def after(template_engine_registry):
+        template_engine_registry.precompile_templates()
+
+
+@App.directive('asset_directory')
+class AssetDirectoryAction(dectate.Action):
+    config = {
+        'asset_registry': AssetRegistry
+    }
+
+    def __init__(self):
+        '''Register the directory with the files an app serves.
+
+        Use this on a subclass of :class:`morepath.AssetApp`. The
+        decorated function gets no argument and should return a
+        relative or absolute path to a directory. If a relative path,
+        it is made absolute from the directory this module is in.
+
+        The files in the directory are indexed when the configuration
+        is committed: their contents are hashed to make fingerprinted
+        paths and ETags, and precompressed variants with ``.br`` or
+        ``.gz`` appended to their name are found.
+        '''
+
+    def identifier(self, asset_registry):
+        return ()
+
+    def perform(self, obj, asset_registry):
+        directory = obj()
+        if not os.path.isabs(directory):
+            directory = os.path.join(os.path.dirname(
+                self.code_info.path), directory)
+        asset_registry.register_asset_directory(directory)
+
+    @staticmethod
+    def after(asset_registry):
+        asset_registry.index_assets()
+
+
 @App.directive('template_render')
 class TemplateRenderAction(dectate.Action):
     config = {
         'template_engine_registry': TemplateEngineRegistry
     }
 
-    depends = [SettingAction, TemplateLoaderAction]
+    depends = [SettingAction, TemplateLoaderAction, TemplateCompilerAction]
 
     def __init__(self, extension):
         '''Register a template engine.
@@ -667,7 +749,8 @@ class ViewAction(dectate.Action):
 
     def __init__(self, model, render=None, template=None,
                  permission=None,
-                 internal=False, **predicates):
+                 internal=False, etag=None, last_modified=None,
+                 **predicates):
         '''Register a view for a model.
 
         The decorated function gets ``self`` (model instance) and
@@ -708,6 +791,19 @@ class ViewAction(dectate.Action):
           :meth:`morepath.Request.view`, but will not be published on
           the web. It will be as if the view is not there.
           By default a view is ``False``, so not internal.
+        :param etag: an optional function that gets ``self`` (model
+          instance) and ``request`` and returns the ETag of the model
+          as a string. For a GET or HEAD request with a matching
+          ``If-None-Match`` header a ``304 Not Modified`` response is
+          given without calling the view function. If ``True``, the
+          ETag is computed from the response body instead, which saves
+          bandwidth but not the work of rendering.
+        :param last_modified: an optional function that gets ``self``
+          (model instance) and ``request`` and returns a datetime or
+          timestamp for the last modification of the model. For a GET
+          or HEAD request with an ``If-Modified-Since`` header that is
+          not older a ``304 Not Modified`` response is given without
+          calling the view function.
         :param name: the name of the view as it appears in the URL. If omitted,
           it is the empty string, meaning the default view for the model.
           This is a predicate.
@@ -723,6 +819,8 @@ class ViewAction(dectate.Action):
         self.template = template
         self.permission = permission
         self.internal = internal
+        self.etag = etag
+        self.last_modified = last_modified
         self.predicates = predicates
 
     def key_dict(self):
@@ -737,7 +835,8 @@ class ViewAction(dectate.Action):
         view_registry.register_view(
             self.key_dict(), obj,
             self.render, self.template,
-            self.permission, self.internal)
+            self.permission, self.internal,
+            self.etag, self.last_modified)
 
 
 @App.directive('json')
@@ -745,7 +844,8 @@ class JsonAction(ViewAction):
     group_class = ViewAction
 
     def __init__(self, model, render=None, template=None, permission=None,
-                 internal=False, **predicates):
+                 internal=False, etag=None, last_modified=None,
+                 **predicates):
         """Register JSON view.
 
         This is like :meth:`morepath.App.view`, but with
@@ -753,7 +853,9 @@ class JsonAction(ViewAction):
         function.
 
         Transforms the view output to JSON and sets the content type to
-        ``application/json``.
+        ``application/json``. If the view returns an iterator, such as
+        a generator, the response body is a JSON array that is encoded
+        item by item while it is sent to the client.
 
         :param model: the class of the model for which this view is registered.
         :param name: the name of the view as it appears in the URL. If omitted,
@@ -777,6 +879,11 @@ class JsonAction(ViewAction):
           :meth:`morepath.Request.view`, but will not be published on
           the web. It will be as if the view is not there.
           By default a view is ``False``, so not internal.
+        :param etag: function to compute the ETag of the model, or ``True``
+          to compute it from the response body. See
+          :meth:`morepath.App.view`.
+        :param last_modified: function to compute the last modification
+          time of the model. See :meth:`morepath.App.view`.
         :param name: the name of the view as it appears in the URL. If omitted,
           it is the empty string, meaning the default view for the model.
           This is a predicate.
@@ -788,7 +895,8 @@ class JsonAction(ViewAction):
         """
         render = render or render_json
         super(JsonAction, self).__init__(model, render, template,
-                                         permission, internal, **predicates)
+                                         permission, internal, etag,
+                                         last_modified, **predicates)
 
 
 @App.directive('html')
@@ -796,7 +904,8 @@ class HtmlAction(ViewAction):
     group_class = ViewAction
 
     def __init__(self, model, render=None, template=None, permission=None,
-                 internal=False, **predicates):
+                 internal=False, etag=None, last_modified=None,
+                 **predicates):
         """Register HTML view.
 
         This is like :meth:`morepath.App.view`, but with
@@ -827,6 +936,11 @@ class HtmlAction(ViewAction):
           :meth:`morepath.Request.view`, but will not be published on
           the web. It will be as if the view is not there.
           By default a view is ``False``, so not internal.
+        :param etag: function to compute the ETag of the model, or ``True``
+          to compute it from the response body. See
+          :meth:`morepath.App.view`.
+        :param last_modified: function to compute the last modification
+          time of the model. See :meth:`morepath.App.view`.
         :param name: the name of the view as it appears in the URL. If omitted,
           it is the empty string, meaning the default view for the model.
           This is a predicate.
@@ -838,7 +952,8 @@ class HtmlAction(ViewAction):
         """
         render = render or render_html
         super(HtmlAction, self).__init__(model, render, template,
-                                         permission, internal, **predicates)
+                                         permission, internal, etag,
+                                         last_modified, **predicates)
 
 
 # used by Mount to make sure there's at least a model to filter in a query
@@ -952,17 +1067,21 @@ tween_factory_id = 0
 @App.directive('tween_factory')
 class TweenFactoryAction(dectate.Action):
     config = {
-        'tween_registry': TweenRegistry
+        'tween_registry': TweenRegistry,
+        'path_registry': PathRegistry
     }
 
-    depends = [SettingAction]
+    depends = [SettingAction, PathAction]
 
     filter_convert = {
         'under': dectate.convert_dotted_name,
         'over': dectate.convert_dotted_name,
+        'model': dectate.convert_dotted_name,
+        'exclude': dectate.convert_bool,
     }
 
-    def __init__(self, under=None, over=None, name=None):
+    def __init__(self, under=None, over=None, name=None,
+                 model=None, path=None, exclude=False):
         '''Register tween factory.
 
         The tween system allows the creation of lightweight middleware
@@ -978,6 +1097,12 @@ class TweenFactoryAction(dectate.Action):
         Tween factories can be set to be over or under each other to
         control the order in which the produced tweens are wrapped.
 
+        A tween can be restricted to the routes of particular models
+        or paths using ``model`` and ``path``. Requests for other
+        routes do not pass through the tween at all. The route is
+        determined by matching the request path against the paths of
+        the app, without instantiating any model.
+
         :param under: This tween factory produces a tween that wants to
           be wrapped by the tween produced by the ``under`` tween factory.
           Optional.
@@ -986,6 +1111,14 @@ class TweenFactoryAction(dectate.Action):
         :param name: The name under which to register this tween factory,
           so that it can be overridden by applications that extend this one.
           If no name is supplied a default name is generated.
+        :param model: Only use this tween for routes registered for this
+          model class or its subclasses. Pass a mounted app class to
+          restrict the tween to that mounted app. Optional.
+        :param path: Only use this tween for the route registered with
+          this path, or list of paths, as given to :meth:`App.path` or
+          :meth:`App.mount`. Optional.
+        :param exclude: If ``True``, use this tween for all routes except
+          those matched by ``model`` or ``path``. Optional.
         '''
         global tween_factory_id
         self.under = under
@@ -994,13 +1127,21 @@ class TweenFactoryAction(dectate.Action):
             name = u'tween_factory_%s' % tween_factory_id
             tween_factory_id += 1
         self.name = name
+        self.model = model
+        self.path = path
+        self.exclude = exclude
 
-    def identifier(self, tween_registry):
+    def identifier(self, tween_registry, path_registry):
         return self.name
 
-    def perform(self, obj, tween_registry):
+    def perform(self, obj, tween_registry, path_registry):
         tween_registry.register_tween_factory(
-            obj, over=self.over, under=self.under)
+            obj, over=self.over, under=self.under,
+            model=self.model, path=self.path, exclude=self.exclude)
+
+    @staticmethod
+    def after(tween_registry, path_registry):
+        tween_registry.resolve_routes(path_registry)
 
 
 @App.private_action_class
@@ -1052,6 +1193,8 @@ class IdentityPolicyAction(dectate.Composite):
                                            'remember'), obj
         yield IdentityPolicyFunctionAction(generic.forget_identity,
                                            'forget'), obj
+        yield IdentityPolicyFunctionAction(generic.identity_credential,
+                                           'credential'), obj
 
 
 @App.directive('verify_identity')
@@ -1103,7 +1246,7 @@ class DumpJsonAction(dectate.Action):
         'model': isbaseclass
     }
 
-    def __init__(self, model=object):
+    def __init__(self, model=object, fields=None, type_name=None):
         '''Register a function that converts model to JSON.
 
         The decorated function gets ``self`` (model instance) and
@@ -1116,16 +1259,31 @@ class DumpJsonAction(dectate.Action):
           registered. The ``self`` passed into the function is an instance
           of the model (or of a subclass). By default the model is ``object``,
           meaning we register a function for all model classes.
+        :param fields: an optional list of attribute names. The JSON
+          object is then a dict with these attributes of the model
+          instance, plus the entries of the dict returned by the
+          decorated function, which may also return ``None``. This is
+          compiled into a fast function when the configuration is
+          committed.
+        :param type_name: the name of the type of the model in
+          sparse fieldsets, as in ``fields[type_name]=a,b`` in the URL.
+          By default the name of the model class. See
+          :attr:`morepath.Request.sparse_fields`.
         '''
         self.model = model
+        self.fields = fields
+        if type_name is None:
+            type_name = model.__name__
+        self.type_name = type_name
 
     def identifier(self, reg_registry):
         return self.model
 
     def perform(self, obj, reg_registry):
-        # reverse parameters
-        def dump(request, self):
-            return obj(self, request)
+        if self.fields is not None:
+            dump = compile_json_fields(self.fields, obj, self.type_name)
+        else:
+            dump = sparse_json(obj, self.type_name)
         reg_registry.register_function(generic.dump_json, dump, obj=self.model)
 
 
@@ -96,6 +96,19 @@ def identify(request):
     return None
 
 
+@reg.dispatch()
+def identity_credential(request):
+    """Get the credential the identity of a request is established from.
+
+    This is used as the key of the verified identity cache.
+
+    :param: a :class:`morepath.Request` instance.
+    :return: a hashable credential, such as the token in a cookie or
+      header, or ``None`` if the request does not carry one.
+    """
+    return None
+
+
 @reg.dispatch('identity')
 def verify_identity(identity):
     """Returns True if the claimed identity can be verified.
@@ -3,20 +3,63 @@
 You can control this behavior from here.
 :func:`morepath.enable_implicit` and :func:`morepath.disable_implicit`
 are exported to the public API.
+
+Reg keeps the implicit lookup in a thread-local. Morepath replaces
+that with a context variable, so that the implicit lookup is also
+correct for coroutines that run concurrently in a single thread, see
+:class:`morepath.asgi.ASGIHandler`.
 """
 
 from reg import implicit
 
+from .compat import ContextVar
+
 _implicit_enabled = True
 
 
+class ContextLocal(object):
+    """Stand-in for the thread-local of :data:`reg.implicit`.
+
+    The lookup is stored in a context variable. If it was never set in
+    the current context, it is the base lookup of :data:`reg.implicit`.
+    """
+    def __init__(self):
+        self.var = ContextVar('morepath.implicit.lookup')
+
+    @property
+    def lookup(self):
+        return self.var.get(implicit.base_lookup)
+
+    @lookup.setter
+    def lookup(self, value):
+        self.var.set(value)
+
+
 def set_implicit(lookup):
     """Set the implicit :class:`reg.Lookup` to use for generic dispatch.
 
+    The lookup is set for the current context only: the current thread,
+    or the current asyncio task.
+
     :lookup: :class:`reg.Lookup` instance.
+    :return: a token to pass to :func:`reset_implicit` to restore the
+      previous lookup, or ``None`` if implicit lookups are disabled.
     """
     if _implicit_enabled:
-        implicit.lookup = lookup
+        local = implicit.local
+        if not isinstance(local, ContextLocal):
+            # reg.implicit was (re)initialized
+            local = implicit.local = ContextLocal()
+        return local.var.set(lookup)
+
+
+def reset_implicit(token):
+    """Restore the implicit lookup from before :func:`set_implicit`.
+
+    :token: the token returned by :func:`set_implicit`.
+    """
+    if token is not None:
+        token.var.reset(token)
 
 
 def enable_implicit():
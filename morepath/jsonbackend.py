@@ -0,0 +1,149 @@
+"""JSON backends.
+
+Morepath encodes and decodes JSON with a backend selected by the
+``backend`` setting of the ``json`` setting section. A backend has a
+``dumps`` method that encodes an object to UTF-8 bytes, and a
+``loads`` method that decodes JSON bytes.
+
+The standard library :mod:`json` module is always available. The
+faster `orjson`_ and `ujson`_ libraries are used if they are
+installed and selected.
+
+There are also binary backends, that encode the same data as
+`MessagePack`_ if the ``msgpack`` library is installed, and as CBOR
+with :mod:`morepath.cbor`. These are used if the ``negotiate``
+setting of the ``json`` section is enabled and the client asks for
+them.
+
+.. _orjson: https://pypi.org/project/orjson/
+
+.. _ujson: https://pypi.org/project/ujson/
+
+.. _MessagePack: https://msgpack.org/
+"""
+
+import json
+from collections import OrderedDict
+
+from . import cbor, compat
+from .error import ConfigError
+
+
+class JsonBackend(object):
+    """JSON backend.
+
+    :param name: name of the backend.
+    :param dumps: function that takes an object and returns JSON as
+      UTF-8 encoded bytes.
+    :param loads: function that takes JSON as bytes and returns an
+      object.
+    """
+    def __init__(self, name, dumps, loads):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+
+    def __repr__(self):
+        return '<JsonBackend %s>' % self.name
+
+
+def stdlib_backend():
+    def dumps(obj):
+        # ensure_ascii is on, so the result is ASCII as well as UTF-8
+        return json.dumps(obj).encode('ascii')
+
+    def loads(data):
+        return json.loads(data.decode('utf-8'))
+    return JsonBackend('json', dumps, loads)
+
+
+def orjson_backend():
+    import orjson
+    return JsonBackend('orjson', orjson.dumps, orjson.loads)
+
+
+def ujson_backend():
+    import ujson
+
+    def dumps(obj):
+        return ujson.dumps(obj, ensure_ascii=False).encode('utf-8')
+    return JsonBackend('ujson', dumps, ujson.loads)
+
+
+backend_factories = {
+    'json': stdlib_backend,
+    'orjson': orjson_backend,
+    'ujson': ujson_backend,
+}
+
+
+def get_json_backend(backend):
+    """Get JSON backend.
+
+    :param backend: the name of a backend: ``json``, ``orjson`` or
+      ``ujson``. ``auto`` selects the fastest backend that is
+      installed. It can also be a :class:`JsonBackend`, or another
+      object with ``dumps`` and ``loads`` methods, which is returned
+      as is.
+    :return: the backend.
+    """
+    if not isinstance(backend, compat.string_types):
+        return backend
+    if backend == 'auto':
+        for name in ['orjson', 'ujson']:
+            try:
+                return backend_factories[name]()
+            except ImportError:
+                pass
+        return stdlib_backend()
+    factory = backend_factories.get(backend)
+    if factory is None:
+        raise ConfigError("Unknown JSON backend: %s" % backend)
+    try:
+        return factory()
+    except ImportError:
+        raise ConfigError("JSON backend %s is not installed" % backend)
+
+
+def msgpack_backend():
+    import msgpack
+
+    def dumps(obj):
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def loads(data):
+        try:
+            return msgpack.unpackb(data, raw=False)
+        except TypeError as e:
+            # an array or map as a map key
+            raise ValueError(str(e))
+    return JsonBackend('msgpack', dumps, loads)
+
+
+def cbor_backend():
+    return JsonBackend('cbor', cbor.dumps, cbor.loads)
+
+
+_binary_backends = None
+
+
+def binary_backends():
+    """Get the available binary backends.
+
+    :return: an ordered dict with content types as keys and backends
+      as values, in order of preference. MessagePack is only included
+      if ``msgpack`` is installed; CBOR is always included.
+    """
+    global _binary_backends
+    if _binary_backends is None:
+        result = OrderedDict()
+        try:
+            backend = msgpack_backend()
+        except ImportError:
+            pass
+        else:
+            result['application/msgpack'] = backend
+            result['application/x-msgpack'] = backend
+        result['application/cbor'] = cbor_backend()
+        _binary_backends = result
+    return _binary_backends
@@ -79,6 +79,7 @@ class PathRegistry(TrajectRegistry):
         self.converter_registry = converter_registry
         self.mounted = {}
         self.named_mounted = {}
+        self.routes = {}
 
     def register_path(self, model, path,
                       variables, converters, required, get_converters,
@@ -130,8 +131,11 @@ class PathRegistry(TrajectRegistry):
         if variables is None:
             variables = get_variables_func(arguments, {})
 
-        self.add_pattern(path, (model_factory, parameter_factory),
-                         converters, absorb)
+        value = (model_factory, parameter_factory)
+        self.add_pattern(path, value, converters, absorb)
+        # remember what route a traject value stands for, so that
+        # route-specific tweens can be resolved
+        self.routes[value] = (path, model)
 
         inverse = Inverse(path, variables, converters, parameters.keys(),
                           absorb)
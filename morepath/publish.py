@@ -19,6 +19,7 @@ from webob.exc import HTTPNotFound
 from reg import mapply
 
 from .app import App
+from .request import resolve_coroutine
 from . import generic
 
 
@@ -69,10 +70,7 @@ def resolve_model(request):
         if not isinstance(next, App):
             return next
         # we found an app, make it the current app
-        next.set_implicit()
-        next.parent = app
-        request.app = next
-        request.lookup = next.lookup
+        enter_app(request, next)
         app = next
     # if there is nothing (left), we consume toward a root obj
     if not request.unconsumed:
@@ -94,6 +92,8 @@ def consume(app, request):
 
     Gets a factory function and uses matched path variables and URL parameters
     to construct the model instance (or :class:`morepath.App` instance).
+    If the factory is an ``async def`` function, its coroutine is run with
+    :func:`morepath.request.resolve_coroutine`.
 
     :param app: the :class:`morepath.App` instance that contains the
       path registry to use.
@@ -102,6 +102,28 @@ def consume(app, request):
     :return: The new model object, or a mounted :class:`morepath.App`
       instance, or ``None`` if no new instance could be found.
     """
+    match = match_path(app, request)
+    if match is None:
+        return None
+    get_obj, variables, stack = match
+    next_obj = resolve_coroutine(request, mapply(get_obj, **variables))
+    if next_obj is None:
+        return None
+    request.unconsumed = stack
+    return next_obj
+
+
+def match_path(app, request):
+    """Match path segments from request against the path configuration.
+
+    :param app: the :class:`morepath.App` instance that contains the
+      path registry to use.
+    :param request: :class:`morepath.Request` instance that contains the
+      path segments to match.
+    :return: a tuple with the factory function, the keyword arguments
+      to call it with and the path segments that are left over, or
+      ``None`` if the path does not match.
+    """
     value, stack, traject_variables = app.config.path_registry.consume(
         request.unconsumed)
     if value is None:
@@ -111,11 +133,19 @@ def consume(app, request):
     variables['request'] = request
     variables['app'] = app
     variables.update(traject_variables)
-    next_obj = mapply(get_obj, **variables)
-    if next_obj is None:
-        return None
-    request.unconsumed = stack
-    return next_obj
+    return get_obj, variables, stack
+
+
+def enter_app(request, app):
+    """Make a mounted application the current app of the request.
+
+    :param request: :class:`morepath.Request` instance.
+    :param app: the mounted :class:`morepath.App` instance.
+    """
+    app.set_implicit()
+    app.parent = request.app
+    request.app = app
+    request.lookup = app.lookup
 
 
 def resolve_response(obj, request):
@@ -4,19 +4,27 @@ Mostly documented in :class:`morepath.Request` and
 :class:`morepath.Response` in the public API.
 """
 
+import tempfile
+import threading
+from functools import partial
 from webob import BaseRequest, Response as BaseResponse
+from webob.exc import HTTPBadRequest, HTTPRequestEntityTooLarge
 
-from . import generic
+from . import compat, generic
+from .body import iter_json_array, iter_multipart, parse_header
+from .implicit import reset_implicit
 from .reify import reify
 from .traject import normalize_path, parse_path
 from .error import LinkError
+from .jsonbackend import binary_backends
 
 
 try:
-    from urllib.parse import urlencode, quote
+    from urllib.parse import urlencode, quote, urlsplit
 except ImportError:
     # Python 2
     from urllib import urlencode, quote
+    from urlparse import urlsplit
 import reg
 
 
@@ -49,6 +57,7 @@ class Request(BaseRequest):
         """
         self._after = []
         self._link_prefix_cache = {}
+        self._permits_cache = {}
 
     @reify
     def body_obj(self):
@@ -58,12 +67,183 @@ class Request(BaseRequest):
         how to transform JSON to a Python object. By default, no
         conversion takes place, and ``body_obj`` is identical to
         the ``json`` attribute.
+
+        If the ``negotiate`` setting of the ``json`` section is
+        enabled, a MessagePack or CBOR body is decoded as well, see
+        :func:`morepath.jsonbackend.binary_backends`.
+
+        :raises webob.exc.HTTPBadRequest: if a MessagePack or CBOR body
+          is not valid.
         """
-        if not self.body:
+        body = self._read_body()
+        if not body:
             return None
-        if self.content_type != 'application/json':
+        content_type = self.content_type
+        if content_type == 'application/json':
+            data = self.app.json_backend.loads(body)
+        elif (self.app.settings.json.negotiate and
+              content_type in binary_backends()):
+            try:
+                data = binary_backends()[content_type].loads(body)
+            except ValueError as e:
+                raise HTTPBadRequest(str(e))
+        else:
             return None
-        return generic.load_json(self, self.json, lookup=self.lookup)
+        return generic.load_json(self, data, lookup=self.lookup)
+
+    @reify
+    def spooled_body(self):
+        """Request body as a file.
+
+        The body is read in chunks and written to a temporary file,
+        which is kept in memory while it is smaller than the
+        ``spool_size`` setting of the ``request_body`` section.
+
+        :return: a file object, positioned at the start of the body.
+        :raises webob.exc.HTTPRequestEntityTooLarge: if the body is
+          larger than the ``max_size`` setting.
+        """
+        result = tempfile.SpooledTemporaryFile(
+            max_size=self.app.settings.request_body.spool_size)
+        for chunk in self.body_chunks():
+            result.write(chunk)
+        result.seek(0)
+        return result
+
+    def body_chunks(self):
+        """Read the request body in chunks.
+
+        The size of the chunks is the ``chunk_size`` setting of the
+        ``request_body`` section. If the body is larger than the
+        ``max_size`` setting, this fails before reading if the
+        ``Content-Length`` header says so, and otherwise as soon as too
+        much has been read.
+
+        :return: generator of bytes.
+        :raises webob.exc.HTTPRequestEntityTooLarge: if the body is
+          too large.
+        """
+        settings = self.app.settings.request_body
+        self._check_body_size()
+        if not self.is_body_readable:
+            return
+        body_file = self.body_file
+        size = 0
+        while True:
+            chunk = body_file.read(settings.chunk_size)
+            if not chunk:
+                return
+            size += len(chunk)
+            if settings.max_size is not None and size > settings.max_size:
+                raise HTTPRequestEntityTooLarge()
+            yield chunk
+
+    def json_items(self):
+        """Decode a JSON array body item by item.
+
+        Items are decoded as they arrive and passed through the
+        :meth:`App.load_json` function, like :attr:`body_obj`. The body
+        is not kept in memory as a whole, so this can be used for large
+        uploads. The standard library :mod:`json` decoder is used,
+        whatever the JSON backend of the app is.
+
+        :return: generator of objects.
+        :raises webob.exc.HTTPBadRequest: while iterating, if the body
+          is not a JSON array.
+        :raises webob.exc.HTTPRequestEntityTooLarge: while iterating,
+          if the body is too large.
+        """
+        try:
+            for item in iter_json_array(self.body_chunks()):
+                yield generic.load_json(self, item, lookup=self.lookup)
+        except ValueError as e:
+            raise HTTPBadRequest(str(e))
+
+    def multipart(self):
+        """Parse a ``multipart/form-data`` body part by part.
+
+        Unlike :attr:`POST`, which parses the whole body before
+        returning, this yields each part as soon as it has arrived.
+        The body of each part is spooled to a temporary file if it is
+        larger than the ``spool_size`` setting of the ``request_body``
+        section.
+
+        :return: generator of :class:`morepath.body.Part` instances.
+        :raises webob.exc.HTTPBadRequest: while iterating, if the body
+          is not ``multipart/form-data``.
+        :raises webob.exc.HTTPRequestEntityTooLarge: while iterating,
+          if the body is too large.
+        """
+        content_type, params = parse_header(
+            self.headers.get('Content-Type', u''))
+        boundary = params.get('boundary')
+        if content_type != 'multipart/form-data' or not boundary:
+            raise HTTPBadRequest("Expected multipart/form-data")
+        spool_size = self.app.settings.request_body.spool_size
+        try:
+            for part in iter_multipart(self.body_chunks(),
+                                       boundary.encode('latin-1'),
+                                       spool_size):
+                yield part
+        except ValueError as e:
+            raise HTTPBadRequest(str(e))
+
+    def _check_body_size(self):
+        max_size = self.app.settings.request_body.max_size
+        if (max_size is not None and self.content_length is not None and
+                self.content_length > max_size):
+            raise HTTPRequestEntityTooLarge()
+
+    def _read_body(self):
+        """Read the whole body, within the limit of ``max_size``."""
+        self._check_body_size()
+        if (self.content_length is None and self.is_body_readable and
+                self.app.settings.request_body.max_size is not None):
+            # we don't know the size beforehand, so check while reading
+            self.body = b''.join(self.body_chunks())
+        return self.body
+
+    @reify
+    def sparse_fields(self):
+        """Fields the client asks for in JSON output.
+
+        If the ``sparse_fields`` setting of the ``json`` section is
+        enabled, a client can ask for just some fields of the objects
+        of a type with a URL parameter like ``fields[Item]=id,title``,
+        as in JSON:API. A ``fields=id,title`` parameter applies to all
+        types that are not named in another parameter. The
+        :meth:`App.dump_json` functions then only return the requested
+        fields.
+
+        :return: a dict with type names (or ``None`` for ``fields``)
+          as keys and frozensets of field names as values. Empty if no
+          fields were requested or the setting is disabled.
+        """
+        result = {}
+        if not self.app.settings.json.sparse_fields:
+            return result
+        for key, value in self.GET.items():
+            if key == 'fields':
+                type_name = None
+            elif key.startswith('fields[') and key.endswith(']'):
+                type_name = key[len('fields['):-1]
+            else:
+                continue
+            result[type_name] = frozenset(
+                field.strip() for field in value.split(',') if field.strip())
+        return result
+
+    def _json_body__get(self):
+        """Request body decoded as JSON.
+
+        This uses the JSON backend of the app, see
+        :attr:`morepath.App.json_backend`.
+        """
+        return self.app.json_backend.loads(self._read_body())
+
+    json = json_body = property(_json_body__get,
+                                BaseRequest.json_body.fset,
+                                BaseRequest.json_body.fdel)
 
     @reify
     def identity(self):
@@ -78,16 +258,94 @@ class Request(BaseRequest):
 
         The identity can be used for authentication/authorization of
         the user, using Morepath permission directives.
+
+        If the identity cache is enabled in the ``identity_cache``
+        settings and the identity policy can extract a credential
+        from the request, a verified identity is cached by credential
+        and identification and verification are skipped while it is
+        cached. It is not cached beyond its
+        :attr:`morepath.Identity.expires`.
         """
         # XXX annoying circular dependency
         from .security import NO_IDENTITY
+        identity_cache = self.app.identity_cache
+        if identity_cache is not None:
+            credential = generic.identity_credential(self,
+                                                     lookup=self.lookup)
+            if credential is None:
+                identity_cache = None
+            else:
+                result = identity_cache.get(credential)
+                if result is not None:
+                    return result
         result = generic.identify(self, lookup=self.lookup)
         if result is None or result is NO_IDENTITY:
             return NO_IDENTITY
         if not generic.verify_identity(result, lookup=self.lookup):
             return NO_IDENTITY
+        if identity_cache is not None:
+            identity_cache.set(credential, result,
+                               getattr(result, 'expires', None))
         return result
 
+    def permits(self, obj, permission):
+        """Check whether the identity of this request has permission.
+
+        Uses :func:`morepath.generic.permits` with :attr:`identity`. The
+        outcome is cached for the rest of the request, so checking the
+        same permission for the same object again is cheap. If a
+        permission rule depends on state that changes during the
+        request, call :func:`morepath.generic.permits` directly instead.
+
+        :param obj: model object to check permission for.
+        :param permission: permission class.
+        :return: ``True`` if the identity has permission for ``obj``.
+        """
+        identity = self.identity
+        key = (id(identity), id(obj), permission, self.lookup)
+        cached = self._permits_cache.get(key)
+        if cached is not None:
+            return cached[1]
+        result = generic.permits(identity, obj, permission,
+                                 lookup=self.lookup)
+        # keep obj alive so that its id cannot be reused in this request
+        self._permits_cache[key] = (obj, result)
+        return result
+
+    def permitted(self, objs, permission):
+        """Filter objects by permission.
+
+        Like :meth:`permits`, but for a collection of objects. The
+        permission rule is looked up once for each model class in
+        ``objs`` and then applied to all its instances, so this is
+        much cheaper than checking each object separately.
+
+        :param objs: iterable of model objects.
+        :param permission: permission class.
+        :return: list of those objects in ``objs`` for which the identity
+          of this request has permission, in the original order.
+        """
+        identity = self.identity
+        rules = {}
+        result = []
+        for obj in objs:
+            rule = rules.get(obj.__class__)
+            if rule is None:
+                rule = rules[obj.__class__] = self._permission_rule(
+                    identity, obj, permission)
+            if rule(identity, obj, permission):
+                result.append(obj)
+        return result
+
+    def _permission_rule(self, identity, obj, permission):
+        rule = generic.permits.component(identity, obj, permission,
+                                         lookup=self.lookup)
+        if rule is None:
+            return generic.permits.wrapped_func
+        if 'lookup' in reg.arginfo(rule).args:
+            return partial(rule, lookup=self.lookup)
+        return rule
+
     def link_prefix(self):
         """Prefix to all links created by this request."""
         cached = self._link_prefix_cache.get(self.app.__class__)
@@ -117,6 +375,80 @@ class Request(BaseRequest):
           and the default ``request_method`` is ``GET``. If you introduce
           your own predicates you can specify your own default.
         """
+        return self._call_view(obj, default, app, predicates, False)
+
+    def fragment(self, obj, name='', default=None, app=SAME_APP,
+                 **predicates):
+        """Render view for model instance, with caching.
+
+        Unlike :meth:`view`, this renders the view, using the template
+        of the view if it has one, and returns the text of the result.
+        This is useful to include the output of an internal view in
+        the template of another view.
+
+        The text is cached in the fragment cache of the app class, for
+        the link to ``obj`` and the view name and predicates. If
+        ``obj`` has a ``version`` attribute (as named by the
+        ``version_attribute`` setting of the ``fragment_cache``
+        section), cached text is only used while the version stays the
+        same. Cached text expires after the ``ttl`` setting, and can be
+        removed with :meth:`invalidate_fragment`. Models that have no
+        link are rendered without caching.
+
+        The cache does not take the identity of the user into account,
+        so only use this for views that render the same for everybody.
+
+        :param obj: the model instance to render the view for.
+        :param name: the name of the view. If omitted, the default view.
+        :param default: default value if view is not found.
+        :param app: If set, change the application in which to look up
+          the view. See :meth:`view`.
+        :param predicates: extra predicates to modify view lookup.
+          See :meth:`view`.
+        :return: the rendered text.
+        """
+        cache_key = self._fragment_key(obj, name, app, predicates)
+        if cache_key is None:
+            return self._call_view(obj, default, app,
+                                   dict(predicates, name=name), True)
+        cache, key = cache_key
+        version_attribute = self.app.settings.fragment_cache.version_attribute
+        version = getattr(obj, version_attribute, None)
+        entry = cache.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        text = self._call_view(obj, None, app,
+                               dict(predicates, name=name), True)
+        if text is None:
+            return default
+        cache.set(key, (version, text))
+        return text
+
+    def invalidate_fragment(self, obj, name='', app=SAME_APP, **predicates):
+        """Remove cached text rendered by :meth:`fragment`.
+
+        :param obj: the model instance.
+        :param name: the name of the view. If omitted, the default view.
+        :param app: If set, change the application in which to look up
+          the view. See :meth:`view`.
+        :param predicates: extra predicates as passed to :meth:`fragment`.
+        """
+        cache_key = self._fragment_key(obj, name, app, predicates)
+        if cache_key is not None:
+            cache, key = cache_key
+            cache.invalidate(key)
+
+    def _fragment_key(self, obj, name, app, predicates):
+        try:
+            link = self.link(obj, name, app=app)
+        except LinkError:
+            return None
+        if app is SAME_APP:
+            app = self.app
+        cache = app.config.template_engine_registry.fragment_cache
+        return cache, (link, tuple(sorted(predicates.items())))
+
+    def _call_view(self, obj, default, app, predicates, render):
         if app is None:
             raise LinkError("Cannot view: app is None")
 
@@ -135,13 +467,19 @@ class Request(BaseRequest):
 
         old_app = self.app
         old_lookup = self.lookup
-        app.set_implicit()
+        token = app.set_implicit()
         self.app = app
         self.lookup = app.lookup
-        result = view.func(obj, self)
-        old_app.set_implicit()
-        self.app = old_app
-        self.lookup = old_lookup
+        try:
+            result = resolve_coroutine(self, view.func(obj, self))
+            if render:
+                if not isinstance(result, BaseResponse):
+                    result = view.render(result, self)
+                result = result.text
+        finally:
+            reset_implicit(token)
+            self.app = old_app
+            self.lookup = old_lookup
         return result
 
     def link(self, obj, name='', default=None, app=SAME_APP):
@@ -258,6 +596,29 @@ class Request(BaseRequest):
             result += '?' + fixed_urlencode(parameters, True)
         return result
 
+    def invalidate(self, obj, name='', app=SAME_APP):
+        """Remove cached responses for a view on a model instance.
+
+        This removes responses stored by the response cache for the
+        path :meth:`link` creates for ``obj``, for all URL parameters
+        and variants. If the response cache is not enabled, this does
+        nothing.
+
+        Note that the response cache already invalidates the request
+        path after a successful request with a method other than GET
+        or HEAD, such as a POST.
+
+        :param obj: the model instance whose cached responses to remove.
+        :param name: the name of the view. If omitted, the default view.
+        :param app: If set, change the application in which the link is
+          made. See :meth:`link`.
+        """
+        response_cache = self.app.root.response_cache
+        if response_cache is None:
+            return
+        response_cache.invalidate(
+            urlsplit(self.link(obj, name, app=app)).path)
+
     def resolve_path(self, path, app=SAME_APP):
         """Resolve a path to a model instance.
 
@@ -330,6 +691,56 @@ class Request(BaseRequest):
         self._after = []
 
 
+def resolve_coroutine(request, value):
+    """Get the result of a value that may be a coroutine.
+
+    Views and model factories can be ``async def`` functions, and then
+    return a coroutine. If the app is served with
+    :attr:`morepath.App.asgi`, these are awaited on the event loop of
+    the server, see :class:`morepath.asgi.ASGIHandler`; this function
+    is only used there if such a function is called from code that runs
+    in the thread pool, and then blocks that thread until the coroutine
+    finishes on the event loop of the server. With WSGI, the coroutine
+    is run on an event loop that is kept for the current thread, so
+    that resources that belong to a loop, such as database
+    connections, can be used by all coroutines of a request.
+
+    :param request: :class:`morepath.Request` instance.
+    :param value: the result of a view or model factory.
+    :return: the value, or its result if it is a coroutine.
+    :raises RuntimeError: if called from a coroutine, as the event loop
+      of the current thread would have to wait for itself.
+    """
+    if not compat.iscoroutine(value):
+        return value
+    import asyncio
+    if asyncio._get_running_loop() is not None:
+        value.close()
+        raise RuntimeError(
+            "Cannot wait for a coroutine in a thread that runs an "
+            "event loop; await it instead.")
+    loop = request.environ.get('morepath.event_loop')
+    if loop is not None:
+        return asyncio.run_coroutine_threadsafe(value, loop).result()
+    return thread_event_loop().run_until_complete(value)
+
+
+_thread_loops = threading.local()
+
+
+def thread_event_loop():
+    """Get the event loop for coroutines run in the current thread.
+
+    :return: an :class:`asyncio.AbstractEventLoop` that is created the
+      first time it is needed in a thread.
+    """
+    import asyncio
+    loop = getattr(_thread_loops, 'loop', None)
+    if loop is None or loop.is_closed():
+        loop = _thread_loops.loop = asyncio.new_event_loop()
+    return loop
+
+
 class Response(BaseResponse):
     """Response.
 
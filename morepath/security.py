@@ -6,12 +6,23 @@ directive.
 
 :data:`morepath.NO_IDENTITY`, :class:`morepath.Identity`,
 :class:`morepath.IdentityPolicy` are part of the public API.
+:class:`morepath.security.SignedTokenIdentityPolicy` is a stock
+identity policy that can be imported from here.
 """
 
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import time
+
 from reg import mapply
 
 from .app import RegRegistry
+from .cache import LRUCache
 from .settings import SettingRegistry
+from . import generic
 
 
 class NoIdentity(object):
@@ -34,6 +45,10 @@ class IdentityPolicyRegistry(object):
 
     Used by the :class:`morepath.App.identity_policy` directive.
 
+    If the ``identity_cache`` setting section has ``enabled`` set to
+    ``True``, this also creates the verified identity cache for the
+    app.
+
     :param reg_registry: a :class:`reg.Registry` instance.
     :param setting_registry: a :class:`morepath.settings.SettingRegistry`
       instance.
@@ -47,6 +62,7 @@ class IdentityPolicyRegistry(object):
         self.reg_registry = reg_registry
         self.setting_registry = setting_registry
         self.identity_policy = None
+        self.identity_cache = None
 
     def register_identity_policy_function(self, factory, dispatch, name):
         """Register a method from the identity policy as a function.
@@ -67,9 +83,42 @@ class IdentityPolicyRegistry(object):
             self.identity_policy = identity_policy = mapply(
                 factory,
                 settings=self.setting_registry)
-        self.reg_registry.register_function(
-            dispatch,
-            getattr(identity_policy, name))
+            self.identity_cache = self.create_identity_cache()
+        func = getattr(identity_policy, name, None)
+        if func is None:
+            # optional method not implemented by identity policy
+            return
+        if (dispatch is generic.forget_identity and
+                self.identity_cache is not None):
+            func = self.invalidating_forget(func)
+        self.reg_registry.register_function(dispatch, func)
+
+    def create_identity_cache(self):
+        """Create the verified identity cache if enabled in settings.
+
+        :return: a :class:`morepath.cache.LRUCache` instance, or ``None``.
+        """
+        settings = self.setting_registry.identity_cache
+        if not settings.enabled:
+            return None
+        return LRUCache(settings.max_size, settings.ttl)
+
+    def invalidating_forget(self, forget):
+        """Make ``forget`` remove the identity from the identity cache.
+
+        :param forget: the ``forget`` method of the identity policy.
+        :return: a function that invalidates the identity cache for the
+          credential of the request, then calls ``forget``.
+        """
+        identity_cache = self.identity_cache
+
+        def forget_identity(response, request):
+            credential = generic.identity_credential(
+                request, lookup=request.lookup)
+            if credential is not None:
+                identity_cache.invalidate(credential)
+            return forget(response, request)
+        return forget_identity
 
 
 class Identity(object):
@@ -78,6 +127,10 @@ class Identity(object):
     Note that this identity is just a claim; to authenticate the user
     and authorize them you need to implement Morepath permission directives.
     """
+    expires = None
+    """Time in seconds since the epoch when the identity expires, or
+    ``None``. The identity cache does not keep the identity longer."""
+
     def __init__(self, userid, **kw):
         """
         :param userid: The userid of this identity
@@ -121,6 +174,25 @@ class IdentityPolicy(object):
         """
         raise NotImplementedError()  # pragma: nocoverage
 
+    def credential(self, request):
+        """Extract the credential that identifies the user from request.
+
+        Implements ``morepath.generic.identity_credential``. This
+        method is optional. If it is implemented and the
+        ``identity_cache`` setting section has ``enabled`` set to
+        ``True``, verified identities are cached by credential, so
+        that :meth:`identify` and ``verify_identity`` are skipped for
+        requests with a known credential.
+
+        The credential must uniquely identify the identity, for
+        instance the signed token in a cookie or header.
+
+        :param request: Request to extract credential from.
+        :type request: :class:`morepath.Request`.
+        :return: a hashable credential, or ``None`` if there is none.
+        """
+        return None  # pragma: nocoverage
+
     def remember(self, response, request, identity):
         """Remember identity on response.
 
@@ -158,3 +230,147 @@ class IdentityPolicy(object):
 
         """
         raise NotImplementedError()  # pragma: nocoverage
+
+
+class SignedTokenIdentityPolicy(IdentityPolicy):
+    """Stateless identity policy based on signed tokens.
+
+    The identity is stored in a token that contains
+    :meth:`morepath.Identity.as_dict` as JSON and an expiry time,
+    signed with HMAC. The token is sent to the client in a cookie or,
+    if ``header_name`` is given, in a response header, and the client
+    sends it back in the same way.
+
+    No server-side state is needed and no I/O is done to establish
+    identity: a token that has a valid signature and has not expired
+    is trusted, so you can register a ``verify_identity`` that returns
+    ``True``. The extra keyword parameters of the identity must be
+    JSON-serializable.
+
+    Tokens are signed, not encrypted, so the client can read the
+    identity information in them.
+
+    :param secret: the secret key to sign tokens with.
+    :param max_age: seconds until a token expires.
+    :param cookie_name: the name of the cookie that holds the token.
+    :param header_name: if given, the token is sent in this header
+      instead of a cookie.
+    :param secure: only send the cookie over HTTPS.
+    :param httponly: don't let JavaScript access the cookie.
+    :param digestmod: the hash function used for the HMAC.
+    """
+    def __init__(self, secret, max_age=3600, cookie_name='auth_token',
+                 header_name=None, secure=False, httponly=True,
+                 digestmod=hashlib.sha256):
+        if not isinstance(secret, bytes):
+            secret = secret.encode('utf-8')
+        # keyed HMAC object that is copied for each signature, so the
+        # key is only processed once
+        self._hmac = hmac.new(secret, digestmod=digestmod)
+        self.max_age = max_age
+        self.cookie_name = cookie_name
+        self.header_name = header_name
+        self.secure = secure
+        self.httponly = httponly
+
+    def sign(self, payload):
+        """Create signature for payload.
+
+        :param payload: bytes to sign.
+        :return: signature as urlsafe base64 encoded bytes.
+        """
+        mac = self._hmac.copy()
+        mac.update(payload)
+        return base64.urlsafe_b64encode(mac.digest()).rstrip(b'=')
+
+    def create_token(self, identity):
+        """Create a signed token for identity.
+
+        :param identity: :class:`morepath.Identity` instance.
+        :return: the token as a text string.
+        """
+        data = {'identity': identity.as_dict(),
+                'expires': int(time.time()) + self.max_age}
+        payload = base64.urlsafe_b64encode(
+            json.dumps(data, separators=(',', ':'),
+                       sort_keys=True).encode('utf-8')).rstrip(b'=')
+        return (payload + b'.' + self.sign(payload)).decode('ascii')
+
+    def parse_token(self, token):
+        """Get identity from signed token.
+
+        :param token: the token as a text string.
+        :return: :class:`morepath.Identity` instance, or ``None`` if the
+          token is malformed, has an invalid signature or has expired.
+          The identity has the expiry time of the token as
+          :attr:`morepath.Identity.expires`.
+        """
+        try:
+            payload, signature = token.encode('ascii').rsplit(b'.', 1)
+        except (UnicodeError, ValueError):
+            return None
+        if not hmac.compare_digest(signature, self.sign(payload)):
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(
+                payload + b'=' * (-len(payload) % 4)).decode('utf-8'))
+            if data['expires'] <= time.time():
+                return None
+            info = dict(data['identity'])
+            userid = info.pop('userid')
+        except (binascii.Error, TypeError, ValueError, KeyError):
+            return None
+        identity = Identity(userid, **info)
+        identity.expires = data['expires']
+        return identity
+
+    def credential(self, request):
+        """Get token from request.
+
+        :param request: :class:`morepath.Request`.
+        :return: the token, or ``None`` if there is none.
+        """
+        if self.header_name is not None:
+            return request.headers.get(self.header_name)
+        return request.cookies.get(self.cookie_name)
+
+    def identify(self, request):
+        """Establish identity from the token in the request.
+
+        :param request: :class:`morepath.Request`.
+        :return: :class:`morepath.Identity` instance, or
+          :attr:`morepath.NO_IDENTITY` if there is no valid token.
+        """
+        token = self.credential(request)
+        if token is None:
+            return NO_IDENTITY
+        identity = self.parse_token(token)
+        if identity is None:
+            return NO_IDENTITY
+        return identity
+
+    def remember(self, response, request, identity):
+        """Store a token for identity on response.
+
+        :param response: :class:`morepath.Response`.
+        :param request: :class:`morepath.Request`.
+        :param identity: :class:`morepath.Identity` to remember.
+        """
+        token = self.create_token(identity)
+        if self.header_name is not None:
+            response.headers[self.header_name] = token
+            return
+        response.set_cookie(self.cookie_name, token, max_age=self.max_age,
+                            secure=self.secure, httponly=self.httponly)
+
+    def forget(self, response, request):
+        """Remove the token cookie.
+
+        With a header-based token there is nothing to remove; the
+        client should stop sending the token.
+
+        :param response: :class:`morepath.Response`.
+        :param request: :class:`morepath.Request`.
+        """
+        if self.header_name is None:
+            response.delete_cookie(self.cookie_name)
@@ -0,0 +1,403 @@
+"""Serving files.
+
+:class:`morepath.FileResponse` sends a file without reading it into
+memory.
+
+:class:`morepath.AssetApp` serves the files in a directory, which is
+indexed when the configuration is committed, see
+:meth:`morepath.App.asset_directory`.
+"""
+
+import hashlib
+import mimetypes
+import mmap
+import os
+from collections import OrderedDict
+
+from . import compat
+from .app import App
+from .request import Response
+
+
+BLOCK_SIZE = 64 * 1024
+
+# precompressed variants of an asset, in order of preference
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+FINGERPRINT_LENGTH = 16
+
+
+class FileResponse(Response):
+    """Response that sends the contents of a file.
+
+    Content-Length is set from the size of the file, and Last-Modified
+    and ETag from its modification time, if the file is on disk. The
+    response answers conditional requests with ``304 Not Modified``,
+    and ``Range`` requests with the requested part of the file.
+
+    If the WSGI server offers ``wsgi.file_wrapper``, the file is handed
+    to it, so that it can send the file with ``sendfile`` or a similar
+    mechanism. Otherwise it is sent in chunks of ``block_size`` bytes.
+
+    The file is closed when the response has been sent.
+
+    :param file: path of the file, or a file object opened in binary
+      mode. The whole file is sent, from the start.
+    :param content_type: the content type. By default it is guessed
+      from the file name, and is ``application/octet-stream`` if that
+      isn't possible.
+    :param block_size: the size of the chunks the file is read in.
+    :param kw: other keyword arguments for :class:`morepath.Response`.
+    """
+    def __init__(self, file, content_type=None, block_size=BLOCK_SIZE,
+                 **kw):
+        if isinstance(file, compat.string_types):
+            path = file
+            file = open(path, 'rb')
+        else:
+            path = getattr(file, 'name', None)
+        if content_type is None:
+            content_type, encoding = (
+                mimetypes.guess_type(path) if isinstance(
+                    path, compat.string_types) else (None, None))
+            if content_type is None or encoding is not None:
+                content_type = 'application/octet-stream'
+        super(FileResponse, self).__init__(
+            content_type=content_type, conditional_response=True, **kw)
+        try:
+            st = os.fstat(file.fileno())
+        except (AttributeError, OSError, IOError, ValueError):
+            # not a file on disk, such as io.BytesIO
+            file.seek(0, os.SEEK_END)
+            size = file.tell()
+        else:
+            size = st.st_size
+            self.last_modified = st.st_mtime
+            self.etag = '%x-%x' % (int(st.st_mtime), size)
+        file.seek(0)
+        self.app_iter = FileIter(file, size, block_size)
+        self.content_length = size
+
+    def __call__(self, environ, start_response):
+        app_iter = super(FileResponse, self).__call__(
+            environ, start_response)
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if (file_wrapper is not None and isinstance(app_iter, FileIter) and
+                app_iter.stop == app_iter.size):
+            # the server sends the rest of the file from the position
+            # it is at
+            app_iter.file.seek(app_iter.start)
+            return file_wrapper(app_iter.file, app_iter.block_size)
+        return app_iter
+
+
+class FileIter(object):
+    """Iterate over part of a file in chunks.
+
+    Used by :class:`FileResponse` as its app_iter.
+
+    :param file: file object opened in binary mode.
+    :param size: the size of the file.
+    :param block_size: the size of the chunks.
+    :param start: the position to start at.
+    :param stop: the position to stop at. By default the end of the
+      file.
+    """
+    def __init__(self, file, size, block_size=BLOCK_SIZE, start=0,
+                 stop=None):
+        self.file = file
+        self.size = size
+        self.block_size = block_size
+        self.start = start
+        self.stop = size if stop is None else min(stop, size)
+
+    def __iter__(self):
+        self.file.seek(self.start)
+        remaining = self.stop - self.start
+        while remaining > 0:
+            chunk = self.file.read(min(self.block_size, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+
+    def app_iter_range(self, start, stop):
+        """Used by WebOb to answer a ``Range`` request."""
+        return FileIter(self.file, self.size, self.block_size, start, stop)
+
+    def close(self):
+        self.file.close()
+
+
+class BufferIter(object):
+    """Iterate over part of a buffer in chunks of bytes.
+
+    :param buffer: a buffer such as a ``mmap``, or bytes.
+    :param block_size: the size of the chunks.
+    :param start: the position to start at.
+    :param stop: the position to stop at. By default the end of the
+      buffer.
+    """
+    def __init__(self, buffer, block_size=BLOCK_SIZE, start=0, stop=None):
+        self.buffer = buffer
+        self.block_size = block_size
+        self.start = start
+        size = len(buffer)
+        self.stop = size if stop is None else min(stop, size)
+
+    def __iter__(self):
+        for position in range(self.start, self.stop, self.block_size):
+            yield self.buffer[
+                position:min(position + self.block_size, self.stop)]
+
+    def app_iter_range(self, start, stop):
+        """Used by WebOb to answer a ``Range`` request."""
+        return BufferIter(self.buffer, self.block_size, start, stop)
+
+
+class AssetApp(App):
+    """App that serves the files in a directory.
+
+    Subclass it and give the directory with
+    :meth:`morepath.App.asset_directory`, and mount it in your
+    application.
+
+    A file is published under its path in the directory, and under a
+    fingerprinted path that contains a hash of its contents, such as
+    ``css/site.0123456789abcdef.css``. Link to files with
+    :meth:`AssetApp.asset` to get the fingerprinted path; as this path
+    changes when the file changes, the response can be cached forever.
+    """
+    def asset(self, name, fingerprinted=True):
+        """Get an asset to link to.
+
+        :param name: the path of the file relative to the asset
+          directory, with ``/`` as separator.
+        :param fingerprinted: link to the fingerprinted path.
+        :return: an :class:`AssetFile` to pass to
+          :meth:`morepath.Request.link`, together with this app.
+        :raises KeyError: if there is no such file.
+        """
+        return AssetFile(self.config.asset_registry.assets[name],
+                         fingerprinted)
+
+
+class AssetRegistry(object):
+    """Registry of the files served by an :class:`AssetApp`.
+
+    Used by the :meth:`morepath.App.asset_directory` directive.
+    """
+    def __init__(self):
+        self.directory = None
+        self.assets = {}
+        self._files = {}
+
+    def register_asset_directory(self, directory):
+        """Register the directory with the files to serve.
+
+        :param directory: absolute path of the directory.
+        """
+        self.directory = directory
+
+    def index_assets(self):
+        """Index the files in the asset directory.
+
+        This is done during commit. Files added or changed afterward
+        are not seen until the next commit.
+        """
+        if self.directory is None:
+            return
+        self.assets = index_directory(self.directory)
+        self._files = {}
+        for asset in self.assets.values():
+            self._files[asset.name] = AssetFile(asset, False)
+            self._files[asset.fingerprinted_name] = AssetFile(asset, True)
+
+    def get(self, path):
+        """Get the asset file published on a path.
+
+        :param path: the path relative to the asset directory, plain or
+          fingerprinted.
+        :return: an :class:`AssetFile`, or ``None`` if there is no file
+          on this path.
+        """
+        return self._files.get(path)
+
+
+class Asset(object):
+    """A file in the asset directory.
+
+    :param name: the path of the file relative to the asset directory,
+      with ``/`` as separator.
+    :param path: the absolute path of the file.
+    :param mtime: the modification time of the file.
+    :param digest: SHA-256 hash of the contents of the file, as hex.
+    :param encodings: ordered dict with the precompressed variants of
+      the file: the content encoding is the key, the absolute path the
+      value.
+    """
+    def __init__(self, name, path, mtime, digest, encodings):
+        self.name = name
+        self.path = path
+        self.mtime = mtime
+        self.digest = digest
+        self.encodings = encodings
+        self.fingerprinted_name = fingerprint_name(
+            name, digest[:FINGERPRINT_LENGTH])
+        content_type, encoding = mimetypes.guess_type(name)
+        if content_type is None or encoding is not None:
+            content_type = 'application/octet-stream'
+        self.content_type = content_type
+        self._buffers = {}
+
+    def buffer(self, encoding=None):
+        """Get the contents of the file, memory-mapped.
+
+        The file is mapped the first time it is needed, and stays
+        mapped.
+
+        :param encoding: the content encoding of a precompressed
+          variant, or ``None`` for the file itself.
+        :return: a ``mmap``, or bytes if the file is empty.
+        """
+        result = self._buffers.get(encoding)
+        if result is None:
+            path = self.path if encoding is None else self.encodings[encoding]
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    # an empty file cannot be mapped
+                    result = b''
+                else:
+                    result = mmap.mmap(f.fileno(), 0,
+                                       access=mmap.ACCESS_READ)
+            self._buffers[encoding] = result
+        return result
+
+
+class AssetFile(object):
+    """An asset as published by :class:`AssetApp`.
+
+    :param asset: the :class:`Asset`.
+    :param fingerprinted: published on the fingerprinted path.
+    """
+    def __init__(self, asset, fingerprinted):
+        self.asset = asset
+        self.fingerprinted = fingerprinted
+
+    @property
+    def path(self):
+        if self.fingerprinted:
+            return self.asset.fingerprinted_name
+        return self.asset.name
+
+
+def fingerprint_name(name, fingerprint):
+    """Put fingerprint in name of file, before its extension.
+
+    :param name: path of a file.
+    :param fingerprint: the fingerprint.
+    :return: the fingerprinted path.
+    """
+    directory, slash, filename = name.rpartition('/')
+    base, dot, extension = filename.partition('.')
+    if not base:
+        # a name such as .htaccess
+        base, dot, extension = filename, '', ''
+    return '%s%s%s.%s%s%s' % (directory, slash, base, fingerprint,
+                              dot, extension)
+
+
+def index_directory(directory):
+    """Index the files in a directory, recursively.
+
+    Files and directories whose name starts with ``.`` are skipped. A
+    file with ``.br`` or ``.gz`` appended to the name of another file is
+    a precompressed variant of that file.
+
+    :param directory: absolute path of the directory.
+    :return: a dict with :class:`Asset` instances, with their names as
+      keys.
+    """
+    result = {}
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+        filenames = set(f for f in filenames if not f.startswith('.'))
+        variants = set(
+            filename + extension
+            for filename in filenames for encoding, extension in ENCODINGS
+            if filename + extension in filenames)
+        for filename in filenames - variants:
+            path = os.path.join(dirpath, filename)
+            name = os.path.relpath(path, directory).replace(os.sep, '/')
+            encodings = OrderedDict(
+                (encoding, path + extension)
+                for encoding, extension in ENCODINGS
+                if filename + extension in filenames)
+            result[name] = Asset(name, path, os.stat(path).st_mtime,
+                                 file_digest(path), encodings)
+    return result
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(BLOCK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def asset_response(asset_file, request):
+    """Create response for an asset.
+
+    A precompressed variant is sent if the ``Accept-Encoding`` header
+    of the request allows it. The response has a strong ETag based on
+    the contents. A fingerprinted asset is cacheable forever, as
+    configured by the ``immutable_max_age`` setting of the ``assets``
+    section; a plain one for ``max_age`` seconds, or if that is ``0``,
+    it has to be revalidated.
+
+    :param asset_file: the :class:`AssetFile`.
+    :param request: :class:`morepath.Request` instance.
+    :return: a :class:`morepath.Response`.
+    """
+    asset = asset_file.asset
+    settings = request.app.settings.assets
+    encoding = negotiate_encoding(request, asset.encodings)
+    buffer = asset.buffer(encoding)
+    response = Response(content_type=asset.content_type,
+                        conditional_response=True)
+    response.app_iter = BufferIter(buffer)
+    response.content_length = len(buffer)
+    response.last_modified = asset.mtime
+    if encoding is None:
+        response.etag = asset.digest
+    else:
+        response.etag = '%s-%s' % (asset.digest, encoding)
+        response.content_encoding = encoding
+    if asset.encodings:
+        response.vary = ('Accept-Encoding',)
+    if asset_file.fingerprinted:
+        response.cache_control = 'public, max-age=%d, immutable' % (
+            settings.immutable_max_age)
+    elif settings.max_age:
+        response.cache_control = 'public, max-age=%d' % settings.max_age
+    else:
+        response.cache_control = 'no-cache'
+    return response
+
+
+def negotiate_encoding(request, encodings):
+    """Choose a precompressed variant.
+
+    :param request: :class:`morepath.Request` instance.
+    :param encodings: the content encodings available, in order of
+      preference.
+    :return: the content encoding, or ``None`` for no encoding.
+    """
+    if not encodings or 'Accept-Encoding' not in request.headers:
+        return None
+    match = request.accept_encoding.best_match(
+        list(encodings) + ['identity'])
+    if match == 'identity':
+        return None
+    return match
@@ -1,7 +1,13 @@
+import logging
 import os
+import threading
+import time
+from multiprocessing.pool import ThreadPool
 from .toposort import toposorted, Info
 from .error import ConfigError, TopologicalSortError
 from .settings import SettingRegistry
+from .cache import LRUCache
+from .reify import reify
 
 
 class TemplateEngineRegistry(object):
@@ -11,6 +17,9 @@ class TemplateEngineRegistry(object):
     and :meth:`morepath.App.html` directives for template-based
     rendering.
 
+    It also holds the cache of rendered view fragments used by
+    :meth:`morepath.Request.fragment`.
+
     :param setting_registry: a :class:`morepath.settings.SettingRegistry`
       instance.
 
@@ -25,6 +34,7 @@ class TemplateEngineRegistry(object):
         self._template_renders = {}
         self._template_directory_infos = []
         self._template_configurable_to_keys = {}
+        self.template_cache = None
 
     def register_template_directory_info(self, key,
                                          directory, before, after,
@@ -70,6 +80,41 @@ class TemplateEngineRegistry(object):
         self._template_loaders[extension] = func(
             self.sorted_template_directories(), self._setting_registry)
 
+    def register_template_compiler(self, extension, func):
+        """Register a function to compile templates for an extension.
+
+        Used by the :meth:`morepath.App.template_compiler` directive.
+        Templates with this extension are loaded and cached by the
+        :class:`TemplateCache` of this registry, which is also the
+        loader passed to the ``template_render`` function.
+
+        :param extension: template extension like ``.pt``
+        :param func: function that given the path of a template file
+          and the settings returns a compiled template.
+        """
+        if self.template_cache is None:
+            settings = self._setting_registry.template_cache
+            self.template_cache = TemplateCache(
+                self.sorted_template_directories(),
+                self._setting_registry,
+                auto_reload=settings.auto_reload)
+        self.template_cache.register_compiler(extension, func)
+        self._template_loaders[extension] = self.template_cache
+
+    def precompile_templates(self):
+        """Compile all templates that have a template compiler.
+
+        This is done during commit if the ``precompile`` setting of the
+        ``template_cache`` section is true, so that the first requests
+        don't have to compile templates.
+        """
+        if self.template_cache is None:
+            return
+        settings = self._setting_registry.template_cache
+        if not settings.precompile:
+            return
+        self.template_cache.precompile(settings.threads)
+
     def sorted_template_directories(self):
         """Get sorted template directories.
 
@@ -117,6 +162,17 @@ class TemplateEngineRegistry(object):
                 "No template_render configured for extension: %s" % extension)
         return get_render(loader, name, original_render)
 
+    @reify
+    def fragment_cache(self):
+        """The cache of rendered view fragments.
+
+        A :class:`morepath.cache.LRUCache` configured by the
+        ``fragment_cache`` setting section. It is shared by all
+        instances of the app class.
+        """
+        settings = self._setting_registry.fragment_cache
+        return LRUCache(settings.max_size, settings.ttl)
+
 
 class TemplateDirectoryInfo(Info):
     """Used by :class:`TemplateEngineRegistry` internally.
@@ -125,3 +181,141 @@ class TemplateDirectoryInfo(Info):
         super(TemplateDirectoryInfo, self).__init__(key, before, after)
         self.directory = directory
         self.configurable = configurable
+
+
+class TemplateCache(object):
+    """A cache of compiled templates.
+
+    Templates are looked up by name in the template directories, and
+    compiled by the function registered for their extension with
+    :meth:`morepath.App.template_compiler`. A compiled template is kept
+    until the process ends; if ``auto_reload`` is true, the
+    modification time of its file is checked each time it is used, and
+    it is compiled again when the file has changed.
+
+    :param template_directories: list of template directory paths, in
+      order of template lookup.
+    :param settings: the settings, passed to the compile functions.
+    :param auto_reload: check whether template files have changed.
+    """
+    def __init__(self, template_directories, settings, auto_reload=False):
+        self.template_directories = template_directories
+        self.settings = settings
+        self.auto_reload = auto_reload
+        self.compile_times = {}
+        """Time it took to compile each template, by path, in seconds."""
+        self._compilers = {}
+        # name -> (path, mtime, compiled template)
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def register_compiler(self, extension, func):
+        """Register compile function for an extension.
+
+        :param extension: template extension like ``.pt``
+        :param func: function that given the path of a template file
+          and the settings returns a compiled template.
+        """
+        self._compilers[extension] = func
+
+    def get(self, name):
+        """Get compiled template.
+
+        :param name: name of the template relative to the template
+          directories, such as ``foo.pt``.
+        :return: the compiled template, or ``None`` if there is no
+          template with this name.
+        """
+        entry = self._templates.get(name)
+        if entry is not None:
+            if not self.auto_reload:
+                return entry[2]
+            path, mtime, template = entry
+            if get_mtime(path) == mtime:
+                return template
+        path = self.find(name)
+        if path is None:
+            return None
+        return self.compile(name, path)
+
+    def find(self, name):
+        """Find template file.
+
+        :param name: name of the template.
+        :return: the path of the template in the first template
+          directory that has it, or ``None``.
+        """
+        for template_directory in self.template_directories:
+            path = os.path.join(template_directory, name)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def compile(self, name, path):
+        """Compile template file and cache the result.
+
+        :param name: name of the template.
+        :param path: path of the template file.
+        :return: the compiled template.
+        """
+        _, extension = os.path.splitext(name)
+        mtime = get_mtime(path)
+        start = time.time()
+        template = self._compilers[extension](path, self.settings)
+        elapsed = time.time() - start
+        with self._lock:
+            self._templates[name] = (path, mtime, template)
+            self.compile_times[path] = elapsed
+        return template
+
+    def names(self):
+        """Names of all templates that can be compiled.
+
+        :return: a dict with template names as keys and the paths of
+          the template files that have priority as values.
+        """
+        result = {}
+        for template_directory in reversed(self.template_directories):
+            for dirpath, dirnames, filenames in os.walk(template_directory):
+                for filename in filenames:
+                    _, extension = os.path.splitext(filename)
+                    if extension not in self._compilers:
+                        continue
+                    path = os.path.join(dirpath, filename)
+                    name = os.path.relpath(path, template_directory)
+                    result[name.replace(os.sep, '/')] = path
+        return result
+
+    def precompile(self, threads=0):
+        """Compile all templates.
+
+        :param threads: amount of threads to compile in. If ``0``,
+          templates are compiled in the current thread.
+        :return: total time it took in seconds.
+        """
+        names = self.names()
+        start = time.time()
+        if threads:
+            pool = ThreadPool(threads)
+            try:
+                pool.map(lambda item: self.compile(*item), names.items())
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for name, path in names.items():
+                self.compile(name, path)
+        elapsed = time.time() - start
+        logger.info("Compiled %d templates in %.3f seconds",
+                    len(names), elapsed)
+        return elapsed
+
+
+logger = logging.getLogger('morepath.template')
+
+
+def get_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
@@ -0,0 +1,27 @@
+import morepath
+
+
+class app(morepath.App):
+    pass
+
+
+@app.path(path='')
+class Root(object):
+    pass
+
+
+@app.view(model=Root)
+def default(self, request):
+    return u'%s %s %s %s %s' % (
+        request.method, request.path, request.query_string,
+        request.headers.get('X-Foo'), request.cookies.get('b'))
+
+
+@app.json(model=Root, request_method='POST')
+def post(self, request):
+    return request.json
+
+
+@app.html(model=Root, name='stream')
+def stream(self, request):
+    return iter([u'a', u'b'])
@@ -0,0 +1,56 @@
+import asyncio
+import threading
+
+import morepath
+
+
+class app(morepath.App):
+    pass
+
+
+class Item(object):
+    def __init__(self, id):
+        self.id = id
+
+
+@app.path(model=Item, path='{id}')
+def get_item(id):
+    return Item(id)
+
+
+calls = []
+
+
+@app.view(model=Item)
+async def default(self, request):
+    calls.append(self.id)
+    await asyncio.sleep(0.05)
+    if self.id == 'error':
+        raise ValueError()
+    return self.id
+
+
+@app.view(model=ValueError)
+async def value_error(self, request):
+    await asyncio.sleep(0)
+    return u'value error'
+
+
+@app.tween_factory()
+def thread_tween_factory(app, handler):
+    def thread_tween(request):
+        response = handler(request)
+        response.headers['X-Thread'] = threading.current_thread().name
+        return response
+    return thread_tween
+
+
+@app.setting_section(section='single_flight')
+def get_single_flight_settings():
+    return {'enabled': True, 'timeout': 30}
+
+
+@app.setting_section(section='compression')
+def get_compression_settings():
+    return {'enabled': True, 'min_size': 0, 'level': 6,
+            'content_types': ['text/plain']}
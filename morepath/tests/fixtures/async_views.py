@@ -0,0 +1,141 @@
+import asyncio
+import threading
+
+import morepath
+import reg
+
+
+class app(morepath.App):
+    pass
+
+
+@app.setting_section(section='asgi')
+def get_asgi_settings():
+    return {'threads': 2}
+
+
+class Document(object):
+    def __init__(self, id, loop_thread, ready):
+        self.id = id
+        self.loop_thread = loop_thread
+        self.ready = ready
+
+
+@app.path(model=Document, path='{id}')
+async def get_document(id):
+    await asyncio.sleep(0)
+    if id == 'missing':
+        return None
+    # a future belongs to the event loop it is created for
+    ready = asyncio.get_event_loop().create_future()
+    ready.set_result(id)
+    return Document(id, threading.current_thread().name, ready)
+
+
+@app.view(model=Document)
+async def document_default(self, request):
+    await asyncio.sleep(0)
+    return u'%s %s %s' % (self.id, self.loop_thread,
+                          threading.current_thread().name)
+
+
+@app.json(model=Document, name='json')
+async def document_json(self, request):
+    await asyncio.sleep(0)
+    return {'id': self.id}
+
+
+@app.view(model=Document, name='ready')
+async def document_ready(self, request):
+    return await self.ready
+
+
+@app.json(model=Document, name='nested')
+async def document_nested(self, request):
+    return {'json': request.view(self, name='json')}
+
+
+@app.view(model=Document, name='sync')
+def document_sync(self, request):
+    return threading.current_thread().name
+
+
+@app.json(model=Document, name='composed')
+def document_composed(self, request):
+    return {'json': request.view(self, name='json')}
+
+
+class sub(morepath.App):
+    pass
+
+
+@app.mount(path='sub', app=sub)
+def mount_sub():
+    return sub()
+
+
+class Greeting(object):
+    pass
+
+
+@reg.dispatch()
+def greeting():
+    return u'default'
+
+
+@app.function(greeting)
+def app_greeting():
+    return u'app'
+
+
+@sub.function(greeting)
+def sub_greeting():
+    return u'sub'
+
+
+@app.path(model=Greeting, path='greeting/{delay}')
+def get_app_greeting(delay):
+    return Greeting()
+
+
+@sub.path(model=Greeting, path='greeting/{delay}')
+def get_sub_greeting(delay):
+    return Greeting()
+
+
+@app.view(model=Greeting)
+@sub.view(model=Greeting)
+async def greeting_default(self, request):
+    before = greeting()
+    await asyncio.sleep(float(request.path.rsplit('/', 1)[1]))
+    return u'%s %s' % (before, greeting())
+
+
+def run_concurrently(app, scopes, timeout):
+    """Handle ASGI HTTP requests concurrently on a new event loop.
+
+    :return: a list with the messages sent for each request.
+    """
+    loop = asyncio.new_event_loop()
+
+    async def request(scope):
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request'}
+
+        async def send(message):
+            sent.append(message)
+
+        await app.asgi(scope, receive, send)
+        return sent
+
+    async def requests():
+        # the requests interleave on the event loop
+        return await asyncio.wait_for(
+            asyncio.gather(*[request(scope) for scope in scopes]), timeout)
+
+    try:
+        return loop.run_until_complete(requests())
+    finally:
+        loop.close()
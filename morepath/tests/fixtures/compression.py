@@ -0,0 +1,50 @@
+import morepath
+
+
+class app(morepath.App):
+    pass
+
+
+text = u'hello world ' * 1000
+
+
+class Page(object):
+    def __init__(self, name):
+        self.name = name
+
+
+@app.path(path='{name}', model=Page)
+def get_page(name):
+    return Page(name)
+
+
+@app.view(model=Page)
+def default(self, request):
+    if self.name == 'small':
+        return u'hello'
+    if self.name == 'stream':
+        return iter([text, text])
+    if self.name == 'opt-out':
+        @request.after
+        def no_transform(response):
+            response.cache_control.no_transform = True
+    if self.name == 'etag':
+        @request.after
+        def etag(response):
+            response.etag = 'abc'
+    return text
+
+
+@app.view(model=Page, name='binary', render=morepath.render_binary)
+def binary(self, request):
+    return b'x' * 10000
+
+
+@app.json(model=Page, name='json')
+def json(self, request):
+    return [text]
+
+
+@app.setting_section(section='compression')
+def get_compression_settings():
+    return {'enabled': True}
@@ -0,0 +1,41 @@
+import morepath
+
+
+class app(morepath.App):
+    documents = None
+    calls = None
+
+
+class Document(object):
+    def __init__(self, id, version):
+        self.id = id
+        self.version = version
+
+
+@app.path(model=Document, path='documents/{id}')
+def get_document(app, id):
+    return Document(id, app.documents[id])
+
+
+@app.html(model=Document)
+def document_default(self, request):
+    return '<div>%s</div>' % request.fragment(self, 'sidebar')
+
+
+@app.html(model=Document, name='sidebar', internal=True)
+def document_sidebar(self, request):
+    calls = request.app.calls
+    calls.append(self.id)
+    return 'Sidebar %s %s' % (self.id, len(calls))
+
+
+@app.view(model=Document, name='edit')
+def document_edit(self, request):
+    request.app.documents[self.id] += 1
+    return 'Edited'
+
+
+@app.view(model=Document, name='touch')
+def document_touch(self, request):
+    request.invalidate_fragment(self, 'sidebar')
+    return 'Touched'
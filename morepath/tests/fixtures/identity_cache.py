@@ -0,0 +1,62 @@
+import morepath
+from morepath import generic
+from morepath.request import Response
+from morepath.security import Identity, NO_IDENTITY
+
+
+class app(morepath.App):
+    pass
+
+
+@app.path(path='')
+class Root(object):
+    pass
+
+
+@app.view(model=Root)
+def default(self, request):
+    return "Hello %s" % request.identity.userid
+
+
+@app.view(model=Root, name='log_out')
+def log_out(self, request):
+    response = Response()
+    generic.forget_identity(response, request, lookup=request.lookup)
+    return response
+
+
+@app.setting_section(section='identity_cache')
+def get_identity_cache_settings():
+    return {'enabled': True}
+
+
+calls = []
+
+
+class TokenPolicy(morepath.IdentityPolicy):
+    def credential(self, request):
+        return request.headers.get('Token')
+
+    def identify(self, request):
+        calls.append('identify')
+        token = self.credential(request)
+        if token is None:
+            return NO_IDENTITY
+        return Identity(token)
+
+    def remember(self, response, request, identity):
+        pass
+
+    def forget(self, response, request):
+        calls.append('forget')
+
+
+@app.identity_policy()
+def policy():
+    return TokenPolicy()
+
+
+@app.verify_identity()
+def verify_identity(identity):
+    calls.append('verify')
+    return identity.userid != 'bad'
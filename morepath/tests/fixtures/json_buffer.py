@@ -0,0 +1,21 @@
+import morepath
+
+
+class app(morepath.App):
+    def __init__(self, values):
+        self.values = values
+
+
+@app.path(path='')
+class Root(object):
+    pass
+
+
+@app.json(model=Root)
+def default(self, request):
+    return request.app.values
+
+
+@app.view(model=Root, name='binary', render=morepath.render_binary)
+def binary(self, request):
+    return request.app.values
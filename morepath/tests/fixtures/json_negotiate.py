@@ -0,0 +1,43 @@
+import morepath
+
+
+class app(morepath.App):
+    def __init__(self):
+        self.collection = Collection()
+
+
+class Collection(object):
+    def __init__(self):
+        self.items = []
+
+
+@app.path(path='/', model=Collection)
+def get_collection(app):
+    return app.collection
+
+
+@app.json(model=Collection)
+def default(self, request):
+    return self.items
+
+
+@app.json(model=Collection, name='stream')
+def stream(self, request):
+    return iter(self.items)
+
+
+@app.view(model=Collection, name='twice')
+def twice(self, request):
+    morepath.render_json(self.items, request)
+    return morepath.render_json(self.items, request)
+
+
+@app.json(model=Collection, request_method='POST')
+def add(self, request):
+    self.items.append(request.body_obj)
+    return 'added'
+
+
+@app.setting_section(section='json')
+def get_json_settings():
+    return {'negotiate': True}
@@ -0,0 +1,41 @@
+import morepath
+
+
+class app(morepath.App):
+    pass
+
+
+@app.path(path='')
+class Root(object):
+    pass
+
+
+class Item(object):
+    def __init__(self, value):
+        self.value = value
+
+
+class Group(object):
+    def __init__(self, items):
+        self.items = items
+
+
+@app.json(model=Root)
+def default(self, request):
+    return {'groups': [Group([Item(1), Item(2)]), Group([Item(3)])],
+            'count': 3}
+
+
+@app.dump_json(model=Item, fields=['value'])
+def dump_item_json(self, request):
+    pass
+
+
+@app.dump_json(model=Group)
+def dump_group_json(self, request):
+    return {'items': self.items}
+
+
+@app.setting_section(section='json')
+def get_json_settings():
+    return {'dump_nested': True}
@@ -0,0 +1,44 @@
+import morepath
+
+
+class app(morepath.App):
+    pass
+
+
+class Item(object):
+    def __init__(self, id):
+        self.id = id
+        self.title = 'Item %s' % id
+        self.price = id * 10
+
+
+class Tag(object):
+    def __init__(self, name):
+        self.name = name
+        self.color = 'red'
+
+
+@app.path(model=Item, path='items/{id}', converters={'id': int})
+def get_item(id):
+    return Item(id)
+
+
+@app.json(model=Item)
+def item_default(self, request):
+    return {'item': self, 'tags': [Tag('a')]}
+
+
+@app.dump_json(model=Item, fields=['id', 'title', 'price'],
+               type_name='items')
+def dump_item_json(self, request):
+    return {'link': request.link(self)}
+
+
+@app.dump_json(model=Tag)
+def dump_tag_json(self, request):
+    return {'name': self.name, 'color': self.color}
+
+
+@app.setting_section(section='json')
+def get_json_settings():
+    return {'dump_nested': True, 'sparse_fields': True}
@@ -0,0 +1,62 @@
+import morepath
+from morepath.security import Identity, NO_IDENTITY
+
+
+class app(morepath.App):
+    userid = None
+
+
+@app.path(path='')
+class Root(object):
+    pass
+
+
+class Document(object):
+    def __init__(self, id):
+        self.id = id
+
+
+class Image(Document):
+    pass
+
+
+class Permission(object):
+    pass
+
+
+checked = []
+
+
+@app.permission_rule(model=Document, permission=Permission)
+def get_document_permission(identity, model, permission):
+    checked.append(model)
+    return identity.userid == 'user' and model.id != 'secret'
+
+
+@app.permission_rule(model=Image, permission=Permission)
+def get_image_permission(identity, model, permission):
+    checked.append(model)
+    return False
+
+
+class UserPolicy(object):
+    def identify(self, request):
+        if request.app.userid is None:
+            return NO_IDENTITY
+        return Identity(request.app.userid)
+
+    def remember(self, response, request, identity):
+        pass
+
+    def forget(self, response, request):
+        pass
+
+
+@app.identity_policy()
+def policy():
+    return UserPolicy()
+
+
+@app.verify_identity()
+def verify_identity(identity):
+    return True
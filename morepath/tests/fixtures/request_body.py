@@ -0,0 +1,46 @@
+import morepath
+
+
+class app(morepath.App):
+    pass
+
+
+@app.path(path='')
+class Root(object):
+    pass
+
+
+class Item(object):
+    def __init__(self, value):
+        self.value = value
+
+
+@app.load_json()
+def load_json(json, request):
+    return Item(json)
+
+
+@app.json(model=Root, request_method='POST')
+def post(self, request):
+    return [item.value for item in request.json_items()]
+
+
+@app.json(model=Root, name='obj', request_method='POST')
+def post_obj(self, request):
+    return request.body_obj.value
+
+
+@app.json(model=Root, name='spooled', request_method='POST')
+def post_spooled(self, request):
+    return len(request.spooled_body.read())
+
+
+@app.json(model=Root, name='upload', request_method='POST')
+def upload(self, request):
+    return [[part.name, part.filename, len(part.file.read())]
+            for part in request.multipart()]
+
+
+@app.setting_section(section='request_body')
+def get_request_body_settings():
+    return {'max_size': None, 'chunk_size': 3}
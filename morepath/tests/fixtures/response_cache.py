@@ -0,0 +1,43 @@
+import morepath
+
+
+class app(morepath.App):
+    documents = None
+    calls = None
+
+
+class Document(object):
+    def __init__(self, id):
+        self.id = id
+
+
+@app.path(model=Document, path='documents/{id}')
+def get_document(app, id):
+    app.calls.append(id)
+    return Document(id)
+
+
+@app.view(model=Document)
+def document_default(self, request):
+    @request.after
+    def set_cache_control(response):
+        response.cache_control.max_age = 60
+    return "%s %s" % (self.id, request.app.documents[self.id])
+
+
+@app.view(model=Document, request_method='POST')
+def document_post(self, request):
+    request.app.documents[self.id] += 1
+    return "Updated"
+
+
+@app.view(model=Document, name='touch')
+def document_touch(self, request):
+    request.app.documents[self.id] += 1
+    request.invalidate(self)
+    return "Touched"
+
+
+@app.setting_section(section='response_cache')
+def get_response_cache_settings():
+    return {'enabled': True}
@@ -0,0 +1,65 @@
+import morepath
+from morepath import generic
+from morepath.request import Response
+from morepath.security import Identity, SignedTokenIdentityPolicy
+
+
+class app(morepath.App):
+    pass
+
+
+@app.path(path='{id}')
+class Model(object):
+    def __init__(self, id):
+        self.id = id
+
+
+class Permission(object):
+    pass
+
+
+@app.permission_rule(model=Model, permission=Permission)
+def get_permission(identity, model, permission):
+    return identity.userid == 'user'
+
+
+@app.view(model=Model, permission=Permission)
+def default(self, request):
+    return "Model: %s %s" % (self.id, request.identity.role)
+
+
+@app.view(model=Model, name='log_in')
+def log_in(self, request):
+    response = Response()
+    generic.remember_identity(response, request,
+                              Identity(userid='user', role='admin'),
+                              lookup=request.lookup)
+    return response
+
+
+@app.view(model=Model, name='log_out')
+def log_out(self, request):
+    response = Response()
+    generic.forget_identity(response, request, lookup=request.lookup)
+    return response
+
+
+@app.setting_section(section='auth')
+def get_auth_settings():
+    return {
+        'secret': 'sekrit',
+        'header_name': None,
+        'max_age': 3600,
+    }
+
+
+@app.identity_policy()
+def policy(settings):
+    auth = settings.auth
+    return SignedTokenIdentityPolicy(auth.secret, header_name=auth.header_name,
+                                     max_age=auth.max_age)
+
+
+@app.verify_identity()
+def verify_identity(identity):
+    return True
@@ -0,0 +1,33 @@
+import morepath
+
+
+class Assets(morepath.AssetApp):
+    pass
+
+
+@Assets.asset_directory()
+def get_asset_directory():
+    return 'assets'
+
+
+class app(morepath.App):
+    pass
+
+
+@app.path(path='')
+class Root(object):
+    pass
+
+
+@app.mount(path='static', app=Assets)
+def mount_assets():
+    return Assets()
+
+
+@app.view(model=Root)
+def default(self, request):
+    assets = request.app.child(Assets)
+    return request.link(
+        assets.asset(request.params['name'],
+                     fingerprinted='plain' not in request.params),
+        app=assets)
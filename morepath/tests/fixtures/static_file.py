@@ -0,0 +1,25 @@
+import io
+
+import morepath
+from morepath.static import FileResponse
+
+
+class app(morepath.App):
+    def __init__(self, path, data):
+        self.path = path
+        self.data = data
+
+
+@app.path(path='')
+class Root(object):
+    pass
+
+
+@app.view(model=Root)
+def default(self, request):
+    return FileResponse(request.app.path)
+
+
+@app.view(model=Root, name='object')
+def file_object(self, request):
+    return FileResponse(io.BytesIO(request.app.data), block_size=4096)
@@ -0,0 +1,38 @@
+import io
+import os
+
+import morepath
+from .template_engine import FormatTemplate
+
+
+class App(morepath.App):
+    pass
+
+
+compiled = []
+
+
+@App.path(path='{name}')
+class Person(object):
+    def __init__(self, name):
+        self.name = name
+
+
+@App.template_compiler(extension='.format')
+def compile_format(path, settings):
+    compiled.append(os.path.basename(path))
+    with io.open(path, 'r') as f:
+        return FormatTemplate(f.read())
+
+
+@App.template_render(extension='.format')
+def get_format_render(loader, name, original_render):
+    def render(content, request):
+        template = loader.get(name)
+        return original_render(template.render(**content), request)
+    return render
+
+
+@App.html(model=Person, template='person.format')
+def person_default(self, request):
+    return {'name': self.name}
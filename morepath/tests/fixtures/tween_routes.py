@@ -0,0 +1,41 @@
+import morepath
+
+
+class app(morepath.App):
+    pass
+
+
+@app.path(path='')
+class Root(object):
+    pass
+
+
+@app.path(path='health')
+class Health(object):
+    pass
+
+
+@app.path(path='documents/{id}')
+class Document(object):
+    def __init__(self, id):
+        self.id = id
+
+
+@app.view(model=Root)
+def root_default(self, request):
+    return "Root"
+
+
+@app.view(model=Health)
+def health_default(self, request):
+    return "Health"
+
+
+@app.view(model=Document)
+def document_default(self, request):
+    return "Document"
+
+
+@app.view(model=Document, name='edit')
+def document_edit(self, request):
+    return "Edit"
@@ -0,0 +1,345 @@
+import gzip
+import sys
+
+import dectate
+import morepath
+import pytest
+
+from .fixtures import asgi_basic
+
+
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 5),
+                                reason="ASGI needs Python 3.5")
+
+
+def run(app, scope, messages=()):
+    import asyncio
+    loop = asyncio.new_event_loop()
+    messages = list(messages) or [{'type': 'http.request'}]
+    sent = []
+
+    def receive():
+        future = loop.create_future()
+        future.set_result(messages.pop(0))
+        return future
+
+    def send(message):
+        sent.append(message)
+        future = loop.create_future()
+        future.set_result(None)
+        return future
+
+    try:
+        loop.run_until_complete(app.asgi(scope, receive, send))
+    finally:
+        loop.close()
+    return sent
+
+
+def run_concurrently(app, paths, headers=(), timeout=30):
+    # the coroutines are in a fixture, as this module must compile on
+    # Python 2
+    from .fixtures import async_views
+    scopes = [http_scope(path=path, headers=headers) for path in paths]
+    return [response_of(sent) for sent in
+            async_views.run_concurrently(app, scopes, timeout)]
+
+
+def http_scope(method='GET', path='/', query_string=b'', headers=()):
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'root_path': '',
+        'query_string': query_string,
+        'headers': list(headers),
+        'server': ('example.com', 8000),
+        'client': ('127.0.0.1', 12345),
+    }
+
+
+def response_of(sent):
+    start = sent[0]
+    assert start['type'] == 'http.response.start'
+    assert sent[-1] == {'type': 'http.response.body', 'body': b'',
+                        'more_body': False}
+    return (start['status'], dict(start['headers']),
+            b''.join(message['body'] for message in sent[1:]))
+
+
+def test_asgi_get():
+    dectate.commit(asgi_basic.app)
+    app = asgi_basic.app()
+    status, headers, body = response_of(run(app, http_scope(
+        query_string=b'a=1',
+        headers=[(b'x-foo', b'bar'), (b'cookie', b'a=1'),
+                 (b'cookie', b'b=2')])))
+    assert status == 200
+    assert headers[b'content-type'] == b'text/plain; charset=UTF-8'
+    assert body == b'GET / a=1 bar 2'
+
+
+def test_asgi_post():
+    dectate.commit(asgi_basic.app)
+    app = asgi_basic.app()
+    status, headers, body = response_of(run(
+        app,
+        http_scope(method='POST',
+                   headers=[(b'content-type', b'application/json')]),
+        [{'type': 'http.request', 'body': b'[1, ', 'more_body': True},
+         {'type': 'http.request', 'body': b'2]'}]))
+    assert status == 200
+    assert body == b'[1, 2]'
+
+
+def test_asgi_stream():
+    dectate.commit(asgi_basic.app)
+    app = asgi_basic.app()
+    sent = run(app, http_scope(path='/stream'))
+    status, headers, body = response_of(sent)
+    assert status == 200
+    assert body == b'ab'
+
+
+def test_asgi_not_found():
+    dectate.commit(asgi_basic.app)
+    app = asgi_basic.app()
+    status, headers, body = response_of(run(app, http_scope(path='/nope')))
+    assert status == 404
+
+
+def test_asgi_head():
+    dectate.commit(asgi_basic.app)
+    app = asgi_basic.app()
+    status, headers, body = response_of(run(app, http_scope(method='HEAD')))
+    assert body == b''
+
+
+def test_asgi_max_size():
+    class app(asgi_basic.app):
+        pass
+
+    @app.setting_section(section='request_body')
+    def get_request_body_settings():
+        return {'max_size': 3}
+
+    dectate.commit(app)
+
+    a = app()
+    status, headers, body = response_of(run(
+        a, http_scope(method='POST', headers=[(b'content-length', b'4')]),
+        [{'type': 'http.request', 'body': b'[1,2]'}]))
+    assert status == 413
+
+    status, headers, body = response_of(run(
+        a, http_scope(method='POST'),
+        [{'type': 'http.request', 'body': b'[1,', 'more_body': True},
+         {'type': 'http.request', 'body': b'2]'}]))
+    assert status == 413
+
+
+def test_asgi_invalid_content_length():
+    dectate.commit(asgi_basic.app)
+    app = asgi_basic.app()
+    for value in [b'abc', b'-1', b'']:
+        status, headers, body = response_of(run(
+            app, http_scope(method='POST',
+                            headers=[(b'content-length', value)]),
+            [{'type': 'http.request', 'body': b'[1]'}]))
+        assert status == 400
+
+
+def test_asgi_disconnect():
+    dectate.commit(asgi_basic.app)
+    app = asgi_basic.app()
+    sent = run(app, http_scope(method='POST'),
+               [{'type': 'http.request', 'body': b'[', 'more_body': True},
+                {'type': 'http.disconnect'}])
+    assert sent == []
+
+
+def test_asgi_lifespan():
+    dectate.commit(asgi_basic.app)
+    app = asgi_basic.app()
+    sent = run(app, {'type': 'lifespan'},
+               [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+    assert sent == [{'type': 'lifespan.startup.complete'},
+                    {'type': 'lifespan.shutdown.complete'}]
+
+
+def test_build_environ():
+    import io
+    from morepath.asgi import build_environ
+    scope = http_scope(path=u'/app/caf\xe9', query_string=b'x=1',
+                       headers=[(b'content-type', b'text/plain'),
+                                (b'content-length', b'100'),
+                                (b'accept', b'a'), (b'accept', b'b')])
+    scope['root_path'] = '/app'
+    environ = build_environ(scope, io.BytesIO(b'abc'))
+    assert environ['SCRIPT_NAME'] == '/app'
+    assert environ['PATH_INFO'] == u'/caf\xe9'.encode('utf-8').decode(
+        'latin-1')
+    assert environ['QUERY_STRING'] == 'x=1'
+    assert environ['CONTENT_TYPE'] == 'text/plain'
+    assert environ['CONTENT_LENGTH'] == '3'
+    assert environ['HTTP_ACCEPT'] == 'a,b'
+    assert environ['SERVER_NAME'] == 'example.com'
+    assert environ['SERVER_PORT'] == '8000'
+    assert environ['REMOTE_ADDR'] == '127.0.0.1'
+    assert environ['asgi.scope'] is scope
+
+
+def test_asgi_async_views():
+    import threading
+    import dectate
+    from .fixtures import async_views
+    dectate.commit(async_views.app)
+    app = async_views.app()
+
+    status, headers, body = response_of(run(app, http_scope(path='/a')))
+    document_id, factory_thread, view_thread = body.decode().split()
+    assert document_id == 'a'
+    # async functions run on the event loop, here the main thread
+    main_thread = threading.current_thread().name
+    assert factory_thread == main_thread
+    assert view_thread == main_thread
+
+    status, headers, body = response_of(run(app, http_scope(path='/a/sync')))
+    assert body.decode() != main_thread
+
+    status, headers, body = response_of(run(app, http_scope(path='/a/json')))
+    assert body == b'{"id": "a"}'
+
+    status, headers, body = response_of(run(
+        app, http_scope(path='/missing')))
+    assert status == 404
+
+
+def test_asgi_async_views_implicit_lookup():
+    import dectate
+    from .fixtures import async_views
+    dectate.commit(async_views.app, async_views.sub)
+    app = async_views.app()
+    bodies = [body for status, headers, body in run_concurrently(
+        app, ['/greeting/0.05', '/sub/greeting/0.01', '/greeting/0',
+              '/sub/greeting/0.03'])]
+    assert bodies == [b'app app', b'sub sub', b'app app', b'sub sub']
+
+
+def test_asgi_async_views_concurrency():
+    import time
+    import dectate
+    from .fixtures import async_views
+    dectate.commit(async_views.app, async_views.sub)
+    app = async_views.app()
+    assert app.settings.asgi.threads == 2
+
+    start = time.time()
+    responses = run_concurrently(app, ['/greeting/0.2'] * 10)
+    elapsed = time.time() - start
+    assert [body for status, headers, body in responses] == (
+        [b'app app'] * 10)
+    # the views wait together on the event loop, not in the 2 threads
+    assert elapsed < 0.6
+
+
+def test_asgi_async_views_loop():
+    import dectate
+    from .fixtures import async_views
+    dectate.commit(async_views.app)
+    app = async_views.app()
+
+    status, headers, body = response_of(run(
+        app, http_scope(path='/a/ready')))
+    assert body == b'a'
+
+    status, headers, body = response_of(run(
+        app, http_scope(path='/a/composed')))
+    assert body == b'{"json": {"id": "a"}}'
+
+
+def test_asgi_async_tweens():
+    import threading
+    from .fixtures import async_tweens
+    del async_tweens.calls[:]
+    dectate.commit(async_tweens.app)
+
+    responses = run_concurrently(async_tweens.app(),
+                                 ['/a', '/a', '/a', '/error'],
+                                 [(b'accept-encoding', b'gzip')])
+    assert async_tweens.calls.count('a') == 1
+    for status, headers, body in responses[:3]:
+        assert status == 200
+        assert headers[b'content-encoding'] == b'gzip'
+        assert gzip.decompress(body) == b'a'
+        # tweens without a coroutine version run in a thread of their
+        # own
+        assert headers[b'x-thread'] != (
+            threading.current_thread().name.encode())
+    status, headers, body = responses[3]
+    assert gzip.decompress(body) == b'value error'
+
+
+def test_asgi_threaded_tween():
+    import time
+
+    class app(morepath.App):
+        pass
+
+    class Item(object):
+        def __init__(self, id):
+            self.id = id
+
+    @app.path(model=Item, path='{id}')
+    def get_item(id):
+        return Item(id)
+
+    @app.view(model=Item)
+    def default(self, request):
+        time.sleep(0.01)
+        return self.id
+
+    @app.tween_factory()
+    def custom_tween_factory(app, handler):
+        def custom_tween(request):
+            return handler(request)
+        return custom_tween
+
+    @app.setting_section(section='asgi')
+    def get_asgi_settings():
+        return {'threads': 1}
+
+    dectate.commit(app)
+    a = app()
+
+    # the tween does not hold the only thread of the pool, which the
+    # factory and the view need
+    responses = run_concurrently(a, ['/a'], timeout=5)
+    assert responses == [(200, responses[0][1], b'a')]
+
+    paths = ['/%s' % i for i in range(20)]
+    responses = run_concurrently(a, paths, timeout=5)
+    assert [body for status, headers, body in responses] == [
+        path[1:].encode() for path in paths]
+
+
+def test_async_views_wsgi():
+    import dectate
+    from webtest import TestApp as Client
+    from .fixtures import async_views
+    dectate.commit(async_views.app)
+    c = Client(async_views.app())
+
+    assert c.get('/a').text.startswith(u'a ')
+    assert c.get('/a/json').json == {'id': 'a'}
+    assert c.get('/a/composed').json == {'json': {'id': 'a'}}
+    c.get('/missing', status=404)
+    # the factory and the view run on the same event loop
+    assert c.get('/a/ready').text == u'a'
+    assert c.get('/b/ready').text == u'b'
+    # an async view cannot wait for another one without awaiting it
+    with pytest.raises(RuntimeError):
+        c.get('/a/nested')
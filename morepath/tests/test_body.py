@@ -0,0 +1,172 @@
+import json
+
+import dectate
+import pytest
+from webtest import TestApp as Client
+
+from morepath.body import iter_json_array, iter_multipart, parse_header
+from .fixtures import request_body
+
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_iter_json_array():
+    items = [1, -2.5e3, u'caf\xe9 €', None, True, {'a': [1, {}]}, []]
+    data = json.dumps(items, ensure_ascii=False).encode('utf-8')
+    for size in [1, 2, 3, 7, len(data)]:
+        assert list(iter_json_array(split(data, size))) == items
+
+
+def test_iter_json_array_whitespace():
+    data = b' \n[ 1 ,\t"a" ,[ ] ] \r\n'
+    assert list(iter_json_array(split(data, 1))) == [1, u'a', []]
+    assert list(iter_json_array([b'[]'])) == []
+    assert list(iter_json_array([b'[', b' ', b']'])) == []
+
+
+def test_iter_json_array_number_split():
+    # a number must not be cut off at the end of a chunk
+    assert list(iter_json_array([b'[12', b'34]'])) == [1234]
+
+
+@pytest.mark.parametrize('data', [
+    b'', b'{}', b'[1', b'[1 2]', b'[1,]', b'[1] 2', b'[tru]', b'[', b'[,1]'])
+def test_iter_json_array_invalid(data):
+    with pytest.raises(ValueError):
+        list(iter_json_array(split(data, 1)))
+
+
+def multipart_body(boundary=b'xyz'):
+    return (
+        b'preamble\r\n'
+        b'--' + boundary + b'\r\n'
+        b'Content-Disposition: form-data; name="title"\r\n'
+        b'\r\n'
+        b'Hello\r\n'
+        b'--' + boundary + b'  \r\n'
+        b'Content-Disposition: form-data; name="file"; '
+        b'filename="a \\"b\\".txt"\r\n'
+        b'Content-Type: application/octet-stream\r\n'
+        b'\r\n'
+        b'\r\n--not the boundary\r\n' + b'x' * 1000 + b'\r\n'
+        b'--' + boundary + b'\r\n'
+        b'\r\n'
+        b'\r\n'
+        b'--' + boundary + b'--\r\n'
+        b'epilogue')
+
+
+def test_iter_multipart():
+    data = multipart_body()
+    for size in [1, 2, 5, 100, len(data)]:
+        parts = list(iter_multipart(split(data, size), b'xyz', 100))
+        assert len(parts) == 3
+        title, file, empty = parts
+        assert title.name == u'title'
+        assert title.filename is None
+        assert title.content_type == 'text/plain'
+        assert title.file.read() == b'Hello'
+        assert file.name == u'file'
+        assert file.filename == u'a "b".txt'
+        assert file.content_type == u'application/octet-stream'
+        assert file.file.read() == (
+            b'\r\n--not the boundary\r\n' + b'x' * 1000)
+        # larger than the spool size, so on disk
+        assert file.file._rolled
+        assert empty.headers == {}
+        assert empty.file.read() == b''
+
+
+def test_iter_multipart_invalid():
+    data = multipart_body()
+    with pytest.raises(ValueError):
+        list(iter_multipart([data[:-20]], b'xyz'))
+    with pytest.raises(ValueError):
+        list(iter_multipart([b'--xyz\r\nno colon\r\n\r\n--xyz--'], b'xyz'))
+    with pytest.raises(ValueError):
+        list(iter_multipart([b'--xyzfoo\r\n'], b'xyz'))
+
+
+def test_parse_header():
+    assert parse_header(u'form-data; name="a;b"; filename=c.txt') == (
+        u'form-data', {u'name': u'a;b', u'filename': u'c.txt'})
+    assert parse_header(u'Multipart/Form-Data; Boundary=xyz') == (
+        u'multipart/form-data', {u'boundary': u'xyz'})
+    assert parse_header(u'') == (u'', {})
+
+
+def test_request_json_items():
+    dectate.commit(request_body.app)
+    c = Client(request_body.app())
+    response = c.post('/', b'[1, {"a": 2}, "three"]',
+                      content_type='application/json')
+    assert response.json == [1, {'a': 2}, 'three']
+
+    c.post('/', b'{"a": 1}', content_type='application/json', status=400)
+
+
+def test_request_multipart():
+    dectate.commit(request_body.app)
+    c = Client(request_body.app())
+    response = c.post('/upload', {'title': 'Hello'},
+                      upload_files=[('file', 'a.txt', b'x' * 100)])
+    assert response.json == [['title', None, 5], ['file', 'a.txt', 100]]
+
+    c.post('/upload', b'{}', content_type='application/json', status=400)
+
+
+def test_request_spooled_body():
+    dectate.commit(request_body.app)
+    c = Client(request_body.app())
+    response = c.post('/spooled', b'x' * 100,
+                      content_type='application/octet-stream')
+    assert response.json == 100
+
+
+def test_request_max_size():
+    class app(request_body.app):
+        pass
+
+    @app.setting_section(section='request_body')
+    def get_request_body_settings():
+        return {'max_size': 10}
+
+    dectate.commit(app)
+
+    c = Client(app())
+    c.post('/', b'[1, 2, 3, 4, 5]', content_type='application/json',
+           status=413)
+    c.post('/obj', b'[1, 2, 3, 4, 5]', content_type='application/json',
+           status=413)
+    c.post('/spooled', b'x' * 11, content_type='application/octet-stream',
+           status=413)
+    assert c.post('/obj', b'[1, 2, 3]',
+                  content_type='application/json').json == [1, 2, 3]
+
+
+def test_request_max_size_without_content_length():
+    class app(request_body.app):
+        pass
+
+    @app.setting_section(section='request_body')
+    def get_request_body_settings():
+        return {'max_size': 10}
+
+    dectate.commit(app)
+
+    c = Client(app())
+    environ = {'wsgi.input_terminated': True}
+
+    request = c.RequestClass.blank(
+        '/obj', method='POST', body=b'[1, 2, 3, 4, 5]',
+        content_type='application/json', environ=environ)
+    del request.environ['CONTENT_LENGTH']
+    assert c.do_request(request, status=413)
+
+    request = c.RequestClass.blank(
+        '/obj', method='POST', body=b'[1, 2]',
+        content_type='application/json', environ=environ)
+    del request.environ['CONTENT_LENGTH']
+    assert c.do_request(request).json == [1, 2]
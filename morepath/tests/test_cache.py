@@ -0,0 +1,732 @@
+import multiprocessing
+import threading
+import time
+import dectate
+import morepath
+import pytest
+from morepath.error import ConfigError
+from morepath.cache import (LRUCache, ResponseCache, SharedResponseCache,
+                            SingleFlight)
+from webob import BaseRequest, Response
+from webtest import TestApp as Client
+from .fixtures import response_cache
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cache_get_set():
+    cache = LRUCache(10)
+    assert cache.get('a') is None
+    assert cache.get('a', 'default') == 'default'
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+    assert len(cache) == 1
+
+
+def test_cache_max_size():
+    cache = LRUCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    # use a so b is the least recently used
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert len(cache) == 2
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+
+
+def test_cache_ttl():
+    clock = Clock()
+    cache = LRUCache(10, ttl=5, clock=clock)
+    cache.set('a', 1)
+    clock.now = 4
+    assert cache.get('a') == 1
+    clock.now = 5
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_cache_expires():
+    clock = Clock()
+    cache = LRUCache(10, ttl=5, clock=clock)
+    cache.set('a', 1, expires=2)
+    cache.set('b', 2, expires=10)
+    clock.now = 2
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+    clock.now = 5
+    assert cache.get('b') is None
+    cache = LRUCache(10, clock=clock)
+    cache.set('a', 1, expires=6)
+    assert cache.get('a') == 1
+    clock.now = 6
+    assert cache.get('a') is None
+
+
+def test_cache_invalidate():
+    cache = LRUCache(10)
+    cache.set('a', 1)
+    cache.invalidate('a')
+    assert cache.get('a') is None
+    # invalidating something that is not there is fine
+    cache.invalidate('b')
+
+
+def test_cache_statistics():
+    cache = LRUCache(10)
+    assert cache.hit_rate == 0.0
+    cache.set('a', 1)
+    cache.get('a')
+    cache.get('a')
+    cache.get('a')
+    cache.get('b')
+    assert cache.hits == 3
+    assert cache.misses == 1
+    assert cache.hit_rate == 0.75
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.hits == 0
+    assert cache.misses == 0
+
+
+def test_response_cache_store_get():
+    clock = Clock()
+    cache = ResponseCache(10000, clock=clock)
+    request = BaseRequest.blank('/foo?a=1')
+    response = Response('hello')
+    response.cache_control.max_age = 10
+    assert cache.store(request, response)
+    cached = cache.get(BaseRequest.blank('/foo?a=1'))
+    assert cached.body == b'hello'
+    assert cached is not response
+    assert cache.get(BaseRequest.blank('/foo?a=2')) is None
+    assert cache.get(BaseRequest.blank('/bar?a=1')) is None
+    clock.now = 10
+    assert cache.get(BaseRequest.blank('/foo?a=1')) is None
+    assert len(cache) == 0
+    assert cache.size == 0
+    assert cache.hits == 1
+    assert cache.misses == 3
+
+
+def test_response_cache_not_cacheable():
+    cache = ResponseCache(10000)
+
+    def store(response, **kw):
+        return cache.store(BaseRequest.blank('/foo', **kw), response)
+
+    response = Response('hello')
+    assert not store(response)
+
+    response.cache_control.max_age = 0
+    assert not store(response)
+
+    response.cache_control.max_age = 10
+    response.cache_control.private = True
+    assert not store(response)
+
+    response = Response('hello')
+    response.cache_control.max_age = 10
+    response.cache_control.no_store = True
+    assert not store(response)
+
+    response = Response('hello')
+    response.cache_control.max_age = 10
+    assert not store(response, method='POST')
+    assert not store(response, headers={'Authorization': 'Basic Zm9vOmJhcg=='})
+    response.set_cookie('foo', 'bar')
+    assert not store(response)
+
+    response = Response('hello', status=404)
+    response.cache_control.max_age = 10
+    assert not store(response)
+
+    response = Response(app_iter=iter([b'hello']))
+    response.cache_control.max_age = 10
+    assert not store(response)
+
+    response = Response('hello')
+    response.cache_control.max_age = 10
+    response.vary = ('*',)
+    assert not store(response)
+
+    assert len(cache) == 0
+
+
+def test_response_cache_public_authorization():
+    cache = ResponseCache(10000)
+    response = Response('hello')
+    response.cache_control.max_age = 10
+    response.cache_control.public = True
+    assert cache.store(BaseRequest.blank(
+        '/foo', headers={'Authorization': 'Basic Zm9vOmJhcg=='}), response)
+
+
+def test_response_cache_s_maxage():
+    clock = Clock()
+    cache = ResponseCache(10000, clock=clock)
+    response = Response('hello')
+    response.cache_control.max_age = 10
+    response.cache_control.s_maxage = 20
+    cache.store(BaseRequest.blank('/foo'), response)
+    clock.now = 15
+    assert cache.get(BaseRequest.blank('/foo')) is not None
+
+
+def test_response_cache_vary():
+    cache = ResponseCache(10000)
+
+    def request(language=None):
+        headers = {}
+        if language is not None:
+            headers['Accept-Language'] = language
+        return BaseRequest.blank('/foo', headers=headers)
+
+    for language in ['en', 'nl', None]:
+        response = Response('hello %s' % language)
+        response.cache_control.max_age = 10
+        response.vary = ('Accept-Language',)
+        cache.store(request(language), response)
+
+    assert cache.get(request('en')).body == b'hello en'
+    assert cache.get(request('nl')).body == b'hello nl'
+    assert cache.get(request()).body == b'hello None'
+    assert cache.get(request('de')) is None
+
+    # response varies on something else now; old variants are dropped
+    response = Response('hello')
+    response.cache_control.max_age = 10
+    response.vary = ('Accept-Encoding',)
+    cache.store(request('en'), response)
+    assert len(cache) == 1
+    assert cache.get(request('nl')).body == b'hello'
+
+
+def test_response_cache_max_bytes():
+    def cached_response(body):
+        response = Response(body)
+        response.cache_control.max_age = 10
+        return response
+
+    size = len(cached_response('a' * 100).body) + sum(
+        len(name) + len(value) for name, value in
+        cached_response('a' * 100).headerlist)
+    cache = ResponseCache(size * 2)
+    cache.store(BaseRequest.blank('/a'), cached_response('a' * 100))
+    cache.store(BaseRequest.blank('/b'), cached_response('b' * 100))
+    assert cache.size == size * 2
+    # make /b least recently used
+    cache.get(BaseRequest.blank('/a'))
+    cache.store(BaseRequest.blank('/c'), cached_response('c' * 100))
+    assert len(cache) == 2
+    assert cache.get(BaseRequest.blank('/b')) is None
+    assert cache.get(BaseRequest.blank('/a')) is not None
+    # too big to store at all
+    assert not cache.store(BaseRequest.blank('/d'),
+                           cached_response('d' * size * 2))
+
+
+def test_response_cache_invalidate():
+    cache = ResponseCache(10000)
+    for url in ['/foo', '/foo?a=1', '/bar']:
+        response = Response('hello')
+        response.cache_control.max_age = 10
+        cache.store(BaseRequest.blank(url), response)
+    cache.invalidate('/foo')
+    assert len(cache) == 1
+    assert cache.get(BaseRequest.blank('/foo')) is None
+    assert cache.get(BaseRequest.blank('/foo?a=1')) is None
+    assert cache.get(BaseRequest.blank('/bar')) is not None
+    cache.invalidate('/unknown')
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.size == 0
+    assert cache.hit_rate == 0.0
+
+
+def test_response_cache_host():
+    cache = ResponseCache(10000)
+    response = Response('http://evil.example/')
+    response.cache_control.max_age = 10
+    cache.store(BaseRequest.blank('/foo', headers={'Host': 'evil.example'}),
+                response)
+    assert cache.get(BaseRequest.blank(
+        '/foo', headers={'Host': 'good.example'})) is None
+    assert cache.get(BaseRequest.blank(
+        'https://evil.example/foo')) is None
+    assert cache.get(BaseRequest.blank(
+        '/foo', headers={'Host': 'evil.example'})) is not None
+    # invalidation is for all hosts
+    cache.invalidate('/foo')
+    assert len(cache) == 0
+
+
+def test_response_cache_invalidate_quoted():
+    cache = ResponseCache(10000)
+    response = Response('hello')
+    response.cache_control.max_age = 10
+    cache.store(BaseRequest.blank('/docs/a:b'), response)
+    cache.invalidate('/docs/a%3Ab')
+    assert cache.get(BaseRequest.blank('/docs/a:b')) is None
+
+
+def test_shared_response_cache_store_get(tmpdir):
+    clock = Clock()
+    cache = SharedResponseCache(str(tmpdir.join('cache')), 16, 1024,
+                                clock=clock)
+    request = BaseRequest.blank('/foo?a=1')
+    response = Response('hello')
+    response.cache_control.max_age = 10
+    assert cache.store(request, response)
+    cached = cache.get(BaseRequest.blank('/foo?a=1'))
+    assert cached.body == b'hello'
+    assert cached.content_type == 'text/html'
+    assert cached.cache_control.max_age == 10
+    assert cache.get(BaseRequest.blank('/foo?a=2')) is None
+    assert cache.get(BaseRequest.blank('/bar?a=1')) is None
+    clock.now = 10
+    assert cache.get(BaseRequest.blank('/foo?a=1')) is None
+    assert len(cache) == 0
+    assert cache.hits == 1
+    assert cache.misses == 3
+    cache.close()
+
+
+def test_shared_response_cache_vary(tmpdir):
+    cache = SharedResponseCache(str(tmpdir.join('cache')), 64, 1024)
+
+    def request(language=None):
+        headers = {}
+        if language is not None:
+            headers['Accept-Language'] = language
+        return BaseRequest.blank('/foo', headers=headers)
+
+    for language in ['en', 'nl', None]:
+        response = Response('hello %s' % language)
+        response.cache_control.max_age = 10
+        response.vary = ('Accept-Language',)
+        cache.store(request(language), response)
+
+    assert cache.get(request('en')).body == b'hello en'
+    assert cache.get(request('nl')).body == b'hello nl'
+    assert cache.get(request()).body == b'hello None'
+    assert cache.get(request('de')) is None
+    cache.close()
+
+
+def test_shared_response_cache_too_big(tmpdir):
+    cache = SharedResponseCache(str(tmpdir.join('cache')), 16, 256)
+    response = Response('x' * 256)
+    response.cache_control.max_age = 10
+    assert not cache.store(BaseRequest.blank('/foo'), response)
+    assert cache.get(BaseRequest.blank('/foo')) is None
+    cache.close()
+
+
+def test_shared_response_cache_invalidate_clear(tmpdir):
+    cache = SharedResponseCache(str(tmpdir.join('cache')), 64, 1024)
+    for url in ['/foo', '/foo?a=1', '/bar']:
+        response = Response('hello')
+        response.cache_control.max_age = 10
+        cache.store(BaseRequest.blank(url), response)
+    cache.invalidate('/foo')
+    assert cache.get(BaseRequest.blank('/foo')) is None
+    assert cache.get(BaseRequest.blank('/foo?a=1')) is None
+    assert cache.get(BaseRequest.blank('/bar')).body == b'hello'
+    cache.clear()
+    assert cache.get(BaseRequest.blank('/bar')) is None
+    assert len(cache) == 0
+    cache.close()
+
+
+def test_shared_response_cache_host_quoted(tmpdir):
+    cache = SharedResponseCache(str(tmpdir.join('cache')), 64, 1024)
+    response = Response('http://evil.example/')
+    response.cache_control.max_age = 10
+    cache.store(BaseRequest.blank('/docs/a:b',
+                                  headers={'Host': 'evil.example'}),
+                response)
+    assert cache.get(BaseRequest.blank(
+        '/docs/a:b', headers={'Host': 'good.example'})) is None
+    cache.invalidate('/docs/a%3Ab')
+    assert cache.get(BaseRequest.blank(
+        '/docs/a:b', headers={'Host': 'evil.example'})) is None
+    cache.close()
+
+
+def test_shared_response_cache_reopen(tmpdir):
+    path = str(tmpdir.join('cache'))
+    cache = SharedResponseCache(path, 16, 1024)
+    response = Response('hello')
+    response.cache_control.max_age = 10
+    cache.store(BaseRequest.blank('/foo'), response)
+    cache.close()
+
+    cache = SharedResponseCache(path, 16, 1024)
+    assert cache.get(BaseRequest.blank('/foo')).body == b'hello'
+    cache.close()
+
+    # a different layout starts out empty
+    cache = SharedResponseCache(path, 32, 1024)
+    assert cache.get(BaseRequest.blank('/foo')) is None
+    cache.close()
+
+
+def test_shared_response_cache_layout_in_use(tmpdir):
+    path = str(tmpdir.join('cache'))
+    cache = SharedResponseCache(path, 64, 1024)
+    response = Response('hello')
+    response.cache_control.max_age = 10
+    cache.store(BaseRequest.blank('/foo'), response)
+
+    # a process with other settings doesn't touch the mapped file
+    other = SharedResponseCache(path, 8, 1024)
+    assert other.filename != cache.filename
+    assert other.get(BaseRequest.blank('/foo')) is None
+    assert cache.get(BaseRequest.blank('/foo')).body == b'hello'
+    other.close()
+    cache.close()
+
+
+def test_shared_response_cache_not_a_cache_file(tmpdir):
+    path = str(tmpdir.join('cache'))
+    with open(path + '.8.1024', 'wb') as f:
+        f.write(b'something else')
+    with pytest.raises(ConfigError):
+        SharedResponseCache(path, 8, 1024)
+
+
+def hold_slots(filename, locked, release):
+    import fcntl
+    with open(filename, 'r+b') as f:
+        fcntl.lockf(f, fcntl.LOCK_EX, 0, 0)
+        locked.set()
+        release.wait(5)
+
+
+def test_shared_response_cache_clear_waits_for_writer(tmpdir):
+    cache = SharedResponseCache(str(tmpdir.join('cache')), 8, 1024)
+    response = Response('hello')
+    response.cache_control.max_age = 10
+    cache.store(BaseRequest.blank('/foo'), response)
+
+    locked = multiprocessing.Event()
+    release = multiprocessing.Event()
+    writer = multiprocessing.Process(target=hold_slots,
+                                     args=(cache.filename, locked, release))
+    writer.start()
+    assert locked.wait(5)
+    clearing = threading.Thread(target=cache.clear)
+    clearing.start()
+    clearing.join(0.2)
+    # the other process holds the slots, so clear waits
+    assert clearing.is_alive()
+    assert cache.get(BaseRequest.blank('/foo')) is not None
+    release.set()
+    clearing.join(5)
+    writer.join()
+    assert cache.get(BaseRequest.blank('/foo')) is None
+    cache.close()
+
+
+def store_in_worker(path, name):
+    cache = SharedResponseCache(path, 64, 1024)
+    response = Response('hello %s' % name)
+    response.cache_control.max_age = 60
+    cache.store(BaseRequest.blank('/%s' % name), response)
+    cache.close()
+
+
+def test_shared_response_cache_processes(tmpdir):
+    path = str(tmpdir.join('cache'))
+    cache = SharedResponseCache(path, 64, 1024)
+    processes = [
+        multiprocessing.Process(target=store_in_worker, args=(path, name))
+        for name in ['a', 'b', 'c']]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    for name in ['a', 'b', 'c']:
+        cached = cache.get(BaseRequest.blank('/%s' % name))
+        assert cached.body == ('hello %s' % name).encode('ascii')
+    cache.close()
+
+
+def test_response_cache_tween():
+    class App(response_cache.app):
+        documents = {'a': 0}
+        calls = []
+
+    dectate.commit(App)
+    app = App()
+    c = Client(app)
+
+    assert c.get('/documents/a').body == b'a 0'
+    assert c.get('/documents/a').body == b'a 0'
+    assert App.calls == ['a']
+    response = c.head('/documents/a')
+    assert response.body == b''
+    assert App.calls == ['a']
+    assert app.response_cache.hits == 2
+
+    c.post('/documents/a')
+    assert c.get('/documents/a').body == b'a 1'
+    assert App.calls == ['a', 'a', 'a']
+
+
+def test_response_cache_tween_invalidate():
+    class App(response_cache.app):
+        documents = {'a': 0}
+        calls = []
+
+    dectate.commit(App)
+    c = Client(App())
+
+    assert c.get('/documents/a').body == b'a 0'
+    assert c.get('/documents/a/touch').body == b'Touched'
+    assert c.get('/documents/a').body == b'a 1'
+
+
+def test_response_cache_tween_disabled():
+    class App(response_cache.app):
+        documents = {'a': 0}
+        calls = []
+
+    @App.setting_section(section='response_cache')
+    def get_response_cache_settings():
+        return {'enabled': False}
+
+    dectate.commit(App)
+    app = App()
+    assert app.response_cache is None
+    c = Client(app)
+
+    assert c.get('/documents/a').body == b'a 0'
+    assert c.get('/documents/a').body == b'a 0'
+    assert App.calls == ['a', 'a']
+    assert c.get('/documents/a/touch').body == b'Touched'
+
+
+def test_response_cache_tween_shared(tmpdir):
+    path = str(tmpdir.join('cache'))
+
+    class App(response_cache.app):
+        documents = {'a': 0}
+        calls = []
+
+    @App.setting_section(section='response_cache')
+    def get_response_cache_settings():
+        return {'shared_path': path}
+
+    dectate.commit(App)
+    app = App()
+    assert isinstance(app.response_cache, SharedResponseCache)
+    c = Client(app)
+
+    assert c.get('/documents/a').body == b'a 0'
+    assert c.get('/documents/a').body == b'a 0'
+    assert App.calls == ['a']
+
+    # another app instance, as in another worker process
+    other = App()
+    assert Client(other).get('/documents/a').body == b'a 0'
+    assert App.calls == ['a']
+    assert other.response_cache.hits == 1
+
+    c.post('/documents/a')
+    assert Client(other).get('/documents/a').body == b'a 1'
+
+
+def run_concurrently(single_flight, handler, requests):
+    """Handle first request, and the others while it is in flight."""
+    started = threading.Event()
+    release = threading.Event()
+    responses = [None] * len(requests)
+
+    def blocking_handler(request):
+        if request is requests[0]:
+            started.set()
+            release.wait(5)
+        return handler(request)
+
+    def run(i):
+        try:
+            responses[i] = single_flight.handle(requests[i], blocking_handler)
+        except Exception as e:
+            responses[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,))
+               for i in range(len(requests))]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    deadline = time.time() + 5
+    while (single_flight.waiting < len(requests) - 1 and
+           time.time() < deadline):
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+    return responses
+
+
+def test_single_flight():
+    single_flight = SingleFlight(5)
+    calls = []
+
+    def handler(request):
+        calls.append(request.path)
+        return Response('hello %s' % len(calls))
+
+    requests = [BaseRequest.blank('/foo') for i in range(5)]
+    responses = run_concurrently(single_flight, handler, requests)
+    assert calls == ['/foo']
+    assert [r.body for r in responses] == [b'hello 1'] * 5
+    assert len(set(id(r) for r in responses)) == 5
+    assert single_flight.flights == 1
+    assert single_flight.coalesced == 4
+    assert single_flight.waiting == 0
+
+    # the next request is handled again
+    assert single_flight.handle(
+        BaseRequest.blank('/foo'), handler).body == b'hello 2'
+
+
+def test_single_flight_different_key():
+    single_flight = SingleFlight(5)
+    calls = []
+
+    def handler(request):
+        calls.append(request.path_qs)
+        return Response('hello')
+
+    requests = [BaseRequest.blank('/foo'),
+                BaseRequest.blank('/foo?a=1'),
+                BaseRequest.blank('/foo', headers={'Cookie': 'a=b'}),
+                BaseRequest.blank('/foo', headers={'Host': 'other.example'})]
+    # only the first request waits for the release, the others pass
+    single_flight.timeout = 0
+    run_concurrently(single_flight, handler, requests[:1])
+    for request in requests[1:]:
+        single_flight.handle(request, handler)
+    assert calls == ['/foo', '/foo?a=1', '/foo', '/foo']
+    assert single_flight.coalesced == 0
+
+
+def test_single_flight_vary():
+    single_flight = SingleFlight(5)
+    calls = []
+
+    def handler(request):
+        calls.append(request.headers.get('Accept-Language'))
+        response = Response('hello')
+        response.vary = ('Accept-Language',)
+        return response
+
+    requests = [
+        BaseRequest.blank('/foo', headers={'Accept-Language': 'en'}),
+        BaseRequest.blank('/foo', headers={'Accept-Language': 'en'}),
+        BaseRequest.blank('/foo', headers={'Accept-Language': 'nl'})]
+    run_concurrently(single_flight, handler, requests)
+    assert sorted(calls) == ['en', 'nl']
+    assert single_flight.coalesced == 1
+
+
+def test_single_flight_not_shared():
+    single_flight = SingleFlight(5)
+    calls = []
+
+    def handler(request):
+        calls.append(request.path)
+        response = Response('hello')
+        response.set_cookie('session', 'x')
+        return response
+
+    requests = [BaseRequest.blank('/foo') for i in range(3)]
+    run_concurrently(single_flight, handler, requests)
+    assert calls == ['/foo'] * 3
+    assert single_flight.coalesced == 0
+
+
+def test_single_flight_exception():
+    single_flight = SingleFlight(5)
+    calls = []
+
+    def handler(request):
+        calls.append(request.path)
+        if len(calls) == 1:
+            raise ValueError()
+        return Response('hello')
+
+    requests = [BaseRequest.blank('/foo') for i in range(3)]
+    responses = run_concurrently(single_flight, handler, requests)
+    assert isinstance(responses[0], ValueError)
+    assert [r.body for r in responses[1:]] == [b'hello', b'hello']
+    assert len(calls) == 3
+    assert single_flight.coalesced == 0
+
+
+def test_single_flight_timeout():
+    single_flight = SingleFlight(0.01)
+    calls = []
+
+    def handler(request):
+        calls.append(request.path)
+        return Response('hello')
+
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_handler(request):
+        started.set()
+        release.wait(5)
+        return handler(request)
+
+    thread = threading.Thread(
+        target=single_flight.handle,
+        args=(BaseRequest.blank('/foo'), slow_handler))
+    thread.start()
+    started.wait(5)
+    assert single_flight.handle(
+        BaseRequest.blank('/foo'), handler).body == b'hello'
+    release.set()
+    thread.join()
+    assert single_flight.timeouts == 1
+    assert single_flight.coalesced == 0
+    assert len(calls) == 2
+
+
+def test_single_flight_tween():
+    class App(morepath.App):
+        pass
+
+    @App.path(path='')
+    class Root(object):
+        pass
+
+    @App.view(model=Root)
+    def root_default(self, request):
+        return "Hello"
+
+    @App.setting_section(section='single_flight')
+    def get_single_flight_settings():
+        return {'enabled': True, 'timeout': 1}
+
+    dectate.commit(App)
+    app = App()
+    assert isinstance(app.single_flight, SingleFlight)
+    c = Client(app)
+    assert c.get('/').body == b'Hello'
+    assert c.post('/', status=405)
+    assert app.single_flight.flights == 1
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import binascii
+import pytest
+from morepath import cbor
+
+
+def h(s):
+    return binascii.unhexlify(s)
+
+
+# examples from appendix A of RFC 7049
+@pytest.mark.parametrize('value,encoded', [
+    (0, '00'),
+    (23, '17'),
+    (24, '1818'),
+    (100, '1864'),
+    (1000, '1903e8'),
+    (1000000, '1a000f4240'),
+    (1000000000000, '1b000000e8d4a51000'),
+    (18446744073709551615, '1bffffffffffffffff'),
+    (-1, '20'),
+    (-1000, '3903e7'),
+    (-18446744073709551616, '3bffffffffffffffff'),
+    (1.1, 'fb3ff199999999999a'),
+    (False, 'f4'),
+    (True, 'f5'),
+    (None, 'f6'),
+    (b'', '40'),
+    (b'\x01\x02\x03\x04', '4401020304'),
+    (u'', '60'),
+    (u'a', '6161'),
+    (u'ü', '62c3bc'),
+    ([], '80'),
+    ([1, [2, 3], [4, 5]], '8301820203820405'),
+    ({}, 'a0'),
+    ({u'a': 1}, 'a1616101'),
+])
+def test_roundtrip(value, encoded):
+    assert cbor.dumps(value) == h(encoded)
+    assert cbor.loads(h(encoded)) == value
+
+
+def test_tuple():
+    assert cbor.loads(cbor.dumps((1, 2))) == [1, 2]
+
+
+def test_too_large():
+    with pytest.raises(ValueError):
+        cbor.dumps(2 ** 64)
+
+
+def test_not_serializable():
+    with pytest.raises(TypeError):
+        cbor.dumps(object())
+
+
+@pytest.mark.parametrize('encoded,value', [
+    ('f90000', 0.0),
+    ('f93c00', 1.0),
+    ('f9c400', -4.0),
+    ('f97bff', 65504.0),
+    ('f90001', 5.960464477539063e-08),
+    ('f97c00', float('inf')),
+    ('fa47c35000', 100000.0),
+    ('f7', None),
+    ('c074323031332d30332d32315432303a30343a30305a',
+     u'2013-03-21T20:04:00Z'),
+    ('5f42010243030405ff', b'\x01\x02\x03\x04\x05'),
+    ('7f657374726561646d696e67ff', u'streaming'),
+    ('9f018202039f0405ffff', [1, [2, 3], [4, 5]]),
+    ('bf61610161629f0203ffff', {u'a': 1, u'b': [2, 3]}),
+])
+def test_decode(encoded, value):
+    assert cbor.loads(h(encoded)) == value
+
+
+@pytest.mark.parametrize('encoded', ['', '62c3', '1a000f', '0000', 'fc',
+                                     'a1a001', 'a18001'])
+def test_decode_invalid(encoded):
+    with pytest.raises(ValueError):
+        cbor.loads(h(encoded))
+
+
+def test_decode_nested_too_deeply():
+    with pytest.raises(ValueError):
+        cbor.loads(h('81' * 100000 + '00'))
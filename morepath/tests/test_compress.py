@@ -0,0 +1,121 @@
+import gzip
+import io
+import zlib
+
+import dectate
+from webob import BaseRequest
+
+from morepath.compress import compressed_chunks
+from .fixtures import compression
+
+
+def get(a, path, accept_encoding='gzip, deflate'):
+    # not through webtest, which would decode the content
+    headers = {}
+    if accept_encoding is not None:
+        headers['Accept-Encoding'] = accept_encoding
+    return BaseRequest.blank(path, headers=headers).get_response(a)
+
+
+def test_compression_gzip():
+    dectate.commit(compression.app)
+    a = compression.app()
+    response = get(a, '/page')
+    assert response.content_encoding == 'gzip'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert response.content_length == len(response.body)
+    assert len(response.body) < 1000
+    assert gzip.GzipFile(fileobj=io.BytesIO(response.body)).read() == (
+        compression.text.encode('utf-8'))
+
+    response = get(a, '/page/json')
+    assert response.content_encoding == 'gzip'
+
+
+def test_compression_deflate():
+    dectate.commit(compression.app)
+    a = compression.app()
+    response = get(a, '/page', 'deflate')
+    assert response.content_encoding == 'deflate'
+    assert zlib.decompress(response.body) == compression.text.encode('utf-8')
+
+
+def test_compression_streamed():
+    dectate.commit(compression.app)
+    a = compression.app()
+    response = get(a, '/stream')
+    assert response.content_encoding == 'gzip'
+    assert response.content_length is None
+    assert not isinstance(response.app_iter, list)
+    assert zlib.decompress(response.body, 16 + zlib.MAX_WBITS) == (
+        compression.text.encode('utf-8') * 2)
+
+
+def test_compression_skipped():
+    dectate.commit(compression.app)
+    a = compression.app()
+
+    response = get(a, '/page', None)
+    assert response.content_encoding is None
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert response.body == compression.text.encode('utf-8')
+
+    response = get(a, '/page', 'identity')
+    assert response.content_encoding is None
+
+    response = get(a, '/page', 'br')
+    assert response.content_encoding is None
+
+    response = get(a, '/small')
+    assert response.content_encoding is None
+    assert 'Vary' not in response.headers
+
+    response = get(a, '/page/binary')
+    assert response.content_encoding is None
+    assert response.body == b'x' * 10000
+
+    response = get(a, '/opt-out')
+    assert response.content_encoding is None
+    assert response.body == compression.text.encode('utf-8')
+
+
+def test_compression_weak_etag():
+    dectate.commit(compression.app)
+    a = compression.app()
+    response = get(a, '/etag')
+    assert response.content_encoding == 'gzip'
+    assert response.headers['ETag'] == 'W/"abc"'
+
+
+def test_compression_disabled():
+    class app(compression.app):
+        pass
+
+    @app.setting_section(section='compression')
+    def get_compression_settings():
+        return {'enabled': False}
+
+    dectate.commit(app)
+
+    a = app()
+    response = get(a, '/page')
+    assert response.content_encoding is None
+    assert 'Vary' not in response.headers
+
+
+def test_compressed_chunks():
+    closed = []
+
+    class AppIter(object):
+        def __iter__(self):
+            return iter([b'a' * 100, b'', b'b' * 100])
+
+        def close(self):
+            closed.append(True)
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS)
+    chunks = list(compressed_chunks(AppIter(), compressor, True))
+    # each chunk is flushed, and then the stream is finished
+    assert len(chunks) == 3
+    assert zlib.decompress(b''.join(chunks)) == b'a' * 100 + b'b' * 100
+    assert closed == [True]
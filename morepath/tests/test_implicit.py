@@ -139,3 +139,81 @@ def test_implicit_disabled():
 
     response = c.get('/')
     assert response.body == b'No implicit found'
+
+
+def test_set_reset_implicit():
+    from morepath.implicit import set_implicit, reset_implicit
+    morepath.enable_implicit()
+    first = object()
+    second = object()
+    token = set_implicit(first)
+    assert reg.implicit.lookup is first
+    inner = set_implicit(second)
+    assert reg.implicit.lookup is second
+    reset_implicit(inner)
+    assert reg.implicit.lookup is first
+    reset_implicit(token)
+    assert reg.implicit.lookup is None
+
+
+def test_set_implicit_disabled():
+    from morepath.implicit import set_implicit, reset_implicit
+    morepath.disable_implicit()
+    try:
+        assert set_implicit(object()) is None
+        assert reg.implicit.lookup is None
+        reset_implicit(None)
+    finally:
+        morepath.enable_implicit()
+
+
+def test_implicit_restored_after_view_error():
+    class alpha(morepath.App):
+        pass
+
+    class beta(morepath.App):
+        pass
+
+    @alpha.mount(path='beta', app=beta)
+    def mount_beta():
+        return beta()
+
+    @alpha.path(path='')
+    class Root(object):
+        pass
+
+    @beta.path(path='')
+    class BetaRoot(object):
+        pass
+
+    @reg.dispatch()
+    def one():
+        return "Default one"
+
+    @alpha.function(one)
+    def alpha_one():
+        return "alpha"
+
+    @beta.function(one)
+    def beta_one():
+        return "beta"
+
+    @beta.view(model=BetaRoot)
+    def beta_default(self, request):
+        assert one() == "beta"
+        raise ValueError()
+
+    @alpha.view(model=Root)
+    def default(self, request):
+        try:
+            request.view(BetaRoot(), app=request.app.child(beta()))
+        except ValueError:
+            pass
+        return "%s %s" % (one(), request.app.__class__.__name__)
+
+    dectate.commit(alpha, beta)
+
+    c = Client(alpha())
+
+    response = c.get('/')
+    assert response.body == b'alpha alpha'
@@ -1,6 +1,7 @@
 import dectate
 import morepath
 from webtest import TestApp as Client
+from .fixtures import fragment
 
 
 def setup_module(module):
@@ -32,3 +33,67 @@ def test_internal():
     assert response.body == b'{"internal": "Internal!"}'
 
     c.get('/internal', status=404)
+
+
+def test_fragment():
+    class app(fragment.app):
+        documents = {'a': 0}
+        calls = []
+
+    dectate.commit(app)
+    c = Client(app())
+
+    assert c.get('/documents/a').body == b'<div>Sidebar a 1</div>'
+    assert c.get('/documents/a').body == b'<div>Sidebar a 1</div>'
+    assert app.calls == ['a']
+
+    # a new version is rendered again
+    c.get('/documents/a/edit')
+    assert c.get('/documents/a').body == b'<div>Sidebar a 2</div>'
+    assert c.get('/documents/a').body == b'<div>Sidebar a 2</div>'
+
+    # explicit invalidation
+    c.get('/documents/a/touch')
+    assert c.get('/documents/a').body == b'<div>Sidebar a 3</div>'
+    assert app.calls == ['a', 'a', 'a']
+
+
+def test_fragment_ttl():
+    class app(fragment.app):
+        documents = {'a': 0}
+        calls = []
+
+    @app.setting_section(section='fragment_cache')
+    def get_fragment_cache_settings():
+        return {'ttl': 0}
+
+    dectate.commit(app)
+    c = Client(app())
+
+    assert c.get('/documents/a').body == b'<div>Sidebar a 1</div>'
+    assert c.get('/documents/a').body == b'<div>Sidebar a 2</div>'
+
+
+def test_fragment_no_link():
+    class app(morepath.App):
+        pass
+
+    class Item(object):
+        pass
+
+    @app.path(path='')
+    class Root(object):
+        pass
+
+    @app.view(model=Root)
+    def root_default(self, request):
+        return request.fragment(Item()) + request.fragment(
+            self, 'missing', default='!')
+
+    @app.view(model=Item)
+    def item_default(self, request):
+        return 'Item'
+
+    dectate.commit(app)
+    c = Client(app())
+    assert c.get('/').body == b'Item!'
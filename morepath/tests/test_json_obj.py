@@ -1,6 +1,14 @@
+import json
 import dectate
+from morepath import cbor
 import morepath
+import pytest
+from morepath.error import ConfigError
+from morepath.jsonbackend import JsonBackend, get_json_backend
+from morepath.view import JsonDumper
+from webob import BaseRequest
 from webtest import TestApp as Client
+from .fixtures import json_negotiate, json_nested, json_sparse
 
 
 def setup_module(module):
@@ -169,3 +177,392 @@ def test_json_obj_load_no_json_post():
 
     response = c.post('/', {'x': 'foo'})
     assert response.json == 'done'
+
+
+def test_json_streaming():
+    class app(morepath.App):
+        pass
+
+    @app.path(path='')
+    class Root(object):
+        pass
+
+    class Item(object):
+        def __init__(self, value):
+            self.value = value
+
+    dumped = []
+
+    @app.json(model=Root)
+    def default(self, request):
+        return (Item(i) for i in range(3))
+
+    @app.json(model=Root, name='empty')
+    def empty(self, request):
+        return iter([])
+
+    @app.dump_json(model=Item)
+    def dump_item_json(self, request):
+        dumped.append(self.value)
+        return {'value': self.value}
+
+    dectate.commit(app)
+
+    c = Client(app())
+
+    response = c.get('/')
+    assert response.content_type == 'application/json'
+    assert response.json == [{'value': 0}, {'value': 1}, {'value': 2}]
+    assert dumped == [0, 1, 2]
+
+    response = c.get('/empty')
+    assert response.body == b'[]'
+
+
+def test_json_streaming_lazy():
+    class app(morepath.App):
+        pass
+
+    @app.path(path='')
+    class Root(object):
+        pass
+
+    produced = []
+
+    def rows():
+        for i in range(10000):
+            produced.append(i)
+            yield {'id': i, 'name': 'row %s' % i}
+
+    @app.json(model=Root)
+    def default(self, request):
+        return rows()
+
+    dectate.commit(app)
+
+    a = app()
+    response = a.publish(a.request(BaseRequest.blank('/').environ))
+    assert produced == []
+    chunks = iter(response.app_iter)
+    first = next(chunks)
+    assert first.startswith(b'[{')
+    # only the rows for the first buffered chunk were produced
+    assert 0 < len(produced) < 10000
+    rest = b''.join(chunks)
+    assert len(produced) == 10000
+    assert (first + rest).endswith(b'"row 9999"}]')
+
+
+def test_json_backend_default():
+    backend = get_json_backend('json')
+    assert backend.dumps({'a': u'\u20ac'}) == b'{"a": "\\u20ac"}'
+    assert backend.loads(u'{"a": "\u20ac"}'.encode('utf-8')) == {
+        'a': u'\u20ac'}
+
+
+def test_json_backend_auto():
+    backend = get_json_backend('auto')
+    assert backend.name in ['json', 'orjson', 'ujson']
+    assert backend.loads(backend.dumps({'a': [1, 2]})) == {'a': [1, 2]}
+
+
+@pytest.mark.parametrize('name', ['orjson', 'ujson'])
+def test_json_backend_optional(name):
+    pytest.importorskip(name)
+    backend = get_json_backend(name)
+    assert backend.name == name
+    assert isinstance(backend.dumps({'a': 1}), bytes)
+    assert backend.loads(backend.dumps({'a': [1, u'\u20ac']})) == {
+        'a': [1, u'\u20ac']}
+
+
+def test_json_backend_unknown():
+    with pytest.raises(ConfigError):
+        get_json_backend('unknown')
+
+
+def test_json_backend_setting():
+    class app(morepath.App):
+        pass
+
+    class Collection(object):
+        def __init__(self):
+            self.items = []
+
+    collection = Collection()
+
+    @app.path(path='/', model=Collection)
+    def get_collection():
+        return collection
+
+    @app.json(model=Collection)
+    def default(self, request):
+        return self.items
+
+    @app.json(model=Collection, request_method='POST')
+    def add(self, request):
+        self.items.append(request.body_obj)
+        return request.json
+
+    calls = []
+
+    def dumps(obj):
+        calls.append('dumps')
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def loads(data):
+        calls.append('loads')
+        return json.loads(data.decode('utf-8'))
+
+    @app.setting_section(section='json')
+    def get_json_settings():
+        return {'backend': JsonBackend('custom', dumps, loads)}
+
+    dectate.commit(app)
+
+    c = Client(app())
+    response = c.post_json('/', {'x': 1})
+    assert response.body == b'{"x":1}'
+    assert c.get('/').body == b'[{"x":1}]'
+    assert calls == ['loads', 'loads', 'dumps', 'dumps']
+
+
+def test_dump_json_fields():
+    class app(morepath.App):
+        pass
+
+    @app.path(path='/models/{x}')
+    class Model(object):
+        def __init__(self, x):
+            self.x = x
+            self.y = x.upper()
+
+    @app.json(model=Model)
+    def default(self, request):
+        return self
+
+    @app.dump_json(model=Model, fields=['x', 'y'])
+    def dump_model_json(self, request):
+        return {'link': request.link(self)}
+
+    class Other(object):
+        def __init__(self, x):
+            self.x = x
+
+    @app.path(model=Other, path='/others/{x}')
+    def get_other(x):
+        return Other(x)
+
+    @app.json(model=Other)
+    def other_default(self, request):
+        return self
+
+    @app.dump_json(model=Other, fields=['x'])
+    def dump_other_json(self, request):
+        pass
+
+    dectate.commit(app)
+
+    c = Client(app())
+
+    assert c.get('/models/foo').json == {
+        'x': 'foo', 'y': 'FOO', 'link': 'http://localhost/models/foo'}
+    assert c.get('/others/foo').json == {'x': 'foo'}
+
+
+def test_dump_json_fields_invalid():
+    class app(morepath.App):
+        pass
+
+    class Model(object):
+        pass
+
+    @app.dump_json(model=Model, fields=['x', 'not valid'])
+    def dump_model_json(self, request):
+        pass
+
+    with pytest.raises(ConfigError):
+        dectate.commit(app)
+
+
+def test_dump_json_nested():
+    class app(json_nested.app):
+        pass
+
+    dectate.commit(app)
+
+    c = Client(app())
+    assert c.get('/').json == {
+        'groups': [{'items': [{'value': 1}, {'value': 2}]},
+                   {'items': [{'value': 3}]}],
+        'count': 3}
+
+
+def test_dump_json_not_nested():
+    class app(json_nested.app):
+        pass
+
+    @app.setting_section(section='json')
+    def get_json_settings():
+        return {'dump_nested': False}
+
+    dectate.commit(app)
+
+    c = Client(app())
+    with pytest.raises(TypeError):
+        c.get('/')
+
+
+def test_json_dumper_resolves_once():
+    class app(json_nested.app):
+        pass
+
+    dectate.commit(app)
+
+    class CountingDumper(JsonDumper):
+        resolved = []
+
+        def resolve(self, obj):
+            self.resolved.append(obj.__class__.__name__)
+            return super(CountingDumper, self).resolve(obj)
+
+    a = app()
+    request = a.request(BaseRequest.blank('/').environ)
+    dumper = CountingDumper(request, a.lookup, nested=True)
+    result = dumper(request.view(request.resolve_path('/')))
+    assert len(result['groups']) == 2
+    assert sorted(CountingDumper.resolved) == ['Group', 'Item', 'dict']
+
+
+def test_sparse_fields():
+    class app(json_sparse.app):
+        pass
+
+    dectate.commit(app)
+
+    c = Client(app())
+
+    assert c.get('/items/1').json == {
+        'item': {'id': 1, 'title': 'Item 1', 'price': 10,
+                 'link': 'http://localhost/items/1'},
+        'tags': [{'name': 'a', 'color': 'red'}]}
+    assert c.get('/items/1?fields[items]=id,price').json == {
+        'item': {'id': 1, 'price': 10},
+        'tags': [{'name': 'a', 'color': 'red'}]}
+    assert c.get('/items/1?fields[items]=link,unknown').json == {
+        'item': {'link': 'http://localhost/items/1'},
+        'tags': [{'name': 'a', 'color': 'red'}]}
+    assert c.get('/items/1?fields[items]=title&fields[Tag]=name').json == {
+        'item': {'title': 'Item 1'},
+        'tags': [{'name': 'a'}]}
+    # fields applies to types without their own parameter
+    assert c.get('/items/2?fields=id,name&fields[Tag]=color').json == {
+        'item': {'id': 2},
+        'tags': [{'color': 'red'}]}
+
+
+def test_sparse_fields_disabled():
+    class app(json_sparse.app):
+        pass
+
+    @app.setting_section(section='json')
+    def get_json_settings():
+        return {'sparse_fields': False}
+
+    dectate.commit(app)
+
+    c = Client(app())
+
+    assert c.get('/items/1?fields[items]=id').json == {
+        'item': {'id': 1, 'title': 'Item 1', 'price': 10,
+                 'link': 'http://localhost/items/1'},
+        'tags': [{'name': 'a', 'color': 'red'}]}
+
+
+def test_negotiate_cbor():
+    dectate.commit(json_negotiate.app)
+    a = json_negotiate.app()
+    a.collection.items.append({'x': 1})
+    c = Client(a)
+
+    response = c.get('/', headers={'Accept': 'application/cbor'})
+    assert response.content_type == 'application/cbor'
+    assert response.headers['Vary'] == 'Accept'
+    assert cbor.loads(response.body) == [{'x': 1}]
+
+    response = c.get('/stream', headers={'Accept': 'application/cbor'})
+    assert response.content_type == 'application/cbor'
+    assert cbor.loads(response.body) == [{'x': 1}]
+
+    c.post('/', cbor.dumps({'y': 2}),
+           headers={'Content-Type': 'application/cbor'})
+    assert a.collection.items == [{'x': 1}, {'y': 2}]
+
+    for body in [b'\xa1\xa0\x01', b'\x81' * 100000 + b'\x00']:
+        c.post('/', body, headers={'Content-Type': 'application/cbor'},
+               status=400)
+
+
+def test_negotiate_rendered_twice():
+    dectate.commit(json_negotiate.app)
+    a = json_negotiate.app()
+    a.collection.items.append({'x': 1})
+    c = Client(a)
+
+    response = c.get('/twice', headers={'Accept': 'application/cbor'})
+    assert cbor.loads(response.body) == [{'x': 1}]
+    assert response.headers['Vary'] == 'Accept'
+
+
+def test_negotiate_json():
+    dectate.commit(json_negotiate.app)
+    a = json_negotiate.app()
+    a.collection.items.append({'x': 1})
+    c = Client(a)
+
+    for accept in ['application/json', '*/*', 'text/html',
+                   'application/cbor;q=0.5, application/json']:
+        response = c.get('/', headers={'Accept': accept})
+        assert response.content_type == 'application/json'
+        assert response.headers['Vary'] == 'Accept'
+        assert response.json == [{'x': 1}]
+    assert c.get('/').json == [{'x': 1}]
+
+
+def test_negotiate_msgpack():
+    msgpack = pytest.importorskip('msgpack')
+    dectate.commit(json_negotiate.app)
+    a = json_negotiate.app()
+    a.collection.items.append({'x': 1})
+    c = Client(a)
+
+    response = c.get('/', headers={'Accept': 'application/msgpack'})
+    assert response.content_type == 'application/msgpack'
+    assert msgpack.unpackb(response.body, raw=False) == [{'x': 1}]
+
+    # msgpack cannot stream, so this is CBOR
+    response = c.get('/stream', headers={
+        'Accept': 'application/msgpack, application/cbor;q=0.9'})
+    assert response.content_type == 'application/cbor'
+
+
+def test_negotiate_disabled():
+    class app(json_negotiate.app):
+        pass
+
+    @app.setting_section(section='json')
+    def get_json_settings():
+        return {'negotiate': False}
+
+    dectate.commit(app)
+
+    a = app()
+    c = Client(a)
+
+    response = c.get('/', headers={'Accept': 'application/cbor'})
+    assert response.content_type == 'application/json'
+    assert 'Vary' not in response.headers
+
+    c.post('/', cbor.dumps({'y': 2}),
+           headers={'Content-Type': 'application/cbor'})
+    assert a.collection.items == [None]
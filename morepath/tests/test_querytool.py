@@ -34,11 +34,12 @@ def test_setting():
 
     dectate.commit(App)
 
-    assert objects(dectate.query_app(App, 'setting')) == [f, g]
+    assert objects(dectate.query_app(App, 'setting', section='foo')) == [f, g]
 
     assert objects(dectate.query_app(App, 'setting', name='bar')) == [f]
 
-    assert objects(dectate.query_app(App, 'setting_section')) == [f, g]
+    assert objects(dectate.query_app(App, 'setting_section',
+                                     section='foo')) == [f, g]
 
 
 def test_predicate_fallback():
@@ -680,7 +681,11 @@ def test_tween_factory():
     r = objects(dectate.query_app(
         App, 'tween_factory'))
 
-    assert r == [core.excview_tween_factory, tween_a_factory, tween_b_factory]
+    assert r == [core.excview_tween_factory,
+                 core.response_cache_tween_factory,
+                 core.single_flight_tween_factory,
+                 core.compression_tween_factory,
+                 tween_a_factory, tween_b_factory]
 
     r = objects(dectate.query_app(
         App, 'tween_factory',
@@ -702,7 +707,7 @@ def test_identity_policy():
     r = objects(dectate.query_app(
         App, 'identity_policy'))
 
-    assert len(r) == 3
+    assert len(r) == 4
 
 
 def test_verify_identity():
@@ -3,10 +3,13 @@ import dectate
 import morepath
 from morepath.request import Response
 from morepath import generic
-from morepath.security import (Identity, NO_IDENTITY)
-from .fixtures import identity_policy
+from morepath.security import (Identity, NO_IDENTITY,
+                               SignedTokenIdentityPolicy)
+from .fixtures import identity_cache, identity_policy, permits, signed_token
+from .fixtures.permits import Document, Image, Permission
 import base64
 import json
+import time
 from webtest import TestApp as Client
 try:
     from cookielib import CookieJar
@@ -356,3 +359,351 @@ def test_settings():
     headers = {'Authorization': 'Bearer secret'}
     response = c.get('/test', headers=headers)
     assert response.body == b'Testuser, your token is valid.'
+
+
+def test_request_permits_cached():
+    class app(permits.app):
+        userid = 'other'
+
+    del permits.checked[:]
+
+    @app.view(model=permits.Root)
+    def default(self, request):
+        doc = Document('a')
+        secret = Document('secret')
+        return repr([request.permits(doc, Permission),
+                     request.permits(doc, Permission),
+                     request.permits(secret, Permission),
+                     request.permits(secret, Permission)])
+
+    dectate.commit(app)
+
+    c = Client(app())
+
+    response = c.get('/')
+    assert response.body == b'[False, False, False, False]'
+    assert len(permits.checked) == 2
+
+
+def test_request_permits_identity():
+    class app(permits.app):
+        userid = 'user'
+
+    del permits.checked[:]
+
+    @app.view(model=permits.Root)
+    def default(self, request):
+        doc = Document('a')
+        return repr([request.permits(doc, Permission),
+                     request.permits(doc, Permission),
+                     request.permits(Document('secret'), Permission),
+                     request.permits(Image('a'), Permission)])
+
+    dectate.commit(app)
+
+    c = Client(app())
+
+    response = c.get('/')
+    assert response.body == b'[True, True, False, False]'
+    assert len(permits.checked) == 3
+
+
+def test_request_permitted():
+    class app(permits.app):
+        userid = 'user'
+
+    del permits.checked[:]
+
+    class Other(object):
+        id = 'other'
+
+    @app.view(model=permits.Root)
+    def default(self, request):
+        objs = [Document('a'), Image('b'), Document('secret'),
+                Other(), Document('c'), Image('d')]
+        return ' '.join(obj.id for obj in
+                        request.permitted(objs, Permission))
+
+    dectate.commit(app)
+
+    c = Client(app())
+
+    response = c.get('/')
+    assert response.body == b'a c'
+    assert [obj.id for obj in permits.checked] == [
+        'a', 'b', 'secret', 'c', 'd']
+
+
+def test_request_permitted_no_identity():
+    class app(permits.app):
+        userid = None
+
+    del permits.checked[:]
+
+    @app.view(model=permits.Root)
+    def default(self, request):
+        objs = [Document('a'), Image('b')]
+        return repr(request.permitted(objs, Permission))
+
+    dectate.commit(app)
+
+    c = Client(app())
+
+    response = c.get('/')
+    assert response.body == b'[]'
+    assert permits.checked == []
+
+
+def test_identity_cache():
+    class app(identity_cache.app):
+        pass
+
+    dectate.commit(app)
+    calls = identity_cache.calls
+    del calls[:]
+
+    c = Client(app())
+
+    response = c.get('/', headers={'Token': 'alice'})
+    assert response.body == b'Hello alice'
+    assert calls == ['identify', 'verify']
+
+    response = c.get('/', headers={'Token': 'alice'})
+    assert response.body == b'Hello alice'
+    assert calls == ['identify', 'verify']
+
+    response = c.get('/', headers={'Token': 'bob'})
+    assert response.body == b'Hello bob'
+    assert calls == ['identify', 'verify'] * 2
+
+    assert app().identity_cache.hits == 1
+    assert app().identity_cache.misses == 2
+
+
+def test_identity_cache_unverified_not_cached():
+    class app(identity_cache.app):
+        pass
+
+    dectate.commit(app)
+    calls = identity_cache.calls
+    del calls[:]
+
+    c = Client(app())
+
+    response = c.get('/', headers={'Token': 'bad'})
+    assert response.body == b'Hello None'
+    response = c.get('/', headers={'Token': 'bad'})
+    assert response.body == b'Hello None'
+    assert calls == ['identify', 'verify'] * 2
+    assert len(app().identity_cache) == 0
+
+
+def test_identity_cache_no_credential():
+    class app(identity_cache.app):
+        pass
+
+    dectate.commit(app)
+    calls = identity_cache.calls
+    del calls[:]
+
+    c = Client(app())
+
+    response = c.get('/')
+    assert response.body == b'Hello None'
+    response = c.get('/')
+    assert calls == ['identify', 'identify']
+    assert app().identity_cache.hits == 0
+    assert app().identity_cache.misses == 0
+
+
+def test_identity_cache_forget():
+    class app(identity_cache.app):
+        pass
+
+    dectate.commit(app)
+    calls = identity_cache.calls
+    del calls[:]
+
+    c = Client(app())
+
+    c.get('/', headers={'Token': 'alice'})
+    assert len(app().identity_cache) == 1
+    c.get('/log_out', headers={'Token': 'alice'})
+    assert calls == ['identify', 'verify', 'forget']
+    assert len(app().identity_cache) == 0
+    c.get('/', headers={'Token': 'alice'})
+    assert calls == ['identify', 'verify', 'forget', 'identify', 'verify']
+
+
+def test_identity_cache_disabled():
+    class app(identity_cache.app):
+        pass
+
+    @app.setting_section(section='identity_cache')
+    def get_identity_cache_settings():
+        return {'enabled': False}
+
+    dectate.commit(app)
+    calls = identity_cache.calls
+    del calls[:]
+
+    assert app().identity_cache is None
+
+    c = Client(app())
+
+    c.get('/', headers={'Token': 'alice'})
+    c.get('/', headers={'Token': 'alice'})
+    assert calls == ['identify', 'verify'] * 2
+
+
+def test_signed_token_identity_policy_cookie():
+    class app(signed_token.app):
+        pass
+
+    dectate.commit(app)
+
+    c = Client(app(), cookiejar=CookieJar())
+
+    c.get('/foo', status=403)
+
+    response = c.get('/foo/log_in')
+    cookie = response.headers['Set-Cookie']
+    assert cookie.startswith('auth_token=')
+    assert 'HttpOnly' in cookie
+    assert 'Max-Age=3600' in cookie
+
+    response = c.get('/foo', status=200)
+    assert response.body == b'Model: foo admin'
+
+    c.get('/foo/log_out')
+
+    c.get('/foo', status=403)
+
+
+def test_signed_token_identity_policy_header():
+    class app(signed_token.app):
+        pass
+
+    @app.setting_section(section='auth')
+    def get_auth_settings():
+        return {'header_name': 'X-Auth-Token'}
+
+    dectate.commit(app)
+
+    c = Client(app())
+
+    response = c.get('/foo/log_in')
+    token = response.headers['X-Auth-Token']
+    assert 'Set-Cookie' not in response.headers
+
+    c.get('/foo', status=403)
+    response = c.get('/foo', headers={'X-Auth-Token': token})
+    assert response.body == b'Model: foo admin'
+
+    response = c.get('/foo/log_out', headers={'X-Auth-Token': token})
+    assert 'Set-Cookie' not in response.headers
+
+
+def test_signed_token_identity_policy_tampered():
+    class app(signed_token.app):
+        pass
+
+    @app.setting_section(section='auth')
+    def get_auth_settings():
+        return {'header_name': 'X-Auth-Token'}
+
+    dectate.commit(app)
+
+    c = Client(app())
+
+    token = c.get('/foo/log_in').headers['X-Auth-Token']
+    payload, signature = token.rsplit('.', 1)
+
+    other = SignedTokenIdentityPolicy('other').create_token(
+        Identity('user', role='admin'))
+
+    for bad in [payload, payload + '.', '.' + signature,
+                payload + 'x.' + signature, payload + '.' + signature[:-1],
+                other, 'not a token']:
+        c.get('/foo', headers={'X-Auth-Token': bad}, status=403)
+
+
+def test_signed_token_identity_policy_expired():
+    class app(signed_token.app):
+        pass
+
+    @app.setting_section(section='auth')
+    def get_auth_settings():
+        return {'header_name': 'X-Auth-Token', 'max_age': -1}
+
+    dectate.commit(app)
+
+    c = Client(app())
+
+    token = c.get('/foo/log_in').headers['X-Auth-Token']
+    c.get('/foo', headers={'X-Auth-Token': token}, status=403)
+
+
+def test_signed_token_roundtrip():
+    policy = SignedTokenIdentityPolicy(b'secret')
+    identity = policy.parse_token(
+        policy.create_token(Identity('user', email='user@example.com')))
+    assert identity.as_dict() == {'userid': 'user',
+                                  'email': 'user@example.com'}
+    assert policy.parse_token(u'\xfc.\xfc') is None
+
+
+def test_signed_token_identity_cache():
+    class app(signed_token.app):
+        pass
+
+    @app.setting_section(section='auth')
+    def get_auth_settings():
+        return {'header_name': 'X-Auth-Token'}
+
+    @app.setting_section(section='identity_cache')
+    def get_identity_cache_settings():
+        return {'enabled': True}
+
+    dectate.commit(app)
+
+    c = Client(app())
+
+    token = c.get('/foo/log_in').headers['X-Auth-Token']
+    c.get('/foo', headers={'X-Auth-Token': token})
+    c.get('/foo', headers={'X-Auth-Token': token})
+    assert app().identity_cache.hits == 1
+
+
+def test_signed_token_identity_cache_expired(monkeypatch):
+    import morepath.security
+
+    class FakeTime(object):
+        now = time.time() - 10
+
+        @classmethod
+        def time(cls):
+            return cls.now
+
+    monkeypatch.setattr(morepath.security, 'time', FakeTime)
+
+    class app(signed_token.app):
+        pass
+
+    @app.setting_section(section='auth')
+    def get_auth_settings():
+        return {'header_name': 'X-Auth-Token', 'max_age': 5}
+
+    @app.setting_section(section='identity_cache')
+    def get_identity_cache_settings():
+        return {'enabled': True, 'ttl': 300}
+
+    dectate.commit(app)
+
+    c = Client(app())
+
+    token = c.get('/foo/log_in').headers['X-Auth-Token']
+    c.get('/foo', headers={'X-Auth-Token': token}, status=200)
+    # the token has expired; the cached identity must not outlive it
+    FakeTime.now += 10
+    c.get('/foo', headers={'X-Auth-Token': token}, status=403)
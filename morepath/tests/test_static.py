@@ -0,0 +1,204 @@
+import io
+import mimetypes
+import os
+
+import dectate
+from webob import BaseRequest
+from webtest import TestApp as Client
+
+from morepath.static import FileIter, BufferIter, fingerprint_name
+from .fixtures import static_assets, static_file
+
+
+def test_file_response(tmpdir):
+    data = b'0123456789' * 1000
+    path = tmpdir.join('data.txt')
+    path.write_binary(data)
+    dectate.commit(static_file.app)
+    c = Client(static_file.app(str(path), data))
+
+    response = c.get('/')
+    assert response.body == data
+    assert response.content_type == 'text/plain'
+    assert response.content_length == len(data)
+    etag = response.headers['ETag']
+    st = os.stat(str(path))
+    assert etag == '"%x-%x"' % (int(st.st_mtime), len(data))
+    assert response.last_modified is not None
+
+    c.get('/', headers={'If-None-Match': etag}, status=304)
+    c.get('/', headers={
+        'If-Modified-Since': response.headers['Last-Modified']}, status=304)
+
+
+def test_file_response_file_object(tmpdir):
+    data = b'0123456789' * 1000
+    path = tmpdir.join('data.txt')
+    path.write_binary(data)
+    dectate.commit(static_file.app)
+    c = Client(static_file.app(str(path), data))
+
+    response = c.get('/object')
+    assert response.body == data
+    assert response.content_type == 'application/octet-stream'
+    assert response.content_length == len(data)
+    assert 'ETag' not in response.headers
+
+
+def test_file_response_range(tmpdir):
+    data = b'0123456789' * 1000
+    path = tmpdir.join('data.txt')
+    path.write_binary(data)
+    dectate.commit(static_file.app)
+    c = Client(static_file.app(str(path), data))
+
+    response = c.get('/', headers={'Range': 'bytes=5-14'}, status=206)
+    assert response.body == data[5:15]
+    assert response.headers['Content-Range'] == 'bytes 5-14/10000'
+    assert response.content_length == 10
+
+    response = c.get('/object', headers={'Range': 'bytes=-3'}, status=206)
+    assert response.body == b'789'
+
+    c.get('/', headers={'Range': 'bytes=20000-'}, status=416)
+
+
+def test_file_response_file_wrapper(tmpdir):
+    data = b'0123456789' * 1000
+    path = tmpdir.join('data.txt')
+    path.write_binary(data)
+    dectate.commit(static_file.app)
+    app = static_file.app(str(path), data)
+    wrapped = []
+
+    def file_wrapper(file, block_size):
+        wrapped.append((file.tell(), block_size))
+        return iter(lambda: file.read(block_size), b'')
+
+    def get(path, **headers):
+        environ = BaseRequest.blank(path, headers=headers).environ
+        environ['wsgi.file_wrapper'] = file_wrapper
+        statuses = []
+        result = app(environ, lambda status, headers: statuses.append(
+            status))
+        return statuses[0], b''.join(result)
+
+    assert get('/') == ('200 OK', data)
+    assert wrapped == [(0, 64 * 1024)]
+
+    # a range to the end of the file is wrapped too
+    assert get('/object', Range='bytes=9990-') == (
+        '206 Partial Content', data[9990:])
+    assert wrapped[1] == (9990, 4096)
+
+    # other ranges are not
+    assert get('/', Range='bytes=0-1') == ('206 Partial Content', b'01')
+    assert len(wrapped) == 2
+
+
+def test_file_iter():
+    file = io.BytesIO(b'abcdefghij')
+    assert list(FileIter(file, 10, 4)) == [b'abcd', b'efgh', b'ij']
+    assert list(FileIter(file, 10, 4).app_iter_range(2, 7)) == [
+        b'cdef', b'g']
+    assert list(FileIter(file, 10, 4, 8, 20)) == [b'ij']
+    FileIter(file, 10).close()
+    assert file.closed
+
+
+def test_asset_index():
+    dectate.commit(static_assets.app, static_assets.Assets)
+    assets = static_assets.Assets.config.asset_registry.assets
+    assert sorted(assets) == ['empty.txt', 'js/app.js', 'site.css']
+    asset = assets['site.css']
+    assert list(asset.encodings) == ['br', 'gzip']
+    assert asset.content_type == 'text/css'
+    assert asset.fingerprinted_name == 'site.%s.css' % asset.digest[:16]
+    assert assets['js/app.js'].encodings == {}
+
+
+def test_asset_link():
+    dectate.commit(static_assets.app, static_assets.Assets)
+    c = Client(static_assets.app())
+    assets = static_assets.Assets.config.asset_registry.assets
+
+    response = c.get('/?name=js/app.js')
+    assert response.body == (
+        'http://localhost/static/%s' %
+        assets['js/app.js'].fingerprinted_name).encode('ascii')
+    response = c.get('/?name=js/app.js&plain=')
+    assert response.body == b'http://localhost/static/js/app.js'
+
+
+def test_asset_serve():
+    dectate.commit(static_assets.app, static_assets.Assets)
+    c = Client(static_assets.app())
+    asset = static_assets.Assets.config.asset_registry.assets['js/app.js']
+
+    response = c.get('/static/js/app.js')
+    assert response.body == b'x' * 100000
+    assert response.content_length == 100000
+    assert response.content_type == mimetypes.guess_type('app.js')[0]
+    assert response.headers['ETag'] == '"%s"' % asset.digest
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert 'Vary' not in response.headers
+
+    c.get('/static/js/app.js',
+          headers={'If-None-Match': response.headers['ETag']}, status=304)
+
+    response = c.get('/static/%s' % asset.fingerprinted_name)
+    assert response.body == b'x' * 100000
+    assert response.headers['Cache-Control'] == (
+        'public, max-age=31536000, immutable')
+
+    response = c.get('/static/js/app.js', headers={'Range': 'bytes=10-19'},
+                     status=206)
+    assert response.body == b'x' * 10
+
+    assert c.get('/static/empty.txt').body == b''
+
+    c.get('/static/.hidden', status=404)
+    c.get('/static/site.css.gz', status=404)
+    c.get('/static/missing.css', status=404)
+
+
+def test_asset_encoding():
+    dectate.commit(static_assets.app, static_assets.Assets)
+    a = static_assets.app()
+    asset = static_assets.Assets.config.asset_registry.assets['site.css']
+
+    def get(**headers):
+        # not through webtest, which would decode the content
+        return BaseRequest.blank(
+            '/static/site.css', headers=headers).get_response(a)
+
+    response = get()
+    assert response.body == b'body { color: red }'
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['Vary'] == 'Accept-Encoding'
+
+    response = get(**{'Accept-Encoding': 'gzip, deflate, br'})
+    assert response.body == b'brotli'
+    assert response.headers['Content-Encoding'] == 'br'
+    assert response.headers['ETag'] == '"%s-br"' % asset.digest
+
+    response = get(**{'Accept-Encoding': 'gzip'})
+    assert response.body == b'gzipped'
+    assert response.headers['Content-Encoding'] == 'gzip'
+
+    response = get(**{'Accept-Encoding': 'identity'})
+    assert response.body == b'body { color: red }'
+
+
+def test_fingerprint_name():
+    assert fingerprint_name('site.css', 'abc') == 'site.abc.css'
+    assert fingerprint_name('js/app.min.js', 'abc') == 'js/app.abc.min.js'
+    assert fingerprint_name('LICENSE', 'abc') == 'LICENSE.abc'
+    assert fingerprint_name('.htaccess', 'abc') == '.htaccess.abc'
+
+
+def test_buffer_iter():
+    assert list(BufferIter(b'abcdefghij', 4)) == [b'abcd', b'efgh', b'ij']
+    assert list(BufferIter(b'abcdefghij', 4).app_iter_range(2, 7)) == [
+        b'cdef', b'g']
+    assert list(BufferIter(b'', 4)) == []
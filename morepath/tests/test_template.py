@@ -1,3 +1,5 @@
+import io
+import os
 import dectate
 import morepath
 from morepath.error import ConfigError
@@ -6,7 +8,8 @@ import pytest
 from .fixtures import (
     template, template_override, template_override_implicit,
     template_unknown_extension, template_unknown_extension_no_render,
-    template_no_template_directories, template_override_under)
+    template_no_template_directories, template_override_under,
+    template_fragment, template_compiler)
 
 
 def setup_module(module):
@@ -22,6 +25,22 @@ def test_template_fixture():
     assert response.body == b'<p>Hello world!</p>\n'
 
 
+def test_template_fragment():
+    dectate.commit(template_fragment.App)
+
+    app = template_fragment.App()
+    c = Client(app)
+
+    response = c.get('/world')
+    assert response.body == b'<div><p>Hello world!</p>\n</div>'
+    response = c.get('/world')
+    assert response.body == b'<div><p>Hello world!</p>\n</div>'
+    cache = app.config.template_engine_registry.fragment_cache
+    assert cache.hits == 1
+    assert cache.misses == 1
+    c.get('/world/sidebar', status=404)
+
+
 def test_template_override_fixture():
     dectate.commit(template_override.App, template_override.SubApp)
     c = Client(template_override.App())
@@ -69,3 +88,123 @@ def test_no_template_directories():
     # we accept no template directories, as it is possible
     # for a base frameworky app not to define any (ChameleonApp, Jinja2App)
     dectate.commit(template_no_template_directories.App)
+
+
+def write_template(path, text):
+    with io.open(path, 'w') as f:
+        f.write(text)
+
+
+def test_template_compiler_precompile(tmpdir):
+    write_template(str(tmpdir.join('person.format')), u'<p>{name}</p>')
+    tmpdir.mkdir('sub')
+    write_template(str(tmpdir.join('sub', 'other.format')), u'{name}')
+    write_template(str(tmpdir.join('ignored.txt')), u'')
+
+    class App(template_compiler.App):
+        pass
+
+    @App.template_directory()
+    def get_template_directory():
+        return str(tmpdir)
+
+    compiled = template_compiler.compiled
+    del compiled[:]
+
+    dectate.commit(App)
+
+    assert sorted(compiled) == ['other.format', 'person.format']
+    cache = App.config.template_engine_registry.template_cache
+    assert sorted(cache.compile_times) == [
+        str(tmpdir.join('person.format')),
+        str(tmpdir.join('sub', 'other.format'))]
+    assert cache.get('sub/other.format').render(name='x') == 'x'
+    assert cache.get('missing.format') is None
+
+    c = Client(App())
+    assert c.get('/world').body == b'<p>world</p>'
+    assert len(compiled) == 2
+
+    # without auto_reload changes are not picked up
+    write_template(str(tmpdir.join('person.format')), u'<p>Hi {name}</p>')
+    os.utime(str(tmpdir.join('person.format')), (0, 0))
+    assert c.get('/world').body == b'<p>world</p>'
+
+
+def test_template_compiler_threads(tmpdir):
+    for i in range(10):
+        write_template(str(tmpdir.join('t%s.format' % i)), u'{name}')
+
+    class App(template_compiler.App):
+        pass
+
+    @App.template_directory()
+    def get_template_directory():
+        return str(tmpdir)
+
+    @App.setting_section(section='template_cache')
+    def get_template_cache_settings():
+        return {'threads': 4}
+
+    compiled = template_compiler.compiled
+    del compiled[:]
+
+    dectate.commit(App)
+    assert len(compiled) == 10
+
+
+def test_template_compiler_no_precompile(tmpdir):
+    write_template(str(tmpdir.join('person.format')), u'<p>{name}</p>')
+
+    class App(template_compiler.App):
+        pass
+
+    @App.template_directory()
+    def get_template_directory():
+        return str(tmpdir)
+
+    @App.setting_section(section='template_cache')
+    def get_template_cache_settings():
+        return {'precompile': False}
+
+    compiled = template_compiler.compiled
+    del compiled[:]
+
+    dectate.commit(App)
+    assert compiled == []
+
+    c = Client(App())
+    assert c.get('/world').body == b'<p>world</p>'
+    assert c.get('/world').body == b'<p>world</p>'
+    assert compiled == ['person.format']
+
+
+def test_template_compiler_auto_reload(tmpdir):
+    path = str(tmpdir.join('person.format'))
+    write_template(path, u'<p>{name}</p>')
+    os.utime(path, (0, 0))
+
+    class App(template_compiler.App):
+        pass
+
+    @App.template_directory()
+    def get_template_directory():
+        return str(tmpdir)
+
+    @App.setting_section(section='template_cache')
+    def get_template_cache_settings():
+        return {'auto_reload': True}
+
+    compiled = template_compiler.compiled
+    del compiled[:]
+
+    dectate.commit(App)
+    c = Client(App())
+    assert c.get('/world').body == b'<p>world</p>'
+    assert compiled == ['person.format']
+
+    write_template(path, u'<p>Hi {name}</p>')
+    os.utime(path, (10, 10))
+    assert c.get('/world').body == b'<p>Hi world</p>'
+    assert c.get('/world').body == b'<p>Hi world</p>'
+    assert compiled == ['person.format', 'person.format']
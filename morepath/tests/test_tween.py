@@ -4,6 +4,7 @@ from morepath.tween import TweenRegistry
 from morepath.error import TopologicalSortError
 import pytest
 from webtest import TestApp as Client
+from .fixtures import tween_routes
 
 
 def setup_module(module):
@@ -186,3 +187,173 @@ def test_tween_directive():
     response = c.get('/')
     assert response.body == b'View'
     assert response.headers['Tween-Header'] == 'FOO'
+
+
+def test_tween_sorting_route_restricted():
+    reg = TweenRegistry()
+
+    def a():
+        pass
+
+    def b():
+        pass
+
+    reg.register_tween_factory(a, over=None, under=None, path='foo')
+    reg.register_tween_factory(b, over=None, under=a)
+    assert reg.sorted_tween_factories() == [a, b]
+
+
+def header_tween_factory(value):
+    def get_tween(app, handler):
+        def tween(request):
+            response = handler(request)
+            response.headers.add('Tween-Header', value)
+            return response
+        return tween
+    return get_tween
+
+
+def test_tween_directive_model():
+    class app(tween_routes.app):
+        pass
+
+    app.tween_factory(model=tween_routes.Document)(
+        header_tween_factory('document'))
+
+    dectate.commit(app)
+
+    c = Client(app())
+
+    response = c.get('/documents/1')
+    assert response.body == b'Document'
+    assert response.headers['Tween-Header'] == 'document'
+
+    response = c.get('/documents/1/edit')
+    assert response.body == b'Edit'
+    assert response.headers['Tween-Header'] == 'document'
+
+    response = c.get('/')
+    assert response.body == b'Root'
+    assert 'Tween-Header' not in response.headers
+
+    response = c.get('/health')
+    assert response.body == b'Health'
+    assert 'Tween-Header' not in response.headers
+
+    c.get('/nonexistent/path', status=404)
+
+
+def test_tween_directive_path():
+    class app(tween_routes.app):
+        pass
+
+    app.tween_factory(path=['', '/documents/{x}'])(
+        header_tween_factory('path'))
+
+    dectate.commit(app)
+
+    c = Client(app())
+
+    response = c.get('/documents/1')
+    assert response.headers['Tween-Header'] == 'path'
+
+    response = c.get('/')
+    assert response.headers['Tween-Header'] == 'path'
+
+    response = c.get('/health')
+    assert 'Tween-Header' not in response.headers
+
+
+def test_tween_directive_exclude():
+    class app(tween_routes.app):
+        pass
+
+    app.tween_factory(path='health', exclude=True)(
+        header_tween_factory('exclude'))
+
+    dectate.commit(app)
+
+    c = Client(app())
+
+    response = c.get('/health')
+    assert response.body == b'Health'
+    assert 'Tween-Header' not in response.headers
+
+    response = c.get('/')
+    assert response.headers['Tween-Header'] == 'exclude'
+
+    response = c.get('/documents/1')
+    assert response.headers['Tween-Header'] == 'exclude'
+
+
+def test_tween_directive_route_order():
+    class app(tween_routes.app):
+        pass
+
+    @app.tween_factory(model=tween_routes.Document)
+    def outer_factory(app, handler):
+        def tween(request):
+            response = handler(request)
+            response.headers.add('Tween-Header', 'outer')
+            return response
+        return tween
+
+    @app.tween_factory(under=outer_factory)
+    def inner_factory(app, handler):
+        def tween(request):
+            response = handler(request)
+            response.headers.add('Tween-Header', 'inner')
+            return response
+        return tween
+
+    dectate.commit(app)
+
+    c = Client(app())
+
+    response = c.get('/documents/1')
+    assert response.headers.getall('Tween-Header') == ['inner', 'outer']
+
+    response = c.get('/')
+    assert response.headers.getall('Tween-Header') == ['inner']
+
+
+def test_tween_directive_mounted_app():
+    class app(morepath.App):
+        pass
+
+    class sub(morepath.App):
+        pass
+
+    @app.path(path='')
+    class Root(object):
+        pass
+
+    @app.view(model=Root)
+    def root_default(self, request):
+        return "Root"
+
+    @sub.path(path='')
+    class SubRoot(object):
+        pass
+
+    @sub.view(model=SubRoot)
+    def sub_root_default(self, request):
+        return "Sub"
+
+    @app.mount(path='sub', app=sub)
+    def mount_sub():
+        return sub()
+
+    app.tween_factory(model=sub)(header_tween_factory('sub'))
+
+    dectate.commit(app, sub)
+
+    c = Client(app())
+
+    response = c.get('/sub')
+    assert response.body == b'Sub'
+    assert response.headers['Tween-Header'] == 'sub'
+
+    response = c.get('/')
+    assert response.body == b'Root'
+    assert 'Tween-Header' not in response.headers
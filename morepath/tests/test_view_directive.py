@@ -1,11 +1,19 @@
+import array
+import json
+from datetime import datetime
 import morepath
+import morepath.view
 from morepath import generic
 import dectate
 from dectate import ConflictError
+from webob import BaseRequest
 from webtest import TestApp as Client
 from reg import ClassIndex, KeyIndex
 import pytest
 from morepath.core import request_method_predicate
+from morepath.view import buffer_chunks
+from morepath.compat import PY3
+from .fixtures import json_buffer
 
 
 def setup_module(module):
@@ -119,3 +127,395 @@ def test_view_custom_predicate_without_fallback():
     response = c.get('/')
     assert response.body == b'View'
     c.get('/foo', status=404)
+
+
+def test_view_etag():
+    class App(morepath.App):
+        pass
+
+    @App.path(path='{id}')
+    class Model(object):
+        version = 'v1'
+        modified = datetime(2016, 5, 1, 12, 30, 15)
+
+        def __init__(self, id):
+            self.id = id
+
+    calls = []
+
+    def etag(self, request):
+        return '%s-%s' % (self.id, self.version)
+
+    @App.json(model=Model, etag=etag)
+    def default(self, request):
+        calls.append(self.id)
+        return {'id': self.id}
+
+    @App.json(model=Model, request_method='POST', etag=etag)
+    def post(self, request):
+        calls.append(self.id)
+        return {'id': self.id}
+
+    dectate.commit(App)
+
+    c = Client(App())
+
+    response = c.get('/a')
+    assert response.json == {'id': 'a'}
+    assert response.headers['ETag'] == '"a-v1"'
+    assert calls == ['a']
+
+    response = c.get('/a', headers={'If-None-Match': '"a-v1"'}, status=304)
+    assert response.body == b''
+    assert response.headers['ETag'] == '"a-v1"'
+    assert calls == ['a']
+
+    c.get('/a', headers={'If-None-Match': '*'}, status=304)
+    assert calls == ['a']
+
+    response = c.get('/a', headers={'If-None-Match': '"a-v0"'})
+    assert response.json == {'id': 'a'}
+    assert calls == ['a', 'a']
+
+    # not for unsafe methods
+    c.post('/a', headers={'If-None-Match': '"a-v1"'})
+    assert calls == ['a', 'a', 'a']
+
+
+def test_view_last_modified():
+    class App(morepath.App):
+        pass
+
+    @App.path(path='{id}')
+    class Model(object):
+        modified = datetime(2016, 5, 1, 12, 30, 15)
+
+        def __init__(self, id):
+            self.id = id
+
+    calls = []
+
+    @App.json(model=Model, last_modified=lambda self, request: self.modified)
+    def default(self, request):
+        calls.append(self.id)
+        return {'id': self.id}
+
+    dectate.commit(App)
+
+    c = Client(App())
+
+    response = c.get('/a')
+    assert response.headers['Last-Modified'] == \
+        'Sun, 01 May 2016 12:30:15 GMT'
+    assert calls == ['a']
+
+    c.get('/a', headers={
+        'If-Modified-Since': 'Sun, 01 May 2016 12:30:15 GMT'}, status=304)
+    c.get('/a', headers={
+        'If-Modified-Since': 'Mon, 02 May 2016 00:00:00 GMT'}, status=304)
+    assert calls == ['a']
+
+    c.get('/a', headers={
+        'If-Modified-Since': 'Sun, 01 May 2016 12:30:14 GMT'}, status=200)
+    assert calls == ['a', 'a']
+
+
+def test_view_etag_takes_precedence():
+    class App(morepath.App):
+        pass
+
+    @App.path(path='{id}')
+    class Model(object):
+        version = 'v1'
+        modified = datetime(2016, 5, 1, 12, 30, 15)
+
+        def __init__(self, id):
+            self.id = id
+
+    @App.json(model=Model, etag=lambda self, request: self.version,
+              last_modified=lambda self, request: self.modified)
+    def default(self, request):
+        return {'id': self.id}
+
+    dectate.commit(App)
+
+    c = Client(App())
+
+    c.get('/a', headers={
+        'If-None-Match': '"v0"',
+        'If-Modified-Since': 'Mon, 02 May 2016 00:00:00 GMT'}, status=200)
+    c.get('/a', headers={
+        'If-None-Match': '"v1"',
+        'If-Modified-Since': 'Sat, 30 Apr 2016 00:00:00 GMT'}, status=304)
+
+
+def test_view_etag_body_hash():
+    class App(morepath.App):
+        pass
+
+    @App.path(path='{id}')
+    class Model(object):
+        def __init__(self, id):
+            self.id = id
+
+    calls = []
+
+    @App.json(model=Model, etag=True)
+    def default(self, request):
+        calls.append(self.id)
+        return {'id': self.id}
+
+    dectate.commit(App)
+
+    c = Client(App())
+
+    response = c.get('/a')
+    etag = response.headers['ETag']
+    assert c.get('/b').headers['ETag'] != etag
+
+    response = c.get('/a', headers={'If-None-Match': etag}, status=304)
+    assert response.body == b''
+    assert calls == ['a', 'b', 'a']
+
+
+def test_view_etag_response_etag_wins():
+    class App(morepath.App):
+        pass
+
+    @App.path(path='')
+    class Model(object):
+        pass
+
+    @App.view(model=Model, etag=lambda self, request: 'model')
+    def default(self, request):
+        response = morepath.Response('View')
+        response.etag = 'view'
+        return response
+
+    dectate.commit(App)
+
+    c = Client(App())
+
+    response = c.get('/')
+    assert response.headers['ETag'] == '"view"'
+
+
+def test_html_streaming():
+    class app(morepath.App):
+        pass
+
+    @app.path(path='')
+    class Root(object):
+        pass
+
+    rendered = []
+
+    @app.html(model=Root)
+    def default(self, request):
+        def rows():
+            yield u'<table>'
+            for i in range(3):
+                rendered.append(i)
+                yield u'<tr><td>\u20ac%s</td></tr>' % i
+            yield u'</table>'
+        return rows()
+
+    dectate.commit(app)
+
+    a = app()
+    response = a.publish(a.request(BaseRequest.blank('/').environ))
+    # nothing is rendered until the body is consumed
+    assert rendered == []
+    assert response.content_type == 'text/html'
+    assert response.content_length is None
+    assert response.body == (
+        u'<table><tr><td>\u20ac0</td></tr><tr><td>\u20ac1</td></tr>'
+        u'<tr><td>\u20ac2</td></tr></table>').encode('utf-8')
+    assert rendered == [0, 1, 2]
+
+    c = Client(app())
+    assert c.get('/').text.startswith(u'<table><tr><td>\u20ac0')
+
+
+def test_buffer_chunks():
+    chunks = [u'a' * 3, b'b' * 3, u'c' * 3, u'd']
+    assert list(buffer_chunks(iter(chunks), 'utf-8', 5)) == [
+        b'aaabbb', b'cccd']
+    assert list(buffer_chunks(iter([]), 'utf-8', 5)) == []
+
+
+def test_json_buffer():
+    dectate.commit(json_buffer.app)
+    c = Client(json_buffer.app(array.array('d', [1.5, 2, 3e100])))
+    response = c.get('/')
+    assert response.content_type == 'application/json'
+    assert response.body == b'[1.5,2.0,3e+100]'
+    assert response.json == [1.5, 2.0, 3e100]
+
+
+@pytest.mark.skipif(not PY3, reason="memoryview.cast needs Python 3")
+def test_json_buffer_shape():
+    dectate.commit(json_buffer.app)
+    values = memoryview(array.array('i', range(6))).cast('B').cast(
+        'i', (2, 3))
+    c = Client(json_buffer.app(values))
+    assert c.get('/').json == [[0, 1, 2], [3, 4, 5]]
+
+
+@pytest.mark.skipif(not PY3, reason="memoryview.cast needs Python 3")
+@pytest.mark.parametrize('use_numpy', [False, True])
+def test_numeric_json_chunks(monkeypatch, use_numpy):
+    if use_numpy:
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(morepath.view, '_numpy', False)
+    for format, values in [('i', range(-6, 6)), ('B', range(12)),
+                           ('q', [-2 ** 63, 2 ** 63 - 1] * 6),
+                           ('d', [0.1 * i - 0.5 for i in range(12)])]:
+        data = memoryview(array.array(format, values)).cast('B')
+        for shape in [(12,), (3, 4), (2, 3, 2), (12, 1), (1, 12), ()]:
+            size = 1
+            for n in shape:
+                size *= n
+            buffer = data[:size * array.array(format).itemsize].cast(
+                format, shape)
+            for chunk_size in [1, 5, 100]:
+                result = b''.join(morepath.view.numeric_json_chunks(
+                    buffer, buffer, chunk_size))
+                assert json.loads(result.decode('ascii')) == \
+                    buffer.tolist(), (format, shape, chunk_size)
+
+
+@pytest.mark.skipif(not PY3, reason="memoryview.cast needs Python 3")
+def test_numeric_json_chunks_layout(monkeypatch):
+    import ctypes
+    monkeypatch.setattr(morepath.view, '_numpy', False)
+    big_endian = (ctypes.c_int32.__ctype_be__ * 3)(1, -2, 300)
+    buffer = memoryview(big_endian)
+    assert b''.join(morepath.view.numeric_json_chunks(
+        big_endian, buffer)) == b'[1,-2,300]'
+    strided = memoryview(array.array('d', [1.5, 2, 3, 4]))[::2]
+    assert b''.join(morepath.view.numeric_json_chunks(
+        strided, strided)) == b'[1.5,3.0]'
+
+
+def test_json_buffer_numpy_nan():
+    numpy = pytest.importorskip('numpy')
+    dectate.commit(json_buffer.app)
+    c = Client(json_buffer.app(numpy.array([1.0, float('inf')])))
+    with pytest.raises(ValueError):
+        c.get('/')
+
+
+def test_json_buffer_numpy_integers():
+    numpy = pytest.importorskip('numpy')
+    dectate.commit(json_buffer.app)
+    for dtype in ['i1', 'u1', '>i2', 'i4', 'u4', 'i8', 'u8']:
+        info = numpy.iinfo(dtype)
+        values = [info.min, 0, 7, 10, info.max]
+        if info.min < 0:
+            values.insert(1, -1)
+        values = numpy.array(values, dtype=dtype)
+        c = Client(json_buffer.app(values))
+        response = c.get('/')
+        assert response.body == ('[%s]' % ','.join(
+            str(v) for v in values.tolist())).encode('ascii')
+    for values in [numpy.zeros((0,)), numpy.zeros((2, 0), dtype='i4'),
+                   numpy.arange(12).reshape((2, 3, 2))[:, ::2]]:
+        c = Client(json_buffer.app(values))
+        assert c.get('/').json == values.tolist()
+
+
+def test_json_buffer_nan():
+    dectate.commit(json_buffer.app)
+    c = Client(json_buffer.app(array.array('d', [1.0, float('nan')])))
+    with pytest.raises(ValueError):
+        c.get('/')
+
+
+@pytest.mark.skipif(not PY3, reason="memoryview.cast needs Python 3")
+def test_json_buffer_not_numeric():
+    dectate.commit(json_buffer.app)
+    c = Client(json_buffer.app(memoryview(b'abc').cast('c')))
+    with pytest.raises(TypeError):
+        c.get('/')
+
+
+@pytest.mark.skipif(not PY3, reason="buffers need Python 3")
+def test_binary():
+    dectate.commit(json_buffer.app)
+    values = array.array('i', range(6))
+    c = Client(json_buffer.app(values))
+    response = c.get('/binary')
+    assert response.content_type == 'application/octet-stream'
+    assert response.body == values.tobytes()
+    assert response.headers['X-Dtype'] == 'i'
+    assert response.headers['X-Shape'] == '6'
+
+
+def test_buffer_numpy():
+    numpy = pytest.importorskip('numpy')
+    dectate.commit(json_buffer.app)
+    values = numpy.arange(6, dtype='<f8').reshape((2, 3))
+    c = Client(json_buffer.app(values))
+    assert c.get('/').json == [[0, 1, 2], [3, 4, 5]]
+    response = c.get('/binary')
+    assert response.headers['X-Dtype'] == '<f8'
+    assert response.headers['X-Shape'] == '2,3'
+    assert numpy.frombuffer(response.body, dtype='<f8').reshape(
+        (2, 3)).tolist() == values.tolist()
+
+
+def test_binary_content():
+    class app(morepath.App):
+        pass
+
+    @app.path(path='{name}')
+    class Blob(object):
+        def __init__(self, name):
+            self.name = name
+
+    data = b'\x00\xffblob' * 1000
+    contents = {
+        'bytes': data,
+        'bytearray': bytearray(data),
+        'memoryview': memoryview(data),
+        'slice': memoryview(data)[:10],
+        'list': [data[:10], data[10:]],
+    }
+
+    @app.view(model=Blob)
+    def default(self, request):
+        return contents[self.name]
+
+    @app.html(model=Blob, name='html')
+    def html(self, request):
+        return contents[self.name]
+
+    dectate.commit(app)
+
+    a = app()
+    response = a.publish(a.request(BaseRequest.blank('/bytes').environ))
+    # the bytes are the body as they are
+    assert response.app_iter[0] is data
+    response = a.publish(a.request(BaseRequest.blank('/memoryview').environ))
+    assert response.app_iter[0] is data
+
+    c = Client(a)
+    for name in ['bytes', 'bytearray', 'memoryview', 'list']:
+        response = c.get('/%s' % name)
+        assert response.body == data
+        assert response.content_length == len(data)
+        assert response.content_type == 'text/plain'
+        response = c.get('/%s/html' % name)
+        assert response.body == data
+        assert response.content_type == 'text/html'
+    response = c.get('/slice')
+    assert response.body == data[:10]
+    assert response.content_length == 10
+
+
+def test_buffer_chunks_binary():
+    chunks = [bytearray(b'aaa'), memoryview(b'bbb'), u'c']
+    assert list(buffer_chunks(iter(chunks), 'utf-8', 5)) == [
+        b'aaabbb', b'c']
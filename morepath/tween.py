@@ -1,19 +1,159 @@
 from .toposort import toposorted, Info
+from .traject import Path
 from .publish import publish
 
 
 class TweenRegistry(object):
+    """Registry of tween factories.
+
+    Used by the :meth:`morepath.App.tween_factory` directive.
+
+    Tween factories can be restricted to particular routes. These
+    restrictions are resolved against the registered paths by
+    :meth:`TweenRegistry.resolve_routes` during commit, so that
+    :meth:`TweenRegistry.wrap` can create a tween chain for each
+    route ahead of time.
+    """
     def __init__(self):
         self._tween_infos = []
+        self._default_factories = None
+        self._route_factories = None
+
+    def register_tween_factory(self, tween_factory, over, under,
+                               model=None, path=None, exclude=False):
+        """Register a tween factory.
 
-    def register_tween_factory(self, tween_factory, over, under):
-        self._tween_infos.append(Info(tween_factory, over, under))
+        :param tween_factory: the tween factory.
+        :param over: tween factory to wrap.
+        :param under: tween factory to be wrapped by.
+        :param model: only use tween for routes registered for this model
+          class (or subclasses). Optional.
+        :param path: only use tween for routes registered with this path,
+          or list of paths. Optional.
+        :param exclude: if ``True``, use tween for all routes except
+          those matched by ``model`` and ``path``.
+        """
+        if model is None and path is None:
+            route_filter = None
+        else:
+            route_filter = RouteFilter(model, path, exclude)
+        self._tween_infos.append(
+            TweenInfo(tween_factory, over, under, route_filter))
 
     def sorted_tween_factories(self):
         return [info.key for info in toposorted(self._tween_infos)]
 
-    def wrap(self, app):
-        result = publish
-        for tween_factory in reversed(self.sorted_tween_factories()):
-            result = tween_factory(app, result)
-        return result
+    def resolve_routes(self, path_registry):
+        """Determine which tween factories are in use for which route.
+
+        :param path_registry: :class:`morepath.path.PathRegistry` with
+          the routes of the app.
+        """
+        infos = toposorted(self._tween_infos)
+        if all(info.route_filter is None for info in infos):
+            self._default_factories = None
+            self._route_factories = None
+            return
+        self._default_factories = tuple(
+            info.key for info in infos if info.matches(None, None))
+        self._route_factories = {
+            value: tuple(info.key for info in infos
+                         if info.matches(path, model))
+            for value, (path, model) in path_registry.routes.items()}
+
+    def wrap(self, app, wrap_chain=None):
+        """Wrap :func:`morepath.publish.publish` in tweens.
+
+        If tween factories are restricted to routes, this returns a
+        handler that matches the request path against the routes of
+        ``app`` and passes the request to the tween chain constructed
+        for that route.
+
+        :param app: the :class:`morepath.App` instance being published.
+        :param wrap_chain: function that takes ``app`` and a sequence
+          of tween factories and constructs a tween chain. By default
+          this is :func:`wrap_factories`.
+        :return: a handler that takes a request and returns a response.
+        """
+        if wrap_chain is None:
+            wrap_chain = wrap_factories
+        if self._route_factories is None:
+            return wrap_chain(app, self.sorted_tween_factories())
+
+        chains = {}
+
+        def get_chain(factories):
+            result = chains.get(factories)
+            if result is None:
+                result = chains[factories] = wrap_chain(app, factories)
+            return result
+
+        default = get_chain(self._default_factories)
+        routes = {value: get_chain(factories)
+                  for value, factories in self._route_factories.items()}
+        consume = app.config.path_registry.consume
+
+        def route_tweens(request):
+            value, stack, variables = consume(request.unconsumed)
+            return routes.get(value, default)(request)
+        return route_tweens
+
+
+def wrap_factories(app, tween_factories):
+    """Wrap :func:`morepath.publish.publish` in tweens.
+
+    :param app: the :class:`morepath.App` instance being published.
+    :param tween_factories: tween factories, sorted from outer to inner.
+    :return: the outermost tween.
+    """
+    result = publish
+    for tween_factory in reversed(tween_factories):
+        result = tween_factory(app, result)
+    return result
+
+
+class TweenInfo(Info):
+    """Used by :class:`TweenRegistry` internally.
+    """
+    def __init__(self, tween_factory, over, under, route_filter):
+        super(TweenInfo, self).__init__(tween_factory, over, under)
+        self.route_filter = route_filter
+
+    def matches(self, path, model):
+        if self.route_filter is None:
+            return True
+        return self.route_filter(path, model)
+
+
+class RouteFilter(object):
+    """Determine whether a route matches a model or path restriction.
+
+    :param model: model class, or ``None``.
+    :param path: path or list of paths, or ``None``.
+    :param exclude: invert the outcome.
+    """
+    def __init__(self, model, path, exclude):
+        self.model = model
+        if path is None:
+            paths = []
+        elif isinstance(path, (list, tuple)):
+            paths = path
+        else:
+            paths = [path]
+        self.discriminators = set(Path(p).discriminator() for p in paths)
+        self.exclude = exclude
+
+    def __call__(self, path, model):
+        """Check route.
+
+        :param path: path of route, or ``None`` if no route matched.
+        :param model: model class of route, or ``None`` if no route matched.
+        :return: ``True`` if the tween should be used for this route.
+        """
+        if path is None:
+            matched = False
+        else:
+            matched = (
+                Path(path).discriminator() in self.discriminators or
+                (self.model is not None and issubclass(model, self.model)))
+        return matched != self.exclude
@@ -1,33 +1,94 @@
-import json
+import array
+import itertools
+import keyword
+import re
+import sys
+import reg
+from functools import partial
 from webob.exc import HTTPFound, HTTPNotFound, HTTPForbidden
 from webob import Response as BaseResponse
+from webob.datetime_utils import parse_date, serialize_date
+from webob.etag import NoETag
 
-from . import generic
-from .request import Response
+from . import cbor, compat, generic
+from .error import ConfigError
+from .jsonbackend import binary_backends
+from .request import Response, resolve_coroutine
 from .app import RegRegistry
 from .template import TemplateEngineRegistry
 
 
+STREAM_BUFFER_SIZE = 8192
+
+
 class View(object):
-    def __init__(self, func, render, permission, internal):
+    def __init__(self, func, render, permission, internal,
+                 etag=None, last_modified=None):
         self.func = func
         self.render = render
         self.permission = permission
         self.internal = internal
+        self.etag = etag
+        self.last_modified = last_modified
 
     def __call__(self, obj, request):
+        etag, last_modified = self.check(obj, request)
+        if is_not_modified(request, etag, last_modified):
+            response = not_modified_response()
+        else:
+            content = resolve_coroutine(request, self.func(obj, request))
+            response = self.render_content(content, request)
+        return self.finish(response, request, etag, last_modified)
+
+    def check(self, obj, request):
+        """Check whether the view may be used for the request.
+
+        :param obj: model object.
+        :param request: :class:`morepath.Request` instance.
+        :return: a tuple with the ETag and the last modified datetime,
+          see :meth:`View.validators`.
+        :raises webob.exc.HTTPNotFound: if the view is internal.
+        :raises webob.exc.HTTPForbidden: if the view is not permitted.
+        """
         if self.internal:
             raise HTTPNotFound()
         if (self.permission is not None and
-            not generic.permits(request.identity, obj, self.permission,
-                                lookup=request.lookup)):
+                not request.permits(obj, self.permission)):
             raise HTTPForbidden()
-        content = self.func(obj, request)
+        return self.validators(obj, request)
+
+    def render_content(self, content, request):
+        """Turn what the view function returned into a response.
+
+        :param content: the result of the view function.
+        :param request: :class:`morepath.Request` instance.
+        :return: a :class:`morepath.Response` instance.
+        """
         if isinstance(content, BaseResponse):
             # the view took full control over the response
             response = content
         else:
             response = self.render(content, request)
+        if self.etag is True:
+            response.md5_etag()
+            # let webob answer with 304 Not Modified if etag matches
+            response.conditional_response = True
+        return response
+
+    def finish(self, response, request, etag, last_modified):
+        """Set validators on the response and run request callbacks.
+
+        :param response: a :class:`morepath.Response` instance.
+        :param request: :class:`morepath.Request` instance.
+        :param etag: the ETag computed by :meth:`View.check`, or ``None``.
+        :param last_modified: the last modified datetime computed by
+          :meth:`View.check`, or ``None``.
+        :return: the response.
+        """
+        if etag is not None and response.etag is None:
+            response.etag = etag
+        if last_modified is not None and response.last_modified is None:
+            response.last_modified = last_modified
 
         # run request after if it's a 2XX or 3XX response
         if 200 <= response.status_code <= 399:
@@ -35,11 +96,70 @@ class View(object):
 
         return response
 
+    def validators(self, obj, request):
+        """Compute ETag and Last-Modified for a GET or HEAD request.
+
+        :param obj: model object.
+        :param request: :class:`morepath.Request` instance.
+        :return: a tuple with the ETag and the last modified datetime.
+          Each may be ``None``.
+        """
+        if request.method not in ('GET', 'HEAD'):
+            return None, None
+        if self.etag is None or self.etag is True:
+            etag = None
+        else:
+            etag = self.etag(obj, request)
+        if self.last_modified is None:
+            last_modified = None
+        else:
+            last_modified = self.last_modified(obj, request)
+        return etag, last_modified
+
+
+def not_modified_response():
+    """Create a 304 Not Modified response.
+
+    :return: a :class:`morepath.Response` instance without a body.
+    """
+    response = Response(status=304)
+    # a 304 response has no body to describe
+    del response.content_type
+    del response.content_length
+    return response
+
+
+def is_not_modified(request, etag, last_modified):
+    """Check whether the client has an up to date copy of the resource.
+
+    If the request has an ``If-None-Match`` header only the ETag is
+    checked, otherwise ``If-Modified-Since`` is checked, as required
+    by :rfc:`7232`.
+
+    :param request: :class:`morepath.Request` instance.
+    :param etag: the current ETag of the resource, or ``None``.
+    :param last_modified: the current last modified datetime or
+      timestamp of the resource, or ``None``.
+    :return: ``True`` if the client may use its cached copy.
+    """
+    if request.if_none_match is not NoETag:
+        return etag is not None and etag in request.if_none_match
+    if last_modified is not None and request.if_modified_since is not None:
+        # round trip to get a timezone-aware datetime in whole seconds,
+        # which is what the client can send back to us
+        last_modified = parse_date(serialize_date(last_modified))
+        return last_modified <= request.if_modified_since
+    return False
+
 
 def render_view(content, request):
     """Default render function for view if none was supplied.
+
+    Like :func:`render_html`, this streams the response if the content
+    is an iterator of strings, and uses bytes, ``bytearray`` and
+    ``memoryview`` content as the body as it is.
     """
-    return Response(content, content_type='text/plain')
+    return text_response(content, 'text/plain')
 
 
 class ViewRegistry(object):
@@ -61,26 +181,702 @@ class ViewRegistry(object):
                       render=render_view,
                       template=None,
                       permission=None,
-                      internal=False):
+                      internal=False,
+                      etag=None,
+                      last_modified=None):
         if template is not None:
             render = self.template_engine_registry.get_template_render(
                 template, render)
-        v = View(view, render, permission, internal)
+        v = View(view, render, permission, internal, etag, last_modified)
         self.reg_registry.register_function(generic.view, v, **key_dict)
 
 
 def render_json(content, request):
     """Take dict/list/string/number content and return json response.
+
+    The content can also be an iterator of items, for instance a
+    generator that loads rows from a database. The response body is
+    then a JSON array that is streamed to the client, with the items
+    dumped and encoded one by one. This way memory use does not grow
+    with the amount of items.
+
+    If the content, or what ``dump_json`` makes of it, is a numeric
+    array that supports the buffer protocol, such as a NumPy array,
+    an ``array.array`` or a ``memoryview``, it is encoded as a (nested)
+    JSON array of numbers directly from the buffer.
+
+    If the ``negotiate`` setting of the ``json`` section is enabled,
+    the content is encoded as MessagePack or CBOR instead if the
+    ``Accept`` header of the request prefers that, see
+    :func:`morepath.jsonbackend.binary_backends`.
     """
-    return Response(json.dumps(generic.dump_json(request, content,
-                                                 lookup=request.lookup)),
+    app = request.app
+    settings = app.settings.json
+    dumper = JsonDumper(request, request.lookup, settings.dump_nested)
+    streaming = is_iterator(content)
+    if settings.negotiate:
+        response = render_negotiated(content, request, dumper, streaming)
+        if response is not None:
+            return response
+    dumps = app.json_backend.dumps
+    if streaming:
+        response = Response(content_type='application/json')
+        response.app_iter = buffer_chunks(
+            json_array_chunks(content, dumper, dumps), 'utf-8')
+        return response
+    content = dumper(content)
+    buffer = as_numeric_buffer(content)
+    if buffer is not None:
+        return numeric_json_response(content, buffer)
+    return Response(dumps(content),
                     content_type='application/json')
 
 
+def render_negotiated(content, request, dumper, streaming):
+    """Render content as MessagePack or CBOR if the client wants that.
+
+    :param content: the content returned by the view.
+    :param request: :class:`morepath.Request` instance.
+    :param dumper: :class:`JsonDumper` to dump the content with.
+    :param streaming: content is an iterator of items.
+    :return: a :class:`morepath.Response`, or ``None`` if the response
+      should be JSON. The ``Vary`` header of the response is set in
+      both cases.
+    """
+    if vary_on_accept not in request._after:
+        # once per request, however often content is rendered in it
+        request.after(vary_on_accept)
+    backends = binary_backends()
+    offers = ['application/json']
+    if streaming:
+        # only CBOR can stream an array of unknown length
+        offers.append('application/cbor')
+    else:
+        offers.extend(backends)
+    content_type = request.accept.best_match(offers)
+    if content_type is None or content_type == 'application/json':
+        return None
+    dumps = backends[content_type].dumps
+    response = Response(content_type=content_type)
+    if streaming:
+        response.app_iter = buffer_chunks(
+            cbor_array_chunks(content, dumper), 'utf-8')
+        return response
+    content = dumper(content)
+    buffer = as_numeric_buffer(content)
+    if buffer is not None:
+        content = buffer.tolist()
+    response.body = dumps(content)
+    return response
+
+
+def vary_on_accept(response):
+    vary = tuple(response.vary or ())
+    if 'Accept' not in vary:
+        response.vary = vary + ('Accept',)
+
+
+def cbor_array_chunks(items, dumper):
+    """Encode items as a CBOR array of indefinite length, item by item.
+
+    :param items: iterator of items.
+    :param dumper: :class:`JsonDumper` to dump each item.
+    :return: generator of bytes.
+    """
+    yield b'\x9f'
+    for item in items:
+        yield cbor.dumps(dumper(item))
+    yield b'\xff'
+
+
+def render_binary(content, request):
+    """Take buffer content and return application/octet-stream response.
+
+    The content is an object that supports the buffer protocol, such as
+    a NumPy array, an ``array.array``, a ``memoryview`` or bytes. The
+    response body is the raw contents of the buffer, in C order. The
+    ``X-Dtype`` header of the response has the type of the items: the
+    NumPy dtype string (such as ``<f8``) for NumPy arrays, and the
+    :mod:`struct` format (such as ``d``) otherwise. The ``X-Shape``
+    header has the shape of the array as comma-separated sizes.
+    """
+    buffer = memoryview(content)
+    dtype = getattr(content, 'dtype', None)
+    if dtype is not None:
+        dtype = dtype.str
+    else:
+        dtype = buffer.format
+    response = Response(memoryview_bytes(buffer),
+                        content_type='application/octet-stream')
+    response.headers['X-Dtype'] = str(dtype)
+    response.headers['X-Shape'] = ','.join(
+        str(size) for size in buffer.shape)
+    return response
+
+
+NUMERIC_FORMAT = re.compile(r'^[@=<>!]?[bBhHiIlLqQnNfd]$')
+
+
+def as_numeric_buffer(content):
+    """Get buffer for numeric array content.
+
+    :param content: JSON content.
+    :return: a ``memoryview``, or ``None`` if content is not an object
+      supporting the buffer protocol with numbers as items.
+    """
+    if content.__class__ in JSON_SCALARS or isinstance(
+            content, (bytes, bytearray, dict, list, tuple)):
+        return None
+    try:
+        buffer = memoryview(content)
+    except TypeError:
+        return None
+    if not NUMERIC_FORMAT.match(buffer.format):
+        return None
+    return buffer
+
+
+NUMERIC_CHUNK_SIZE = 64 * 1024
+
+NATIVE_ORDER = '<' if sys.byteorder == 'little' else '>'
+
+
+def numeric_json_response(content, buffer):
+    """Create JSON response for numeric buffer.
+
+    The body is streamed, see :func:`numeric_json_chunks`, except for
+    floats without NumPy: these are only known to be valid JSON once
+    they are all encoded.
+
+    :param content: object the buffer was taken from.
+    :param buffer: ``memoryview`` with numbers as items.
+    :return: a :class:`morepath.Response`.
+    :raises ValueError: if there are NaN or infinite floats.
+    """
+    chunks = numeric_json_chunks(content, buffer)
+    response = Response(content_type='application/json')
+    if import_numpy() is None and buffer.format[-1] in 'fd':
+        response.body = b''.join(chunks)
+    else:
+        # the first chunk is only produced after the check for NaN
+        response.app_iter = itertools.chain([next(chunks)], chunks)
+    return response
+
+
+def numeric_json_chunks(content, buffer, chunk_size=NUMERIC_CHUNK_SIZE):
+    """Encode numeric buffer as JSON, a block of numbers at a time.
+
+    If NumPy is installed, integers are formatted with array
+    arithmetic, so no Python object is created per number. Otherwise,
+    and for floats, each block is converted by ``tolist`` and encoded
+    by ``repr`` of the list, both implemented in C. Arrays with more
+    than one dimension become nested JSON arrays.
+
+    NaN and infinite floats are not allowed in JSON. With NumPy the
+    whole buffer is checked for them before the first chunk is
+    yielded; without it they are found in the block that has them.
+
+    :param content: object the buffer was taken from.
+    :param buffer: ``memoryview`` with numbers as items.
+    :param chunk_size: amount of numbers to encode at a time.
+    :return: generator of bytes.
+    :raises ValueError: if there are NaN or infinite floats.
+    """
+    numpy = import_numpy()
+    shape = buffer.shape
+    ndim = len(shape)
+    if numpy is not None:
+        numbers = numpy.asarray(content)
+        is_float = numbers.dtype.kind == 'f'
+        if is_float:
+            flat = numbers.reshape(-1)
+            for start in range(0, flat.size, chunk_size):
+                if not numpy.isfinite(flat[start:start + chunk_size]).all():
+                    raise ValueError(
+                        "NaN and infinity are not allowed in JSON")
+    else:
+        numbers = buffer
+        is_float = buffer.format[-1] in 'fd'
+    if ndim == 0 or 0 in shape:
+        # a scalar or an empty array
+        yield check_finite(
+            repr(numbers.tolist()).replace(' ', '').encode('ascii'))
+        return
+    if numpy is not None:
+        numbers = numbers.reshape(-1)
+    else:
+        numbers = flat_buffer(buffer)
+    # the amount of numbers in a row along the last dimension, and in
+    # each of the enclosing arrays
+    group_sizes = [shape[-1]]
+    for size in reversed(shape[:-1]):
+        group_sizes.append(group_sizes[-1] * size)
+    total = len(numbers)
+    yield b'[' * ndim
+    for start in range(0, total, chunk_size):
+        stop = min(start + chunk_size, total)
+        if numpy is not None and not is_float:
+            chunk = numpy_integer_json(numpy, numbers[start:stop], start,
+                                       group_sizes)
+        else:
+            chunk = repr_json(numbers, start, stop, group_sizes)
+            if is_float:
+                check_finite(chunk)
+        if stop == total:
+            # the last number closes all arrays, and is not followed by
+            # a comma and new arrays
+            chunk = chunk[:-(ndim + 1)]
+        yield chunk
+
+
+def separator(closing):
+    """Separator after a number that is the last item of arrays.
+
+    :param closing: the amount of arrays the number is the last item of.
+    :return: bytes.
+    """
+    return b']' * closing + b',' + b'[' * closing
+
+
+def repr_json(numbers, start, stop, group_sizes):
+    """Encode numbers with ``repr`` of lists.
+
+    :param numbers: one-dimensional ``memoryview`` or NumPy array.
+    :param start: index of the first number to encode.
+    :param stop: index after the last number to encode.
+    :param group_sizes: amount of numbers in a row, and in each of the
+      enclosing arrays.
+    :return: bytes with the numbers, each followed by its separator.
+    """
+    row_size = group_sizes[0]
+    parts = []
+    while start < stop:
+        end = min(stop, start - start % row_size + row_size)
+        parts.append(repr(numbers[start:end].tolist())[1:-1].replace(
+            ' ', '').encode('ascii'))
+        parts.append(separator(sum(
+            1 for size in group_sizes if end % size == 0)))
+        start = end
+    return b''.join(parts)
+
+
+def numpy_integer_json(numpy, numbers, start, group_sizes):
+    """Encode integers with NumPy array arithmetic.
+
+    Each number becomes a record of bytes with its sign, its digits
+    and its separator, padded with NUL bytes that are removed from the
+    result.
+
+    :param numpy: the NumPy module.
+    :param numbers: one-dimensional NumPy array of integers.
+    :param start: index of the first number in the flattened array.
+    :param group_sizes: see :func:`repr_json`.
+    :return: bytes with the numbers, each followed by its separator.
+    """
+    uint8 = numpy.uint8
+    if numbers.dtype.kind == 'i':
+        negative = numbers < 0
+        # ~n is -n - 1, which doesn't overflow for the smallest integer
+        magnitude = numpy.where(negative, ~numbers, numbers).astype(
+            numpy.uint64)
+        magnitude[negative] += 1
+    else:
+        negative = None
+        magnitude = numbers.astype(numpy.uint64)
+    # only as many digits as the largest number in this block has
+    digits = len(str(int(magnitude.max())))
+    width = 1 + digits + 2 * len(group_sizes) + 1
+    records = numpy.zeros((len(numbers), width), dtype=uint8)
+    if negative is not None:
+        records[negative, 0] = ord('-')
+    for column in range(digits, 0, -1):
+        magnitude, digit = numpy.divmod(magnitude, 10)
+        digit = digit.astype(uint8)
+        digit += ord('0')
+        if column < digits:
+            # no leading zeros
+            digit[(magnitude == 0) & (digit == ord('0'))] = 0
+        records[:, column] = digit
+    records[:, digits + 1] = ord(',')
+    ends = numpy.arange(start + 1, start + len(numbers) + 1)
+    closing = numpy.zeros(len(numbers), dtype=uint8)
+    for size in group_sizes:
+        closing += ends % size == 0
+    for amount in range(1, len(group_sizes) + 1):
+        records[closing == amount, digits + 1:digits + 2 + 2 * amount] = \
+            numpy.frombuffer(separator(amount), dtype=uint8)
+    return records.tobytes().replace(b'\0', b'')
+
+
+def flat_buffer(buffer):
+    """Get one-dimensional view of the numbers in buffer.
+
+    :param buffer: ``memoryview`` with numbers as items.
+    :return: a ``memoryview`` with a native format.
+    """
+    format = buffer.format
+    if not buffer.c_contiguous:
+        buffer = memoryview(buffer.tobytes())
+    buffer = buffer.cast('B')
+    order = format[:-1].replace('!', '>')
+    if order in ('', '@', '=') or order == NATIVE_ORDER:
+        return buffer.cast(format[-1])
+    # non-native byte order, as in some ctypes arrays
+    numbers = array.array(format[-1], buffer.tobytes())
+    numbers.byteswap()
+    return memoryview(numbers)
+
+
+def check_finite(data):
+    """Check that JSON numbers are not NaN or infinite.
+
+    :param data: bytes with encoded numbers.
+    :return: data.
+    :raises ValueError: if there are NaN or infinite floats.
+    """
+    if b'n' in data or b'i' in data:
+        raise ValueError("NaN and infinity are not allowed in JSON")
+    return data
+
+
+_numpy = None
+
+
+def import_numpy():
+    """Import NumPy if it is installed.
+
+    :return: the ``numpy`` module, or ``None``.
+    """
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        _numpy = numpy
+    return _numpy or None
+
+
+def json_array_chunks(items, dumper, dumps):
+    """Encode items as a JSON array, item by item.
+
+    :param items: iterator of items.
+    :param dumper: :class:`JsonDumper` to dump each item.
+    :param dumps: function that encodes an item to JSON bytes.
+    :return: generator of bytes.
+    """
+    separator = b'['
+    for item in items:
+        yield separator
+        yield dumps(dumper(item))
+        separator = b','
+    if separator == b'[':
+        yield b'[]'
+    else:
+        yield b']'
+
+
 def render_html(content, request):
     """Take string and return text/html response.
+
+    The content can also be an iterator of strings, for instance a
+    generator from a template engine that renders a template chunk by
+    chunk. The response body is then streamed to the client while it
+    is rendered, so that a large page doesn't have to be in memory as a
+    whole.
+
+    Content that is already encoded, as bytes, a ``bytearray``, a
+    ``memoryview`` or a list or tuple of bytes, becomes the response
+    body without being decoded or joined.
+    """
+    return text_response(content, 'text/html')
+
+
+def text_response(content, content_type):
+    """Create response for text content.
+
+    :param content: a string, an iterator of strings to stream, or
+      encoded content as accepted by :func:`binary_app_iter`.
+    :param content_type: the content type of the response.
+    :return: a :class:`morepath.Response`.
+    """
+    app_iter = binary_app_iter(content)
+    if app_iter is not None:
+        response = Response(content_type=content_type)
+        response.app_iter = app_iter
+        response.content_length = sum(len(chunk) for chunk in app_iter)
+        return response
+    if not is_iterator(content):
+        return Response(content, content_type=content_type)
+    response = Response(content_type=content_type)
+    response.app_iter = buffer_chunks(content, response.charset)
+    return response
+
+
+def is_iterator(content):
+    return hasattr(content, '__next__') or hasattr(content, 'next')
+
+
+def binary_app_iter(content):
+    """Get app_iter for content that is already encoded.
+
+    Bytes, and a list or tuple of bytes, are used as they are. WSGI
+    requires the app_iter to produce bytes, so a ``bytearray`` or
+    ``memoryview`` is only used without a copy if it views the whole
+    of a bytes object; otherwise it is copied once, as bytes.
+
+    :param content: the content returned by the view.
+    :return: a list or tuple of bytes, or ``None`` if the content is
+      not encoded.
+    """
+    if isinstance(content, bytes):
+        return [content]
+    if isinstance(content, (list, tuple)):
+        if content and all(isinstance(chunk, bytes) for chunk in content):
+            return content
+        return None
+    if isinstance(content, bytearray):
+        return [bytes(content)]
+    if isinstance(content, memoryview):
+        return [memoryview_bytes(content)]
+    return None
+
+
+def memoryview_bytes(buffer):
+    """Get the bytes in a memoryview, if possible without copying.
+
+    :param buffer: a ``memoryview``.
+    :return: bytes.
+    """
+    obj = getattr(buffer, 'obj', None)
+    if (isinstance(obj, bytes) and buffer.c_contiguous and
+            buffer.nbytes == len(obj)):
+        return obj
+    return buffer.tobytes()
+
+
+def buffer_chunks(chunks, charset, buffer_size=STREAM_BUFFER_SIZE):
+    """Encode chunks of text, and join small ones.
+
+    Template engines tend to produce many small chunks. Joining them
+    until there are at least ``buffer_size`` bytes avoids writing each
+    of them to the client separately, while the amount of memory used
+    stays bounded.
+
+    :param chunks: iterator of text, bytes, ``bytearray`` or
+      ``memoryview``.
+    :param charset: encoding for text.
+    :param buffer_size: minimum size in bytes of the chunks yielded,
+      except for the last one.
+    :return: generator of bytes.
+    """
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        if isinstance(chunk, compat.text_type):
+            chunk = chunk.encode(charset)
+        elif isinstance(chunk, memoryview):
+            chunk = memoryview_bytes(chunk)
+        elif not isinstance(chunk, bytes):
+            chunk = bytes(chunk)
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= buffer_size:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+JSON_SCALARS = frozenset(
+    (str, compat.text_type, float, bool, type(None)) + compat.integer_types)
+
+
+class JsonDumper(object):
+    """Dump objects with :func:`morepath.generic.dump_json`.
+
+    The dump function for a class is looked up once and then reused
+    for all other objects of the same class, which makes dumping many
+    objects of a few classes cheap.
+
+    If ``nested`` is true, the result of a dump function is searched
+    for objects in dicts, lists and tuples, and these are dumped too.
+    Objects that have no dump function are left as they are.
+
+    :param request: :class:`morepath.Request` instance.
+    :param lookup: lookup to find dump functions with. The request may
+      be in another app by the time streamed items are dumped.
+    :param nested: also dump objects nested in the result.
+    """
+    def __init__(self, request, lookup, nested=False):
+        self.request = request
+        self.lookup = lookup
+        self.nested = nested
+        self._dumps = {}
+
+    def __call__(self, obj):
+        """Dump object.
+
+        :param obj: any Python object.
+        :return: JSON representation (in Python form).
+        """
+        result = self.dump(obj)
+        if self.nested:
+            return self.dump_nested(result)
+        return result
+
+    def dump(self, obj):
+        """Dump object with its dump function.
+
+        :param obj: any Python object.
+        :return: the result of the dump function.
+        """
+        dump = self._dumps.get(obj.__class__)
+        if dump is None:
+            dump = self._dumps[obj.__class__] = self.resolve(obj)
+        return dump(self.request, obj)
+
+    def dump_nested(self, value):
+        """Dump objects nested in value.
+
+        :param value: JSON representation that may contain objects.
+        :return: JSON representation.
+        """
+        cls = value.__class__
+        if cls in JSON_SCALARS:
+            return value
+        if cls is dict:
+            return dict((key, self.dump_nested(item))
+                        for key, item in value.items())
+        if cls is list or cls is tuple:
+            return [self.dump_nested(item) for item in value]
+        result = self.dump(value)
+        if result is value:
+            return value
+        return self.dump_nested(result)
+
+    def resolve(self, obj):
+        try:
+            dump = generic.dump_json.component(self.request, obj,
+                                               lookup=self.lookup)
+        except reg.KeyExtractorError:
+            # no dump function registered at all
+            dump = None
+        if dump is None:
+            return generic.dump_json.wrapped_func
+        if 'lookup' in reg.arginfo(dump).args:
+            return partial(dump, lookup=self.lookup)
+        return dump
+
+
+def compile_json_fields(fields, func, type_name):
+    """Compile a dump function for a list of fields.
+
+    Used by the :meth:`morepath.App.dump_json` directive. The
+    resulting function creates a dict with the attributes of the
+    object named by ``fields`` in one expression, and adds the entries
+    of the dict returned by ``func``, if any.
+
+    If the request asks for a sparse fieldset for ``type_name``, see
+    :attr:`morepath.Request.sparse_fields`, only the requested fields
+    are computed. A function is compiled for each requested
+    combination of fields.
+
+    :param fields: list of attribute names.
+    :param func: function that takes the object and the request and
+      returns a dict with extra entries, or ``None``.
+    :param type_name: the type name used in sparse fieldsets.
+    :return: a function that takes the request and the object.
+    """
+    for field in fields:
+        if not IDENTIFIER.match(field) or keyword.iskeyword(field):
+            raise ConfigError(
+                "dump_json field is not a valid attribute name: %r" % field)
+    get_all = compile_json_getter(fields)
+    # requested fields -> getter
+    getters = {}
+
+    def dump(request, obj):
+        selected = requested_fields(request, type_name)
+        if selected is None:
+            result = get_all(obj)
+        else:
+            get = getters.get(selected)
+            if get is None:
+                get = compile_json_getter(
+                    [field for field in fields if field in selected])
+                # clients choose the combinations, so bound the amount
+                if len(getters) < MAX_FIELDSETS:
+                    getters[selected] = get
+            result = get(obj)
+        extra = func(obj, request)
+        if extra:
+            if selected is not None:
+                extra = select_fields(extra, selected)
+            result.update(extra)
+        return result
+    return dump
+
+
+def compile_json_getter(fields):
+    """Compile a function that gets attributes as a dict.
+
+    :param fields: list of valid attribute names.
+    :return: a function that takes an object and returns a dict.
+    """
+    source = GETTER_TEMPLATE % ', '.join(
+        '%r: obj.%s' % (str(field), field) for field in fields)
+    namespace = {}
+    exec(compile(source, '<dump_json fields>', 'exec'), namespace)
+    return namespace['get']
+
+
+def sparse_json(func, type_name):
+    """Wrap a dump function to support sparse fieldsets.
+
+    If the request asks for a sparse fieldset for ``type_name`` and
+    ``func`` returns a dict, only the requested entries are kept.
+
+    :param func: function that takes the object and the request.
+    :param type_name: the type name used in sparse fieldsets.
+    :return: a function that takes the request and the object.
     """
-    return Response(content, content_type='text/html')
+    def dump(request, obj):
+        result = func(obj, request)
+        selected = requested_fields(request, type_name)
+        if selected is not None and isinstance(result, dict):
+            result = select_fields(result, selected)
+        return result
+    return dump
+
+
+def requested_fields(request, type_name):
+    """Get the sparse fieldset the request asks for.
+
+    :param request: :class:`morepath.Request` instance.
+    :param type_name: the type name of the object to dump.
+    :return: a frozenset of field names, or ``None`` if the request
+      does not restrict the fields of this type.
+    """
+    sparse_fields = request.sparse_fields
+    if not sparse_fields:
+        return None
+    return sparse_fields.get(type_name, sparse_fields.get(None))
+
+
+def select_fields(d, selected):
+    return dict((key, value) for key, value in d.items() if key in selected)
+
+
+IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+# maximum amount of compiled functions per dump_json directive
+MAX_FIELDSETS = 64
+
+GETTER_TEMPLATE = """def get(obj):
+    return {%s}
+"""
 
 
 def redirect(location):